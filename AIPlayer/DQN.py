@@ -1,39 +1,326 @@
-import random
-from collections import namedtuple
+import os
+import struct
+
+import numpy as np
  
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
-import torchvision.transforms as T
 
 
-Transition = namedtuple('Transition',
-                        ('state', 'action', 'next_state', 'reward'))
+# 経験再生メモリの保存ファイル
+REPLAY_MAGIC = b'RPGR'
+REPLAY_VERSION = 1
+# ヘッダ：マジックナンバー, バージョン, 最大数, 状態の要素数, 行動数, 次の書き込み位置, 記録数, 最大の優先度
+REPLAY_HEADER = struct.Struct('<4sIIIIqqd')
+
  
 class ReplayMemory(object):
     """
     経験再生を行うクラス
+
+    経験は事前に確保したcapacity行のテンソルにリングバッファとして書き込み、
+    バッチはtorch.randintで選んだindexで一度に取り出す。
     """
  
-    def __init__(self, capacity):
+    def __init__(self, capacity, obs_size, n_actions, device=None):
+        """コンストラクタ
+
+        Args:
+            capacity (int): 記録する経験の最大数
+            obs_size (int): 状態の要素数
+            n_actions (int): 行動数
+            device (torch.device, optional): テンソルを確保するデバイス. Defaults to None(CPU).
+        """
         self.capacity = capacity
-        self.memory = []
+        self.device = device
         self.position = 0
+        self.size = 0
+        # loadでメモリマップした(配列が参照している)ファイルのパス(マップしていない場合はNone)
+        self.file_path = None
+
+        self.states = torch.zeros((capacity, obs_size), dtype=torch.float32, device=device)
+        self.actions = torch.zeros((capacity, 1), dtype=torch.long, device=device)
+        self.next_states = torch.zeros((capacity, obs_size), dtype=torch.float32, device=device)
+        self.rewards = torch.zeros(capacity, dtype=torch.float32, device=device)
+        self.next_masks = torch.ones((capacity, n_actions), dtype=torch.bool, device=device)
+        self.dones = torch.zeros(capacity, dtype=torch.bool, device=device)
  
-    def push(self, *args):
-        """経験を記録する"""
-        if len(self.memory) < self.capacity:
-            self.memory.append(None)
-        self.memory[self.position] = Transition(*args)
+    def push(self, state, action, next_state, reward, next_mask):
+        """経験を記録する
+
+        Args:
+            state: 状態
+            action: 行動のindex
+            next_state: 次の状態(エピソードの終端はNone)
+            reward: 報酬
+            next_mask: 次の状態で選択可能な行動(エピソードの終端はNone)
+        """
+        i = self.position
+        self.states[i] = torch.as_tensor(state).reshape(-1)
+        self.actions[i] = torch.as_tensor(action).reshape(-1)
+        self.rewards[i] = torch.as_tensor(reward).reshape(-1)
+        if next_state is None:
+            # 終端の次の状態は使わない(行動はすべて選択可能にして、最大値が-infにならないようにする)
+            self.next_states[i] = 0
+            self.next_masks[i] = True
+            self.dones[i] = True
+        else:
+            self.next_states[i] = torch.as_tensor(next_state).reshape(-1)
+            self.next_masks[i] = True if next_mask is None else torch.as_tensor(next_mask).reshape(-1)
+            self.dones[i] = False
         self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+ 
+    def push_batch(self, states, actions, next_states, rewards, next_masks, dones):
+        """複数の環境の経験をまとめて記録する
+
+        Args:
+            states (torch.tensor): 状態 (環境数, 状態の要素数)
+            actions (torch.tensor): 行動のindex (環境数,)
+            next_states (torch.tensor): 次の状態 (環境数, 状態の要素数)
+            rewards (torch.tensor): 報酬 (環境数,)
+            next_masks (torch.tensor): 次の状態で選択可能な行動 (環境数, 行動数)
+            dones (torch.tensor): エピソードの終端 (環境数,)
+
+        Returns:
+            torch.tensor: 記録した位置のindex
+        """
+        n = len(states)
+        indices = torch.arange(self.position, self.position + n, device=self.device) % self.capacity
+        self.states[indices] = states
+        self.actions[indices] = actions.reshape(-1, 1)
+        self.next_states[indices] = next_states
+        self.rewards[indices] = rewards
+        # 終端の次の状態で選択可能な行動は使わないので、最大値が-infにならないようにすべて選択可能にする
+        self.next_masks[indices] = next_masks | dones.reshape(-1, 1)
+        self.dones[indices] = dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return indices
  
     def sample(self, batch_size):
-        """バッチサイズ分の経験をランダムに取得する"""
-        return random.sample(self.memory, batch_size)
+        """バッチサイズ分の経験をランダムに(重複を許して)取得する
+
+        Returns:
+            Tuple[torch.tensor, ...]: 状態, 行動, 次の状態, 報酬, 次の状態で選択可能な行動, 終端(各要素はバッチサイズ行)
+        """
+        indices = torch.randint(self.size, (batch_size,), device=self.device)
+        return self.take(indices)
+
+    def take(self, indices):
+        """指定したindexの経験を取り出す
+
+        Args:
+            indices (torch.tensor): 経験のindex
+
+        Returns:
+            Tuple[torch.tensor, ...]: 状態, 行動, 次の状態, 報酬, 次の状態で選択可能な行動, 終端
+        """
+        return (self.states[indices], self.actions[indices], self.next_states[indices],
+                self.rewards[indices], self.next_masks[indices], self.dones[indices])
+ 
+    def state_arrays(self):
+        """保存する配列(所有するオブジェクトと属性名)の一覧"""
+        return [(self, name) for name in ('states', 'actions', 'next_states', 'rewards', 'next_masks', 'dones')]
+ 
+    def save(self, file_path, max_priority=1.0):
+        """経験を固定長のバイナリファイルに保存する(pickleは使わない)
+
+        書き込み途中で中断しても元のファイルが壊れないように、一時ファイルに書いてから置き換える。
+
+        Args:
+            file_path (str): 保存先のファイルパス
+            max_priority (float, optional): 最大の優先度(優先度付き経験再生のみ). Defaults to 1.0.
+        """
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(REPLAY_HEADER.pack(
+                REPLAY_MAGIC, REPLAY_VERSION, self.capacity, self.states.shape[1], self.next_masks.shape[1],
+                self.position, self.size, max_priority))
+            for owner, name in self.state_arrays():
+                value = getattr(owner, name)
+                array = value.cpu().numpy() if isinstance(value, torch.Tensor) else value
+                f.write(np.ascontiguousarray(array).tobytes())
+        os.replace(temp_path, file_path)
+ 
+    def load(self, file_path):
+        """saveで保存した経験をメモリマップで読み込む
+
+        CPUの場合はファイルを書き込み時コピーでマップした配列をそのままテンソルとして使うので、
+        読み込み時にファイル全体をコピーしない。
+
+        Args:
+            file_path (str): 保存したファイルパス
+
+        Returns:
+            float: 最大の優先度
+        """
+        data = np.memmap(file_path, dtype=np.uint8, mode='c')
+        magic, version, capacity, obs_size, n_actions, position, size, max_priority = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f'{file_path} は経験再生メモリのファイルではありません')
+        if (capacity, obs_size, n_actions) != (self.capacity, self.states.shape[1], self.next_masks.shape[1]):
+            raise ValueError(f'{file_path} の経験の形式が一致しません')
+
+        offset = REPLAY_HEADER.size
+        mapped = False
+        for owner, name in self.state_arrays():
+            value = getattr(owner, name)
+            is_tensor = isinstance(value, torch.Tensor)
+            dtype = torch.empty(0, dtype=value.dtype).numpy().dtype if is_tensor else value.dtype
+            nbytes = int(np.prod(value.shape)) * dtype.itemsize
+            array = data[offset:offset + nbytes].view(dtype).reshape(tuple(value.shape))
+            offset += nbytes
+            if not is_tensor:
+                setattr(owner, name, array)
+                mapped = True
+            elif value.device.type == 'cpu':
+                setattr(owner, name, torch.from_numpy(array))
+                mapped = True
+            else:
+                value.copy_(torch.from_numpy(array))
+        self.file_path = file_path if mapped else None
+        self.position = position
+        self.size = size
+        return max_priority
  
     def __len__(self):
-        return len(self.memory)
+        return self.size
+
+class SumTree(object):
+    """
+    優先度の和を二分木で管理するクラス
+
+    葉(n_leaves..2*n_leaves-1)に各経験の優先度、内部ノードに子の和を配列で持ち、
+    更新と累積和からの検索をO(log n)で行う。検索と更新はバッチ単位でまとめて行う。
+    """
+ 
+    def __init__(self, capacity):
+        self.n_leaves = 1 << max(capacity - 1, 0).bit_length()
+        self.tree = np.zeros(2 * self.n_leaves, dtype=np.float64)
+ 
+    def total(self):
+        """全優先度の和"""
+        return self.tree[1]
+ 
+    def update(self, indices, priorities):
+        """優先度を更新する
+
+        Args:
+            indices (ndarray): 経験のindex
+            priorities (ndarray): 新しい優先度
+        """
+        nodes = np.asarray(indices, dtype=np.int64) + self.n_leaves
+        self.tree[nodes] = priorities
+        # 親ノードを子の和で計算し直しながら根まで上る(同じ親は1度だけ計算する)
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+ 
+    def find(self, values):
+        """累積和がvaluesに達する経験のindexを取得する
+
+        Args:
+            values (ndarray): 0以上total()未満の累積和
+
+        Returns:
+            ndarray: 経験のindex
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        # 葉はすべて同じ深さなので、全要素を1段ずつ同時に降りる
+        while nodes[0] < self.n_leaves:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.n_leaves
+ 
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    優先度付き経験再生を行うクラス
+
+    TD誤差の大きい経験ほど高い確率で取り出し、偏りは重要度サンプリングの重みで補正する。
+    """
+ 
+    def __init__(self, capacity, obs_size, n_actions, device=None, alpha=0.6, epsilon=1e-3):
+        """コンストラクタ
+
+        Args:
+            capacity (int): 記録する経験の最大数
+            obs_size (int): 状態の要素数
+            n_actions (int): 行動数
+            device (torch.device, optional): テンソルを確保するデバイス. Defaults to None(CPU).
+            alpha (float, optional): 優先度の指数(0で一様). Defaults to 0.6.
+            epsilon (float, optional): TD誤差に加える値(優先度が0にならないようにする). Defaults to 1e-3.
+        """
+        super(PrioritizedReplayMemory, self).__init__(capacity, obs_size, n_actions, device)
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+ 
+    def push(self, *args):
+        """経験を記録する(新しい経験は少なくとも1度取り出されるように最大の優先度にする)"""
+        self.tree.update([self.position], self.max_priority ** self.alpha)
+        super(PrioritizedReplayMemory, self).push(*args)
+ 
+    def push_batch(self, *args):
+        """複数の環境の経験をまとめて記録する(最大の優先度にする)"""
+        indices = super(PrioritizedReplayMemory, self).push_batch(*args)
+        self.tree.update(indices.cpu().numpy(), self.max_priority ** self.alpha)
+        return indices
+ 
+    def sample(self, batch_size, beta=0.4):
+        """優先度に比例した確率でバッチサイズ分の経験を取得する
+
+        Args:
+            batch_size (int): バッチサイズ
+            beta (float, optional): 重要度サンプリングの補正の強さ(1で完全に補正). Defaults to 0.4.
+
+        Returns:
+            Tuple[tuple, ndarray, torch.tensor]: 経験(ReplayMemory.sampleと同じ形式)、経験のindex、重要度サンプリングの重み
+        """
+        # 累積和を batch_size 個の区間に分け、各区間から1つずつ取り出す
+        total = self.tree.total()
+        values = (np.arange(batch_size) + torch.rand(batch_size).numpy()) * (total / batch_size)
+        indices = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))), self.size - 1)
+
+        # 優先度が0の葉を取り出しても重みが無限大にならないように、優先度の下限をepsilonにする
+        priorities = np.maximum(self.tree.tree[indices + self.tree.n_leaves], self.epsilon ** self.alpha)
+        weights = (self.size * priorities / total) ** -beta
+        weights = np.minimum(weights / weights.max(), 1.0)
+        weights = torch.as_tensor(weights, dtype=torch.float32, device=self.device)
+
+        batch = self.take(torch.as_tensor(indices, device=self.device))
+        return batch, indices, weights
+ 
+    def state_arrays(self):
+        """保存する配列(所有するオブジェクトと属性名)の一覧"""
+        return super(PrioritizedReplayMemory, self).state_arrays() + [(self.tree, 'tree')]
+ 
+    def save(self, file_path):
+        """経験と優先度を固定長のバイナリファイルに保存する"""
+        super(PrioritizedReplayMemory, self).save(file_path, self.max_priority)
+ 
+    def load(self, file_path):
+        """saveで保存した経験と優先度をメモリマップで読み込む"""
+        self.max_priority = super(PrioritizedReplayMemory, self).load(file_path)
+        return self.max_priority
+ 
+    def update_priorities(self, indices, td_errors):
+        """TD誤差から優先度を更新する
+
+        Args:
+            indices (ndarray): 経験のindex
+            td_errors (ndarray): 経験ごとのTD誤差
+        """
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities ** self.alpha)
 
 class DQN(nn.Module): 
     def __init__(self, obs_size, n_actions, n_hidden_channels=100):
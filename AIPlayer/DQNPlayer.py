@@ -1,21 +1,127 @@
+import os
+import queue
 import random
+import time
 import numpy as np
-from collections import namedtuple
 from typing import Tuple
  
 import torch
+import torch.multiprocessing as mp
 import torch.optim as optim
 import torch.nn.functional as F
 
-from .DQN import Transition, ReplayMemory, DQN
+from .DQN import ReplayMemory, PrioritizedReplayMemory, DQN
+from .Telemetry import Telemetry
+from .NumpyPolicy import export_npz
+from battle.event import Outcome
+
+# チェックポイントのファイル名(経験再生メモリは別のバイナリファイルに保存する)
+CHECKPOINT_FILE = 'checkpoint.pt'
+
+def epsilon_greedy(net:DQN, states:torch.tensor, masks:torch.tensor, eps_threshold:float)->torch.tensor:
+    """複数の状態の行動を1回の順伝播でまとめて選択する
+
+    Args:
+        net (DQN): 行動選択に使うモデル
+        states (torch.tensor): 状態 (状態数, 状態の要素数)
+        masks (torch.tensor): 選択可能な行動 (状態数, 行動数)
+        eps_threshold (float): ランダムに行動を選ぶ確率
+
+    Returns:
+        torch.tensor: 選択した行動のindex (状態数,)
+    """
+    with torch.no_grad():
+        actions = net(states).masked_fill(~masks, float('-inf')).max(1)[1]
+    # 選択可能な行動の中から一様に選んだ行動で置き換える
+    explore = torch.rand(len(actions), device=actions.device) < eps_threshold
+    if explore.any():
+        actions[explore] = torch.multinomial(masks[explore].float(), 1).squeeze(1)
+    return actions
+
+def actor(data_folder_path:str, scenario_code:str, n_envs:int, seed:int, n_hidden_channels:int,
+          shared_net:DQN, weights_lock, weights_version, n_episodes, stop_event, transitions,
+          eps_start:float, eps_end:float, eps_decay:int, send_size:int):
+    """アクタープロセスの処理
+
+    自分の環境をまとめて進めて経験を集め、send_size件ごとに学習プロセスへキューで送る。
+    行動選択に使うモデルは、学習プロセスが重みを更新するたびに共有メモリのモデルから読み込み直す。
+    εは全アクターで終了したエピソード数で線形に減らす。
+
+    Args:
+        data_folder_path (str): Unitデータの格納先フォルダパス
+        scenario_code (str): ゲームのシナリオ
+        n_envs (int): アクターが持つ環境の数
+        seed (int): 乱数シード
+        n_hidden_channels (int): 中間層のユニット数
+        shared_net (DQN): 学習プロセスが重みを書き込む共有メモリ上のモデル
+        weights_lock: 共有メモリのモデルの読み書き用ロック
+        weights_version: 重みの更新回数(共有値)
+        n_episodes: 全アクターで終了したエピソード数(共有値)
+        stop_event: 終了を通知するイベント
+        transitions: 経験を送るキュー
+        eps_start (float): εの開始値
+        eps_end (float): εの最終値
+        eps_decay (int): εが最終値に到達するまでのエピソード数
+        send_size (int): まとめて送る経験の数の目安
+    """
+    # 環境はアクターごとに1コアで進める
+    from RPGVectorEnv import VectorSimulation
+
+    torch.set_num_threads(1)
+    torch.manual_seed(seed)
+    net = DQN(shared_net.l0.in_features, shared_net.l2.out_features, n_hidden_channels)
+    net.eval()
+    version = -1
+
+    with VectorSimulation(n_envs, data_folder_path, scenario_code, seed=seed) as env:
+        states = torch.from_numpy(env.reset().copy())
+        masks = torch.from_numpy(env.action_masks.copy())
+        total_rewards = np.zeros(n_envs)
+        buffer = []
+        finished_rewards = []
+        while not stop_event.is_set():
+            # 重みが更新されていれば読み込み直す
+            if weights_version.value != version:
+                with weights_lock:
+                    net.load_state_dict(shared_net.state_dict())
+                    version = weights_version.value
+
+            eps_threshold = max(eps_start - n_episodes.value / eps_decay, eps_end)
+            actions = epsilon_greedy(net, states, masks, eps_threshold)
+            observations, rewards, dones, final_observations = env.step(actions.numpy())
+
+            # 終了した環境は終了時の状態を次の状態とする(終端なので値は使わない)
+            next_states = observations.copy()
+            next_states[dones] = final_observations[dones]
+            next_masks = env.action_masks.copy()
+            buffer.append((states.numpy(), actions.numpy(), next_states, rewards.copy(), next_masks, dones.copy()))
+
+            total_rewards += rewards
+            for i in np.flatnonzero(dones):
+                finished_rewards.append(float(total_rewards[i]))
+                total_rewards[i] = 0
+            if dones.any():
+                with n_episodes.get_lock():
+                    n_episodes.value += int(dones.sum())
+
+            if len(buffer) * n_envs >= send_size:
+                transitions.put(tuple(np.concatenate(arrays) for arrays in zip(*buffer)) + (finished_rewards,))
+                buffer = []
+                finished_rewards = []
+
+            states = torch.from_numpy(observations.copy())
+            masks = torch.from_numpy(next_masks)
 
 class DQNPlayer():
 
-    def __init__(self, env, n_hidden_channels=100):
+    def __init__(self, env, n_hidden_channels=100, prioritized:bool=False, alpha:float=0.6):
         """コンストラクタ
 
         Args:
             env : 学習対象の環境
+            n_hidden_channels (int, optional): 中間層のユニット数. Defaults to 100.
+            prioritized (bool, optional): 優先度付き経験再生を使う. Defaults to False.
+            alpha (float, optional): 優先度付き経験再生の優先度の指数. Defaults to 0.6.
         """
         # GPUの利用設定
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -36,10 +142,20 @@ class DQNPlayer():
         # 最適化手法設定
         self.optimizer = optim.Adam(self.policy_net.parameters())
         # 経験再生メモリ
-        self.memory = ReplayMemory(10000)
+        self.prioritized = prioritized
+        if prioritized:
+            self.memory = PrioritizedReplayMemory(10000, self.obs_size, self.n_actions, self.device, alpha)
+        else:
+            self.memory = ReplayMemory(10000, self.obs_size, self.n_actions, self.device)
+        # 重要度サンプリングの補正の強さ(優先度付き経験再生のみ)
+        self.beta = 0.4
 
         # 各エピソードで得られた報酬
         self.episode_rewards = []
+        # 終了したエピソード数(チェックポイントから再開する位置)
+        self.i_episode = 0
+        # 処理時間の記録(訓練中のみ、記録しない場合はNone)
+        self.telemetry = None
 
     def set_learning_parameters(self,
         batch_size:int=128,
@@ -48,7 +164,9 @@ class DQNPlayer():
         eps_end:float=0.05,
         eps_decay:int=90,
         target_update:int=10,
-        num_episodes:int=100
+        num_episodes:int=100,
+        beta_start:float=0.4,
+        eps_decay_steps:int=None
         ):
         """学習パラメータ設定
 
@@ -60,6 +178,9 @@ class DQNPlayer():
             eps_decay (int, optional): εが最終値に到達するまでのエピソード数. Defaults to 90.
             target_update (int, optional): DQNのアップデート頻度. Defaults to 10.
             num_episodes (int, optional): 訓練エピソード数. Defaults to 100.
+            beta_start (float, optional): 重要度サンプリングの補正の強さの開始値(訓練終了時に1になる). Defaults to 0.4.
+            eps_decay_steps (int, optional): εが最終値に到達するまでの全環境の合計ステップ数(training_batchedのみ).
+                Defaults to None(eps_decay × 1エピソードの平均ステップ数).
         """
         self.BATCH_SIZE = batch_size
         self.GAMMA = gamma
@@ -68,61 +189,113 @@ class DQNPlayer():
         self.EPS_DECAY = eps_decay
         self.TARGET_UPDATE = target_update
         self.num_episodes = num_episodes
+        self.BETA_START = beta_start
+        self.EPS_DECAY_STEPS = eps_decay_steps
 
-    def select_action(self, state:torch.tensor, i_episode:int):
+    def select_action(self, state:torch.tensor, i_episode:int, mask:torch.tensor=None):
         """行動選択
 
         Args:
             state(torch.tensor): 現在の状態
             i_episode(int): 現在のエピソード番号
+            mask(torch.tensor, optional): 選択可能な行動 (1, 行動数). Defaults to None(すべて選択可能).
         
         Returns:
             tensor: 選択した行動のindex
         """
         sample = random.random()
-
-        # epsを線形に減らす
-        eps_threshold = self.EPS_START - (i_episode / self.EPS_DECAY)
-        if eps_threshold < self.EPS_END:
-            eps_threshold = self.EPS_END
+        eps_threshold = self.epsilon(i_episode)
 
         if sample > eps_threshold:
             with torch.no_grad():
-                return self.policy_net(state).max(1)[1].view(1, 1)
-        else:
+                return self.masked_q_values(self.policy_net(state), mask).max(1)[1].view(1, 1)
+        elif mask is None:
             return torch.tensor([[random.randrange(self.n_actions)]], device=self.device, dtype=torch.long)
+        else:
+            # 選択可能な行動の中からランダムに選ぶ
+            actions = mask[0].nonzero().flatten().tolist()
+            return torch.tensor([[random.choice(actions)]], device=self.device, dtype=torch.long)
+
+    def epsilon(self, i_episode:int)->float:
+        """エピソード番号に対するε(線形に減らす)
+
+        Args:
+            i_episode(int): 現在のエピソード番号
+
+        Returns:
+            float: ランダムに行動を選ぶ確率
+        """
+        return max(self.EPS_START - (i_episode / self.EPS_DECAY), self.EPS_END)
+
+    def select_actions(self, states:torch.tensor, masks:torch.tensor, eps_threshold:float)->torch.tensor:
+        """複数の環境の行動を1回の順伝播でまとめて選択する
+
+        Args:
+            states(torch.tensor): 現在の状態 (環境数, 状態の要素数)
+            masks(torch.tensor): 選択可能な行動 (環境数, 行動数)
+            eps_threshold(float): ランダムに行動を選ぶ確率
+
+        Returns:
+            tensor: 選択した行動のindex (環境数,)
+        """
+        return epsilon_greedy(self.policy_net, states, masks, eps_threshold)
+
+    def masked_q_values(self, q_values:torch.tensor, mask:torch.tensor=None)->torch.tensor:
+        """選択できない行動のQ値を-infにする
+
+        Args:
+            q_values(torch.tensor): Q値 (バッチサイズ, 行動数)
+            mask(torch.tensor, optional): 選択可能な行動 (バッチサイズ, 行動数). Defaults to None(すべて選択可能).
+
+        Returns:
+            tensor: Q値
+        """
+        if mask is None:
+            return q_values
+        return q_values.masked_fill(~mask, float('-inf'))
 
     def optimize_model(self):
         """モデルを更新する"""
         if len(self.memory) < self.BATCH_SIZE:
             return
+        telemetry = self.telemetry
+        if telemetry is not None:
+            start_time = time.perf_counter()
 
-        # 経験を取得する
-        transitions = self.memory.sample(self.BATCH_SIZE)
-        batch = Transition(*zip(*transitions))
-
-        # 最後の状態（最後の行動実行後の状態）は不要なのでマスクする
-        non_final_mask = torch.tensor(tuple(map(lambda s: s is not None, batch.next_state)), device=self.device, dtype=torch.bool)
-        non_final_next_states = torch.cat([s for s in batch.next_state if s is not None])
-
-        # 取得した経験リストを一つのtorch.tensorに変換（リストを結合）する
-        state_batch = torch.cat(batch.state)
-        action_batch = torch.cat(batch.action)
-        reward_batch = torch.cat(batch.reward)
+        # 経験を取得する(各要素はバッチサイズ行のテンソル)
+        if self.prioritized:
+            batch, indices, weights = self.memory.sample(self.BATCH_SIZE, self.beta)
+        else:
+            batch = self.memory.sample(self.BATCH_SIZE)
+        states, actions, next_states, rewards, next_masks, dones = batch
+        if telemetry is not None:
+            sample_time = time.perf_counter()
+            telemetry.add_time('memory_sample', sample_time - start_time)
 
         # 各状態と行動の組み合わせに対するQ値を取得する
-        state_action_values = self.policy_net(state_batch).gather(1, action_batch)
+        state_action_values = self.policy_net(states).gather(1, actions)
     
         # 過去の経験の各状態におけるQ値の最大値（ベストな行動を行った場合のQ値）を取得する。
         # なお、最後の状態からは行動を行わない（=Q値が常に0になる）ため、経験再生の対象外とする。
-        next_state_values = torch.zeros(self.BATCH_SIZE, device=self.device)
-        next_state_values[non_final_mask] = self.target_net(non_final_next_states).max(1)[0].detach()
+        with torch.no_grad():
+            # 次の状態で選択できない行動は最大値の対象にしない
+            next_q_values = self.masked_q_values(self.target_net(next_states), next_masks)
+            next_state_values = next_q_values.max(1)[0].masked_fill(dones, 0.0)
 
         # Q値の期待値を取得する
-        expected_state_action_values = (next_state_values * self.GAMMA) + reward_batch
+        expected_state_action_values = (next_state_values * self.GAMMA) + rewards
 
         # Q値の損失計算を行う
-        loss = F.smooth_l1_loss(state_action_values, expected_state_action_values.unsqueeze(1))
+        if self.prioritized:
+            # 優先度による偏りを重要度サンプリングの重みで補正し、TD誤差で優先度を更新する
+            losses = F.smooth_l1_loss(state_action_values, expected_state_action_values.unsqueeze(1), reduction='none')
+            loss = (losses.squeeze(1) * weights).mean()
+            td_errors = (expected_state_action_values - state_action_values.squeeze(1)).detach()
+        else:
+            loss = F.smooth_l1_loss(state_action_values, expected_state_action_values.unsqueeze(1))
+        if telemetry is not None:
+            forward_time = time.perf_counter()
+            telemetry.add_time('forward', forward_time - sample_time)
 
         # モデルを更新する
         self.optimizer.zero_grad()
@@ -130,6 +303,15 @@ class DQNPlayer():
         for param in self.policy_net.parameters():
             param.grad.data.clamp_(-1, 1)
         self.optimizer.step()
+        if telemetry is not None:
+            backward_time = time.perf_counter()
+            telemetry.add_time('backward', backward_time - forward_time)
+            telemetry.add_update(loss.item())
+
+        if self.prioritized:
+            self.memory.update_priorities(indices, td_errors.cpu().numpy())
+            if telemetry is not None:
+                telemetry.add_time('memory_sample', time.perf_counter() - backward_time)
 
     def conv_state(self, state):
         """numpy.ndarrayをtorch.tensorに変換してGPUに転送する
@@ -144,51 +326,400 @@ class DQNPlayer():
         state = torch.from_numpy(state).to(self.device)
         return state
 
-    def training(self):
-        """訓練を行う"""
-        for i_episode in range(self.num_episodes):
-            # 環境をリセットする
-            state = self.env.reset()
-            total_reward = 0
-            done = False
+    def training(self, checkpoint_folder_path:str=None, checkpoint_interval:int=100, n_episodes:int=None, telemetry_path:str=None):
+        """訓練を行う
 
-            state = self.conv_state(state)
+        checkpoint_folder_pathを指定した場合は、checkpoint_intervalエピソードごとにチェックポイントを保存し、
+        既にチェックポイントがあればその続きから訓練する(同じシードなら中断しなかった場合と同じ結果になる)。
 
-            while done == False:
-                # 行動選択する
-                action = self.select_action(state, i_episode)
+        Args:
+            checkpoint_folder_path (str, optional): チェックポイントの保存先フォルダパス. Defaults to None(保存しない).
+            checkpoint_interval (int, optional): チェックポイントを保存するエピソード数の間隔. Defaults to 100.
+            n_episodes (int, optional): 今回訓練するエピソード数(続きは再度trainingを呼ぶと訓練する). Defaults to None(num_episodesまで).
+            telemetry_path (str, optional): 処理時間と学習状況を書き出すJSONLファイルのパス. Defaults to None(記録しない).
+        """
+        if checkpoint_folder_path is not None and os.path.exists(os.path.join(checkpoint_folder_path, CHECKPOINT_FILE)):
+            self.load_checkpoint(checkpoint_folder_path)
+            print(f'resume from {self.i_episode} episode')
+
+        # 訓練中はバトルメッセージを使わないので生成しない
+        headless = self.env.headless
+        self.env.headless = True
+
+        # 状態と選択可能な行動は事前に確保したテンソルに書き込み、ステップごとにテンソルを作らない
+        # (環境はobservation_cpuに次の状態を書き込み、経験を保存した後でstateにコピーする)
+        observation = self.env.observation
+        observation_cpu = torch.zeros((1, self.obs_size), dtype=torch.float32)
+        self.env.set_observation_buffer(observation_cpu.numpy()[0])
+        mask_cpu = torch.ones((1, self.n_actions), dtype=torch.bool)
+        mask_np = mask_cpu.numpy()[0]
+        state = torch.zeros((1, self.obs_size), dtype=torch.float32, device=self.device)
+        mask = mask_cpu if self.device.type == 'cpu' else torch.ones_like(mask_cpu, device=self.device)
+
+        telemetry = self.telemetry = Telemetry(telemetry_path) if telemetry_path is not None else None
+        try:
+            stop_episode = self.num_episodes if n_episodes is None else min(self.i_episode + n_episodes, self.num_episodes)
+            for i_episode in range(self.i_episode, stop_episode):
+                # 重要度サンプリングの補正を訓練の終わりに向けて強くする
+                self.beta = self.BETA_START + (1.0 - self.BETA_START) * i_episode / max(self.num_episodes - 1, 1)
+
+                # 環境をリセットする
+                self.env.reset()
+                total_reward = 0
+                done = False
+
+                state.copy_(observation_cpu)
+                # MP不足・封印中の呪文は選択しない
+                np.copyto(mask_np, self.env.action_mask)
+                if mask is not mask_cpu:
+                    mask.copy_(mask_cpu)
+
+                while done == False:
+                    if telemetry is not None:
+                        start_time = time.perf_counter()
+
+                    # 行動選択する
+                    action = self.select_action(state, i_episode, mask)
+                    if telemetry is not None:
+                        select_time = time.perf_counter()
+                        telemetry.add_time('select_action', select_time - start_time)
+
+                    # 行動の結果を取得する(次の状態はobservation_cpuに書き込まれる)
+                    _, reward, done, _ = self.env.step(action.item())
+
+                    total_reward += reward
+
+                    if not done:
+                        np.copyto(mask_np, self.env.action_mask)
+                        if mask is not mask_cpu:
+                            mask.copy_(mask_cpu)
+                    if telemetry is not None:
+                        step_time = time.perf_counter()
+                        telemetry.add_time('env_step', step_time - select_time)
+
+                    # 経験を保存する(終端の次の状態は使わない)
+                    if done:
+                        self.memory.push(state, action, None, reward, None)
+                    else:
+                        self.memory.push(state, action, observation_cpu, reward, mask)
+                        state.copy_(observation_cpu)
+                    if telemetry is not None:
+                        telemetry.add_time('memory_push', time.perf_counter() - step_time)
+
+                    # 経験再生を用いてDQNモデルを更新する
+                    self.optimize_model()
+                    if telemetry is not None:
+                        telemetry.add_step()
+
+                # plot データを追加
+                self.episode_rewards.append(total_reward)
+
+                # 探索中のDQNを経験再生用DQNにコピーする
+                if i_episode % self.TARGET_UPDATE == 0:
+                    if telemetry is not None:
+                        start_time = time.perf_counter()
+                    self.target_net.load_state_dict(self.policy_net.state_dict())
+                    if telemetry is not None:
+                        telemetry.add_time('target_sync', time.perf_counter() - start_time)
+                if telemetry is not None:
+                    telemetry.add_episode(total_reward, self.epsilon(i_episode))
+
+                # 学習の進捗表示    
+                if (i_episode + 1) % (self.num_episodes / 10) == 0:
+                    print(f'end {i_episode + 1} episode')
+
+                self.i_episode = i_episode + 1
+                if checkpoint_folder_path is not None and self.i_episode % checkpoint_interval == 0:
+                    self.save_checkpoint(checkpoint_folder_path)
+        finally:
+            # 例外で中断した場合も環境の設定を戻し、記録ファイルを閉じる
+            if telemetry is not None:
+                telemetry.close()
+                self.telemetry = None
+            self.env.set_observation_buffer(observation)
+            self.env.headless = headless
+        print('Complete')
 
-                # 行動の結果を取得する
-                next_state, reward, done, _ = self.env.step(action.item())
+    def training_batched(self, vector_env, updates_per_step:int=1):
+        """複数の環境をまとめて進めて訓練を行う
 
-                total_reward += reward
-                reward = torch.tensor([reward], device=self.device)
+        1回の順伝播で全環境の行動を選び、環境数分の経験を記録してからupdates_per_step回モデルを更新する。
+        εはステップ数(全環境の合計)で減らし、終了した環境は自動でresetされる。
+        合計num_episodesエピソードが終了するまで訓練する。
+        処理時間と学習状況の記録(Telemetry)はtrainingのみ対応しており、ここでは記録しない。
 
-                if done:
-                    next_state = None
-                else:
-                    next_state = self.conv_state(next_state)
+        Args:
+            vector_env (RPGVectorEnv.VectorSimulation): 学習対象の環境
+            updates_per_step (int, optional): 全環境を1ステップ進めるごとのモデルの更新回数. Defaults to 1.
+        """
+        n_envs = vector_env.n_envs
+        states = torch.from_numpy(vector_env.reset()).to(self.device, copy=True)
+        masks = torch.from_numpy(vector_env.action_masks).to(self.device, copy=True)
+        total_rewards = np.zeros(n_envs)
+
+        i_episode = 0
+        total_steps = 0
+        # 最後にエピソードが終了した時点の合計ステップ数
+        total_steps_done = 0
+        next_report = self.num_episodes / 10
+        # 最初のモデルを経験再生用DQNにコピーする
+        self.target_net.load_state_dict(self.policy_net.state_dict())
+
+        while i_episode < self.num_episodes:
+            # εを全環境の合計ステップ数で線形に減らす
+            if self.EPS_DECAY_STEPS is not None:
+                eps_threshold = self.EPS_START - total_steps / self.EPS_DECAY_STEPS
+            elif i_episode > 0:
+                eps_threshold = self.EPS_START - total_steps / (self.EPS_DECAY * total_steps_done / i_episode)
+            else:
+                eps_threshold = self.EPS_START
+            eps_threshold = max(eps_threshold, self.EPS_END)
+            self.beta = self.BETA_START + (1.0 - self.BETA_START) * min(i_episode / max(self.num_episodes - 1, 1), 1.0)
+
+            # 行動選択して全環境を1ステップ進める
+            actions = self.select_actions(states, masks, eps_threshold)
+            observations, rewards, dones, final_observations = vector_env.step(actions.cpu().numpy())
+            total_steps += n_envs
+
+            # 終了した環境は終了時の状態を次の状態とする(終端なので値は使わない)
+            next_states = torch.from_numpy(observations).to(self.device, copy=True)
+            next_masks = torch.from_numpy(vector_env.action_masks).to(self.device, copy=True)
+            rewards_tensor = torch.from_numpy(rewards).to(self.device, copy=True)
+            dones_tensor = torch.from_numpy(dones).to(self.device, copy=True)
+            if dones.any():
+                next_states[dones_tensor] = torch.from_numpy(final_observations[dones]).to(self.device)
+
+            # 経験を保存する
+            self.memory.push_batch(states, actions, next_states, rewards_tensor, next_masks, dones_tensor)
+
+            # 終了した環境は次のエピソードの最初の状態から続ける
+            states = next_states
+            if dones.any():
+                states[dones_tensor] = torch.from_numpy(observations[dones]).to(self.device)
+            masks = next_masks
+
+            total_rewards += rewards
+            for i in np.flatnonzero(dones):
+                # plot データを追加
+                self.episode_rewards.append(float(total_rewards[i]))
+                total_rewards[i] = 0
+                i_episode += 1
+                total_steps_done = total_steps
+
+                # 探索中のDQNを経験再生用DQNにコピーする
+                if i_episode % self.TARGET_UPDATE == 0:
+                    self.target_net.load_state_dict(self.policy_net.state_dict())
+
+                # 学習の進捗表示
+                if i_episode >= next_report:
+                    print(f'end {i_episode} episode')
+                    next_report += self.num_episodes / 10
+
+            # 経験再生を用いてDQNモデルを更新する
+            for _ in range(updates_per_step):
+                self.optimize_model()
+
+        print('Complete')
+
+    def training_distributed(self, data_folder_path:str='battle/data/', scenario_code:str='default',
+        n_actors:int=2, n_envs_per_actor:int=8, weight_update_interval:int=50, send_size:int=64,
+        transitions_per_update:float=8, seed:int=None):
+        """経験を集めるアクタープロセスと学習を分けて訓練を行う
 
-                # 経験を保存する
-                self.memory.push(state, action, next_state, reward)
+        各アクターは自分の環境と行動選択用のモデルを持ち、集めた経験をキューで送る。
+        このプロセス(学習側)はキューから受け取った経験を記録しながらoptimize_modelを続け、
+        weight_update_interval回ごとに重みを共有メモリに書き込んでアクターに配る。
+        学習が経験の収集に追いつかない場合は、キューが一杯になりアクターが待つ(経験transitions_per_update件につき1回更新する)。
+        合計num_episodesエピソードが終了するまで訓練する。
+        処理時間と学習状況の記録(Telemetry)はtrainingのみ対応しており、ここでは記録しない。
 
-                state = next_state
+        Args:
+            data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+            scenario_code (str, optional): ゲームのシナリオ. Defaults to 'default'.
+            n_actors (int, optional): アクタープロセス数. Defaults to 2.
+            n_envs_per_actor (int, optional): アクターごとの環境の数. Defaults to 8.
+            weight_update_interval (int, optional): 重みを配るモデルの更新回数の間隔. Defaults to 50.
+            send_size (int, optional): アクターがまとめて送る経験の数の目安. Defaults to 64.
+            transitions_per_update (float, optional): モデルの更新1回あたりの経験の数. Defaults to 8(Noneの場合は待たずに更新を続ける).
+            seed (int, optional): 乱数シード. Defaults to None.
+        """
+        # 行動選択用のモデルの重みは共有メモリに置く
+        shared_net = DQN(self.obs_size, self.n_actions, self.policy_net.l1.in_features)
+        shared_net.load_state_dict(self.policy_net.state_dict())
+        shared_net.share_memory()
+        weights_lock = mp.Lock()
+        weights_version = mp.Value('i', 0)
+        n_episodes = mp.Value('i', 0)
+        stop_event = mp.Event()
+        transitions = mp.Queue(maxsize=2 * n_actors)
+
+        seeds = np.random.SeedSequence(seed).generate_state(n_actors).tolist()
+        actors = []
+        for actor_id in range(n_actors):
+            process = mp.Process(target=actor, args=(
+                data_folder_path, scenario_code, n_envs_per_actor, seeds[actor_id], self.policy_net.l1.in_features,
+                shared_net, weights_lock, weights_version, n_episodes, stop_event, transitions,
+                self.EPS_START, self.EPS_END, self.EPS_DECAY, send_size), daemon=True)
+            process.start()
+            actors.append(process)
+
+        self.target_net.load_state_dict(self.policy_net.state_dict())
+        i_episode = 0
+        n_transitions = 0
+        n_updates = 0
+        # 受け取った経験に対して残っている更新回数
+        pending_updates = 0.0
+        next_report = self.num_episodes / 10
+        start_time = time.perf_counter()
+
+        def receive(block:bool):
+            """キューの経験を経験再生メモリに記録する(更新回数を制限する場合は1件だけ受け取る)"""
+            nonlocal i_episode, n_transitions, next_report, pending_updates
+            received = False
+            while transitions_per_update is None or not received:
+                try:
+                    message = transitions.get(timeout=0.1) if block and not received else transitions.get_nowait()
+                except queue.Empty:
+                    return
+                received = True
+                *arrays, finished_rewards = message
+                states, actions, next_states, rewards, next_masks, dones = (torch.from_numpy(a).to(self.device) for a in arrays)
+                self.memory.push_batch(states, actions.long(), next_states, rewards, next_masks, dones)
+                n_transitions += len(states)
+                if transitions_per_update is not None:
+                    pending_updates += len(states) / transitions_per_update
+
+                for total_reward in finished_rewards:
+                    # plot データを追加
+                    self.episode_rewards.append(total_reward)
+                    i_episode += 1
+                    # 探索中のDQNを経験再生用DQNにコピーする
+                    if i_episode % self.TARGET_UPDATE == 0:
+                        self.target_net.load_state_dict(self.policy_net.state_dict())
+                    # 学習の進捗表示
+                    if i_episode >= next_report:
+                        print(f'end {i_episode} episode')
+                        next_report += self.num_episodes / 10
+
+        try:
+            while i_episode < self.num_episodes:
+                # 経験が足りない間、更新回数が残っていない間はアクターからの経験を待つ
+                if transitions_per_update is None:
+                    receive(block=len(self.memory) < self.BATCH_SIZE)
+                elif len(self.memory) < self.BATCH_SIZE or pending_updates < 1:
+                    receive(block=True)
+                self.beta = self.BETA_START + (1.0 - self.BETA_START) * min(i_episode / max(self.num_episodes - 1, 1), 1.0)
 
                 # 経験再生を用いてDQNモデルを更新する
-                self.optimize_model()
+                if len(self.memory) >= self.BATCH_SIZE and (transitions_per_update is None or pending_updates >= 1):
+                    self.optimize_model()
+                    n_updates += 1
+                    pending_updates -= 1
+                    if n_updates % weight_update_interval == 0:
+                        with weights_lock:
+                            shared_net.load_state_dict(self.policy_net.state_dict())
+                            weights_version.value += 1
+        finally:
+            # キューに残った経験を読み捨てないとアクターが終了できない
+            stop_event.set()
+            while any(process.is_alive() for process in actors):
+                try:
+                    transitions.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            for process in actors:
+                process.join()
+
+        elapsed = time.perf_counter() - start_time
+        print(f'Complete ({n_transitions / elapsed:.0f} transitions/s, {n_updates / elapsed:.0f} updates/s)')
+
+    def save_checkpoint(self, folder_path:str):
+        """訓練の途中経過を保存する
+
+        モデル・最適化手法・エピソード数・乱数の状態・環境の状態はcheckpoint.ptに、
+        経験再生メモリはメモリマップで読み込めるバイナリファイルに保存する。
+        checkpoint.ptは一時ファイルに書いてから置き換えるので、保存中に中断しても前回のチェックポイントが残る。
 
-            # plot データを追加
-            self.episode_rewards.append(total_reward)
+        Args:
+            folder_path (str): 保存先のフォルダパス
+        """
+        os.makedirs(folder_path, exist_ok=True)
+        replay_file = f'replay-{self.i_episode}.bin'
+        replay_path = os.path.join(folder_path, replay_file)
+        self.memory.save(replay_path)
+        # 経験再生メモリが前回のファイルをメモリマップしている場合は、保存したファイルにマップし直す
+        # (Windowsではマップ中のファイルを削除できない)
+        if self.memory.file_path is not None and os.path.abspath(self.memory.file_path) != os.path.abspath(replay_path):
+            self.memory.load(replay_path)
+
+        checkpoint = {
+            'i_episode': self.i_episode,
+            'episode_rewards': self.episode_rewards,
+            'policy_net': self.policy_net.state_dict(),
+            'target_net': self.target_net.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'random_state': random.getstate(),
+            'torch_rng_state': torch.get_rng_state(),
+            'cuda_rng_state': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+            'env_snapshot': self.env.snapshot(),
+            'replay_file': replay_file,
+        }
+        file_path = os.path.join(folder_path, CHECKPOINT_FILE)
+        torch.save(checkpoint, file_path + '.tmp')
+        os.replace(file_path + '.tmp', file_path)
+
+        # 参照されなくなった経験再生メモリのファイルを削除する(まだマップしているファイルは残す)
+        mapped_path = None if self.memory.file_path is None else os.path.abspath(self.memory.file_path)
+        for name in os.listdir(folder_path):
+            path = os.path.join(folder_path, name)
+            if name.startswith('replay-') and name.endswith('.bin') and name != replay_file and os.path.abspath(path) != mapped_path:
+                os.remove(path)
+
+    def load_checkpoint(self, folder_path:str):
+        """save_checkpointで保存した途中経過を読み込む
+
+        学習パラメータは保存しないので、保存時と同じ値をset_learning_parametersで設定しておく。
 
-            # 探索中のDQNを経験再生用DQNにコピーする
-            if i_episode % self.TARGET_UPDATE == 0:
-                self.target_net.load_state_dict(self.policy_net.state_dict())
+        Args:
+            folder_path (str): 保存先のフォルダパス
+        """
+        checkpoint = torch.load(os.path.join(folder_path, CHECKPOINT_FILE), map_location=self.device, weights_only=False)
+        self.i_episode = checkpoint['i_episode']
+        self.episode_rewards = checkpoint['episode_rewards']
+        self.policy_net.load_state_dict(checkpoint['policy_net'])
+        self.target_net.load_state_dict(checkpoint['target_net'])
+        self.optimizer.load_state_dict(checkpoint['optimizer'])
+        random.setstate(checkpoint['random_state'])
+        torch.set_rng_state(checkpoint['torch_rng_state'].cpu())
+        if checkpoint['cuda_rng_state'] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(checkpoint['cuda_rng_state'])
+        self.env.restore(checkpoint['env_snapshot'])
+        self.memory.load(os.path.join(folder_path, checkpoint['replay_file']))
+
+    def evaluate(self, data_folder_path:str='battle/data/', scenario_code:str='default', **kwargs):
+        """訓練結果を複数の環境でまとめて評価する(引数はEvaluation.evaluateと同じ)
 
-            # 学習の進捗表示    
-            if (i_episode + 1) % (self.num_episodes / 10) == 0:
-                print(f'end {i_episode + 1} episode')
+        Args:
+            data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+            scenario_code (str, optional): ゲームのシナリオ. Defaults to 'default'.
 
-        print('Complete')
+        Returns:
+            EvaluationResult: 勝率・死亡率・逃走率・獲得報酬の集計値
+        """
+        # 評価は環境を使うので、必要になった時に読み込む
+        from .Evaluation import evaluate
+
+        return evaluate(self.target_net, data_folder_path, scenario_code, device=self.device, **kwargs)
+
+    def export_policy(self, file_path:str):
+        """テストに使うモデル(target_net)の重みを、NumPyだけで推論できるnpzファイルに書き出す
+
+        読み込みはAIPlayer.NumpyPolicy.NumpyPolicyで行う(torchは不要)。
+
+        Args:
+            file_path (str): 書き出すnpzファイルのパス
+        """
+        export_npz(self.target_net, file_path)
 
     def test(self, test_env, n_episode:int, is_render:bool=False)->Tuple[list, int]:
         """訓練結果のテスト
@@ -204,33 +735,54 @@ class DQNPlayer():
         result_rewards = []
         dead_count = 0
 
-        for i in range(n_episode):
-            state = test_env.reset()
-            state = self.conv_state(state)
-            total_reward = 0
-            done = False
+        # バトルメッセージは表示する場合のみ生成する
+        headless = test_env.headless
+        test_env.headless = not is_render
 
-            while not done:
-                if is_render:
-                    print(test_env.render())
+        # 状態は環境が事前に確保したテンソルに直接書き込む(ステップごとに配列を作らない)
+        observation = test_env.observation
+        state_cpu = torch.zeros((1, self.obs_size), dtype=torch.float32)
+        test_env.set_observation_buffer(state_cpu.numpy()[0])
+        state = state_cpu if self.device.type == 'cpu' else torch.zeros_like(state_cpu, device=self.device)
+        mask_cpu = torch.ones((1, self.n_actions), dtype=torch.bool)
+        mask = mask_cpu if self.device.type == 'cpu' else torch.ones_like(mask_cpu, device=self.device)
 
-                action = self.target_net(state).max(1)[1].view(1, 1)
-                next_state, reward, done, message = test_env.step(action.item())
-                total_reward += reward
-
-                next_state = self.conv_state(next_state)
-                state = next_state
-
-                if is_render:
-                    print(message)
-
-            result_rewards.append(total_reward)
-
-            # HPが0になったら死亡回数をカウントする
-            if int(next_state[0][1].item()) == 0:
-                dead_count += 1
-
-            if is_render:
-                print(f'獲得報酬は{total_reward}です。')
-        
+        try:
+            with torch.no_grad():
+                for i in range(n_episode):
+                    test_env.reset()
+                    test_env.get_action_mask(mask_cpu.numpy()[0])
+                    if state is not state_cpu:
+                        state.copy_(state_cpu)
+                        mask.copy_(mask_cpu)
+                    total_reward = 0
+                    done = False
+
+                    while not done:
+                        if is_render:
+                            print(test_env.render())
+
+                        action = self.masked_q_values(self.target_net(state), mask).max(1)[1].view(1, 1)
+                        _, reward, done, message = test_env.step(action.item())
+                        total_reward += reward
+                        test_env.get_action_mask(mask_cpu.numpy()[0])
+                        if state is not state_cpu:
+                            state.copy_(state_cpu)
+                            mask.copy_(mask_cpu)
+
+                        if is_render:
+                            print(message)
+
+                    result_rewards.append(total_reward)
+
+                    # 死亡した戦闘で終わったら死亡回数をカウントする
+                    if test_env.outcome == Outcome.DEAD:
+                        dead_count += 1
+
+                    if is_render:
+                        print(f'獲得報酬は{total_reward}です。')
+        finally:
+            # 例外で中断した場合も環境の設定を戻す
+            test_env.set_observation_buffer(observation)
+            test_env.headless = headless
         return result_rewards, dead_count
@@ -0,0 +1,243 @@
+import contextlib
+import math
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Tuple
+
+import numpy as np
+
+from RPGTurnBattle import Simulation
+from AIPlayer.NumpyPolicy import NumpyPolicy
+from battle.event import Outcome
+from battle.stats import wilson_interval, mean_interval, ratio_interval
+
+@dataclass
+class EvaluationResult:
+    """評価の集計値
+
+    エピソードごとの結果の和と二乗和を持ち、信頼区間はエピソードを単位として計算する。
+    """
+    z: float = 1.96             # 信頼区間の係数
+    n_episode: int = 0
+    deaths: int = 0
+    encounters: int = 0         # 遭遇した敵の数(死亡した戦闘を含む)
+    encounters_sq: int = 0
+    wins: int = 0               # 倒した敵の数
+    wins_sq: int = 0
+    wins_encounters: int = 0
+    escapes: int = 0            # 逃げ切った戦闘の数
+    escapes_sq: int = 0
+    escapes_encounters: int = 0
+    reward: float = 0.0
+    reward_sq: float = 0.0
+
+    def add_episode(self, dead:bool, wins:int, escapes:int, encounters:int, reward:float):
+        """1エピソードの結果を加える
+
+        Args:
+            dead (bool): 死亡した
+            wins (int): 倒した敵の数
+            escapes (int): 逃げ切った戦闘の数
+            encounters (int): 遭遇した敵の数
+            reward (float): 獲得報酬
+        """
+        self.n_episode += 1
+        self.deaths += int(dead)
+        self.encounters += encounters
+        self.encounters_sq += encounters * encounters
+        self.wins += wins
+        self.wins_sq += wins * wins
+        self.wins_encounters += wins * encounters
+        self.escapes += escapes
+        self.escapes_sq += escapes * escapes
+        self.escapes_encounters += escapes * encounters
+        self.reward += reward
+        self.reward_sq += reward * reward
+
+    def death_rate(self)->Tuple[float, float, float]:
+        """死亡率とWilsonスコアの信頼区間
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return wilson_interval(self.deaths, self.n_episode, self.z)
+
+    def win_rate(self)->Tuple[float, float, float]:
+        """遭遇した敵を倒した割合と信頼区間
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return self.ratio(self.wins, self.wins_sq, self.wins_encounters)
+
+    def escape_rate(self)->Tuple[float, float, float]:
+        """遭遇した敵から逃げ切った割合と信頼区間
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return self.ratio(self.escapes, self.escapes_sq, self.escapes_encounters)
+
+    def mean_reward(self)->Tuple[float, float, float]:
+        """獲得報酬の平均と信頼区間
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return mean_interval(self.reward, self.reward_sq, self.n_episode, self.z)
+
+    def ratio(self, total:int, total_sq:int, total_encounters:int)->Tuple[float, float, float]:
+        """遭遇した敵1体あたりの比率と、エピソード単位のデルタ法による信頼区間
+
+        Args:
+            total (int): 分子の和
+            total_sq (int): 分子の二乗和
+            total_encounters (int): 分子と遭遇数の積の和
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return ratio_interval(total, total_sq, total_encounters, self.encounters, self.encounters_sq, self.n_episode, self.z)
+
+    def half_width(self)->float:
+        """死亡率と勝率の信頼区間の幅の半分(大きい方)"""
+        _, death_low, death_high = self.death_rate()
+        _, win_low, win_high = self.win_rate()
+        return max(death_high - death_low, win_high - win_low) / 2
+
+def evaluate(net, data_folder_path:str='battle/data/', scenario_code:str='default', n_envs:int=64,
+             max_episodes:int=2000, precision:float=None, min_episodes:int=100, check_interval:int=50,
+             confidence:float=0.95, seed:int=0, device=None)->EvaluationResult:
+    """学習済みモデルの行動でテストエピソードをまとめて実行し、結果を集計する
+
+    n_envs個の環境の行動を1回の順伝播(推論モード)で選び、戦闘の結果(勝利・死亡・逃走)を環境から直接数える。
+    precisionを指定した場合は、check_intervalエピソードごとに死亡率と勝率の信頼区間の幅の半分が
+    precision以下になったかを確かめ、なった時点で打ち切る。
+    何度も確かめても信頼度を保てるように、信頼区間は確かめる最大回数でボンフェローニ補正する。
+    先に終わった(短い)エピソードに結果が偏らないように、開始した順に途切れなく終わったエピソードだけを集計する。
+    エピソードごとの乱数シードはエピソードの番号で決まるので、結果はn_envsによらない。
+    netにNumpyPolicyを渡した場合はtorchを読み込まずに評価する。
+
+    Args:
+        net: 行動選択に使うモデル(状態 -> 行動ごとのQ値)、またはNumpyPolicy
+        data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+        scenario_code (str, optional): ゲームのシナリオ. Defaults to 'default'.
+        n_envs (int, optional): 同時に進める環境の数. Defaults to 64.
+        max_episodes (int, optional): 最大エピソード数. Defaults to 2000.
+        precision (float, optional): 目標とする信頼区間の幅の半分. Defaults to None(max_episodesまで実行する).
+        min_episodes (int, optional): 打ち切りを確かめ始めるエピソード数. Defaults to 100.
+        check_interval (int, optional): 打ち切りを確かめるエピソード数の間隔. Defaults to 50.
+        confidence (float, optional): 信頼度. Defaults to 0.95.
+        seed (int, optional): 乱数シード. Defaults to 0.
+        device (torch.device, optional): モデルのデバイス. Defaults to None(CPU).
+
+    Returns:
+        EvaluationResult: 評価の集計値
+    """
+    n_envs = min(n_envs, max_episodes)
+    alpha = 1 - confidence
+    if precision is not None:
+        alpha /= max(math.ceil(max_episodes / check_interval), 1)
+    result = EvaluationResult(z=NormalDist().inv_cdf(1 - alpha / 2))
+    seeds = np.random.SeedSequence(seed).generate_state(max_episodes).tolist()
+
+    # 状態と選択可能な行動は各環境が事前に確保した配列の行に直接書き込む
+    envs = [Simulation(data_folder_path, scenario_code, headless=True) for _ in range(n_envs)]
+    states_np = np.zeros((n_envs, len(envs[0].reset())), dtype=np.float32)
+    masks_np = np.ones((n_envs, envs[0].get_n_actions()), dtype=bool)
+    for env, row in zip(envs, states_np):
+        env.set_observation_buffer(row)
+
+    if isinstance(net, NumpyPolicy):
+        def select_actions()->list:
+            return net.select_actions(states_np, masks_np).tolist()
+        mode = contextlib.nullcontext()
+    else:
+        # NumpyPolicyだけを使う場合にtorchを読み込まないように、ここで読み込む
+        import torch
+        # テンソルは配列とメモリを共有する
+        states_cpu = torch.from_numpy(states_np)
+        masks_cpu = torch.from_numpy(masks_np)
+
+        def select_actions()->list:
+            states = states_cpu.to(device) if device is not None else states_cpu
+            masks = masks_cpu.to(device) if device is not None else masks_cpu
+            return net(states).masked_fill(~masks, float('-inf')).max(1)[1].tolist()
+        mode = torch.inference_mode()
+
+    # 環境ごとの実行中のエピソードの番号と結果 [番号, 倒した数, 逃げた数, 遭遇数, 報酬]
+    running = [None] * n_envs
+    next_episode = 0
+    finished = {}
+    next_check = max(min_episodes, check_interval)
+
+    def start(i:int):
+        nonlocal next_episode
+        if next_episode >= max_episodes:
+            running[i] = None
+            return
+        envs[i].seed(seeds[next_episode])
+        envs[i].reset()
+        envs[i].get_action_mask(masks_np[i])
+        running[i] = [next_episode, 0, 0, 0, 0.0]
+        next_episode += 1
+
+    for i in range(n_envs):
+        start(i)
+
+    stop = False
+    with mode:
+        while not stop and any(episode is not None for episode in running):
+            actions = select_actions()
+
+            for i, env in enumerate(envs):
+                episode = running[i]
+                if episode is None:
+                    continue
+                _, reward, done, _ = env.step(actions[i])
+                env.get_action_mask(masks_np[i])
+                episode[4] += reward
+                outcome = env.outcome
+                if outcome != Outcome.NONE:
+                    episode[3] += 1
+                    if outcome == Outcome.DEFEAT:
+                        episode[1] += 1
+                    elif outcome == Outcome.ESCAPE:
+                        episode[2] += 1
+                dead = outcome == Outcome.DEAD
+                if done:
+                    finished[episode[0]] = (dead, episode[1], episode[2], episode[3], episode[4])
+                    start(i)
+
+            # 開始した順に途切れなく終わったエピソードを集計する
+            while result.n_episode in finished:
+                result.add_episode(*finished.pop(result.n_episode))
+                if precision is not None and result.n_episode >= next_check:
+                    next_check += check_interval
+                    if result.half_width() <= precision:
+                        stop = True
+                        break
+
+    for env in envs:
+        env.set_observation_buffer(None)
+    return result
+
+def format_result(result:EvaluationResult)->str:
+    """評価の集計値を文字列にする
+
+    Args:
+        result (EvaluationResult): 評価の集計値
+
+    Returns:
+        str: 評価の集計値
+    """
+    def interval(value:Tuple[float, float, float])->str:
+        return f'{value[0]:.3f} [{value[1]:.3f}, {value[2]:.3f}]'
+
+    return '\n'.join([
+        f'episodes\t{result.n_episode}',
+        f'reward\t{interval(result.mean_reward())}',
+        f'win_rate\t{interval(result.win_rate())}',
+        f'death_rate\t{interval(result.death_rate())}',
+        f'escape_rate\t{interval(result.escape_rate())}',
+    ])
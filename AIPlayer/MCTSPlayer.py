@@ -0,0 +1,190 @@
+import copy
+import math
+import random
+from typing import Tuple
+
+class Node():
+    """探索木のノード(行動列で決まるopen-loopのノード)"""
+    __slots__ = ('n_visits', 'n_action_visits', 'action_values', 'children')
+
+    def __init__(self, n_actions:int):
+        self.n_visits = 0
+        self.n_action_visits = [0] * n_actions
+        self.action_values = [0.0] * n_actions
+        self.children = {}
+
+class MCTSPlayer():
+    """学習を行わず、行動のたびに環境のsnapshot/restoreを使ってモンテカルロ木探索を行うエージェント
+
+    木の展開・ロールアウトとも、環境のaction_maskで選択可能な行動だけを選ぶ。
+    """
+    def __init__(self, env, n_simulations:int=200, max_depth:int=20, exploration:float=10.0, seed:int=None):
+        """コンストラクタ
+
+        Args:
+            env : 探索に使用する環境(探索用に複製して使用する)
+            n_simulations (int, optional): 1回の行動選択で行うシミュレーション回数. Defaults to 200.
+            max_depth (int, optional): 1回のシミュレーションで先読みする最大ステップ数. Defaults to 20.
+            exploration (float, optional): UCB1の探索係数(報酬のスケールに合わせる). Defaults to 10.0.
+            seed (int, optional): 探索用の乱数シード. Defaults to None.
+        """
+        self.n_simulations = n_simulations
+        self.max_depth = max_depth
+        self.exploration = exploration
+        self.n_actions = env.get_n_actions()
+
+        # 探索用の環境は最初に一度だけ複製し、以降はrestoreで状態を書き換える。
+        # 探索用の環境は独自の乱数を使うので、実際の環境の未来の乱数を知ることはない。
+        self.search_env = copy.deepcopy(env)
+        self.search_env.headless = True
+        self.search_env.seed(seed)
+        self.rng = random.Random(seed)
+        # action_maskごとの選択可能な行動のindex
+        self.valid_actions_cache = {}
+
+    def select_action(self, env)->int:
+        """現在の状態から木探索を行い、行動を選択する
+
+        Args:
+            env : 現在の環境
+
+        Returns:
+            int: 選択した行動のindex
+        """
+        root_snap = env.snapshot(include_rng=False)
+        root = Node(self.n_actions)
+
+        for _ in range(self.n_simulations):
+            self.search_env.restore(root_snap, restore_rng=False)
+            self.simulate(root)
+
+        # 選択可能な行動のうち、最も多く選ばれた行動を選ぶ
+        visits = root.n_action_visits
+        return max(self.valid_actions(env.action_mask), key=lambda a: (visits[a], root.action_values[a]))
+
+    def simulate(self, root:Node):
+        """木の選択・展開・ロールアウト・逆伝播を1回行う
+
+        Args:
+            root (Node): 探索木のルート
+        """
+        env = self.search_env
+        node = root
+        path = []
+        rewards = []
+        done = False
+
+        # 選択と展開
+        while not done and len(rewards) < self.max_depth:
+            action = self.select_ucb(node, self.valid_actions(env.action_mask))
+            _, reward, done, _ = env.step(action)
+            path.append((node, action))
+            rewards.append(reward)
+            child = node.children.get(action)
+            if child is None:
+                node.children[action] = Node(self.n_actions)
+                break
+            node = child
+
+        # ロールアウト(選択可能な行動からランダムに選ぶ)
+        rollout_reward = 0
+        depth = len(rewards)
+        while not done and depth < self.max_depth:
+            _, reward, done, _ = env.step(self.rng.choice(self.valid_actions(env.action_mask)))
+            rollout_reward += reward
+            depth += 1
+
+        # 逆伝播(各ノード以降に得られた報酬の合計で平均値を更新する)
+        value = rollout_reward
+        for (node, action), reward in zip(reversed(path), reversed(rewards)):
+            value += reward
+            node.n_visits += 1
+            node.n_action_visits[action] += 1
+            node.action_values[action] += (value - node.action_values[action]) / node.n_action_visits[action]
+
+    def valid_actions(self, mask)->Tuple[int, ...]:
+        """選択可能な行動のindexを取得する
+
+        Args:
+            mask : 行動ごとの選択可否(環境のaction_mask)
+
+        Returns:
+            Tuple[int, ...]: 選択可能な行動のindex
+        """
+        key = mask.tobytes()
+        actions = self.valid_actions_cache.get(key)
+        if actions is None:
+            actions = tuple(int(action) for action in mask.nonzero()[0])
+            self.valid_actions_cache[key] = actions
+        return actions
+
+    def select_ucb(self, node:Node, actions:Tuple[int, ...])->int:
+        """UCB1で行動を選択する(未選択の行動を優先する)
+
+        Args:
+            node (Node): 行動を選択するノード
+            actions (Tuple[int, ...]): 選択可能な行動のindex
+
+        Returns:
+            int: 選択した行動のindex
+        """
+        best_action = actions[0]
+        best_score = -math.inf
+        log_n = math.log(node.n_visits + 1)
+        for action in actions:
+            n = node.n_action_visits[action]
+            if n == 0:
+                return action
+            score = node.action_values[action] + self.exploration * math.sqrt(log_n / n)
+            if score > best_score:
+                best_action = action
+                best_score = score
+        return best_action
+
+    def test(self, test_env, n_episode:int, is_render:bool=False)->Tuple[list, int]:
+        """木探索によるプレイのテスト
+
+        Args:
+            test_env: テスト対象の環境
+            n_episode (int): テストするエピソード数
+            is_render (bool): テスト中のバトルメッセージを表示する. Defaults to False.
+
+        Returns:
+            Tuple[list, int]: 各エピソードの獲得報酬、全エピソードの死亡回数の合計
+        """
+        result_rewards = []
+        dead_count = 0
+
+        # バトルメッセージは表示する場合のみ生成する
+        headless = test_env.headless
+        test_env.headless = not is_render
+
+        try:
+            for i in range(n_episode):
+                test_env.reset()
+                total_reward = 0
+                done = False
+
+                while not done:
+                    if is_render:
+                        print(test_env.render())
+
+                    action = self.select_action(test_env)
+                    _, reward, done, message = test_env.step(action)
+                    total_reward += reward
+
+                    if is_render:
+                        print(message)
+
+                result_rewards.append(total_reward)
+
+                # HPが0になったら死亡回数をカウントする
+                if test_env.battle.player.hp == 0:
+                    dead_count += 1
+
+                if is_render:
+                    print(f'獲得報酬は{total_reward}です。')
+        finally:
+            # 例外で中断した場合も環境の設定を戻す
+            test_env.headless = headless
+        return result_rewards, dead_count
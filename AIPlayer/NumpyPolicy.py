@@ -0,0 +1,83 @@
+import numpy as np
+
+# 書き出す層(AIPlayer.DQN.DQNの全結合層)
+LAYERS = ('l0', 'l1', 'l2')
+
+def export_npz(net, file_path:str):
+    """学習済みモデルの重みをnpzファイルに書き出す(torchを使わずに推論するため)
+
+    Args:
+        net: AIPlayer.DQN.DQN(policy_netまたはtarget_net)
+        file_path (str): 書き出すnpzファイルのパス
+    """
+    state_dict = net.state_dict()
+    arrays = {}
+    for layer in LAYERS:
+        # 推論でそのまま行列積に使えるように、(入力数, 出力数)に転置して保存する
+        arrays[f'{layer}_weight'] = np.ascontiguousarray(state_dict[f'{layer}.weight'].detach().cpu().numpy().T, dtype=np.float32)
+        arrays[f'{layer}_bias'] = state_dict[f'{layer}.bias'].detach().cpu().numpy().astype(np.float32)
+    np.savez(file_path, **arrays)
+
+class NumpyPolicy():
+    """export_npzで書き出したモデルで、NumPyだけを使って行動を選択するクラス
+
+    torchを読み込まないので、評価やバランス集計のワーカープロセスを軽く起動できる。
+    """
+
+    def __init__(self, file_path:str):
+        """コンストラクタ
+
+        Args:
+            file_path (str): export_npzで書き出したnpzファイルのパス
+        """
+        with np.load(file_path) as data:
+            self.layers = [(data[f'{layer}_weight'], data[f'{layer}_bias']) for layer in LAYERS]
+        self.obs_size = self.layers[0][0].shape[0]
+        self.n_actions = self.layers[-1][0].shape[1]
+
+    def q_values(self, states:np.ndarray)->np.ndarray:
+        """行動ごとのQ値を計算する
+
+        Args:
+            states (np.ndarray): 状態 (状態数, 状態の要素数)
+
+        Returns:
+            np.ndarray: Q値 (状態数, 行動数)
+        """
+        x = np.asarray(states, dtype=np.float32)
+        for weight, bias in self.layers[:-1]:
+            x = x @ weight
+            x += bias
+            np.maximum(x, 0, out=x)
+        weight, bias = self.layers[-1]
+        x = x @ weight
+        x += bias
+        return x
+
+    def select_actions(self, states:np.ndarray, masks:np.ndarray=None)->np.ndarray:
+        """Q値が最大の行動をまとめて選択する
+
+        Args:
+            states (np.ndarray): 状態 (状態数, 状態の要素数)
+            masks (np.ndarray, optional): 選択可能な行動 (状態数, 行動数). Defaults to None(すべて選択可能).
+
+        Returns:
+            np.ndarray: 選択した行動のindex (状態数,)
+        """
+        q_values = self.q_values(states)
+        if masks is not None:
+            q_values[~masks] = -np.inf
+        return q_values.argmax(axis=1)
+
+    def __call__(self, env, rng=None)->int:
+        """環境の現在の状態から行動を選択する(BalanceReportの方策と同じ呼び出し方)
+
+        Args:
+            env (Simulation): 環境
+            rng (optional): 使用しない. Defaults to None.
+
+        Returns:
+            int: 選択した行動のindex
+        """
+        state = np.asarray(env.get_status(), dtype=np.float32).reshape(1, -1)
+        return int(self.select_actions(state, env.action_mask.reshape(1, -1))[0])
@@ -0,0 +1,146 @@
+import json
+import math
+import time
+
+# 計測する処理
+PHASES = ('env_step', 'select_action', 'memory_push', 'memory_sample', 'forward', 'backward', 'target_sync')
+
+class RollingStats():
+    """直近window個の値の平均と標準偏差(追加はO(1))"""
+
+    def __init__(self, window:int):
+        """コンストラクタ
+
+        Args:
+            window (int): 集計する値の数
+        """
+        self.values = [0.0] * window
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, value:float):
+        """値を追加する(window個を超えた場合は最も古い値を除く)
+
+        Args:
+            value (float): 追加する値
+        """
+        if self.count == len(self.values):
+            old = self.values[self.position]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.count += 1
+        self.values[self.position] = value
+        self.position = (self.position + 1) % len(self.values)
+        self.total += value
+        self.total_sq += value * value
+
+    def mean(self)->float:
+        return self.total / self.count if self.count > 0 else None
+
+    def std(self)->float:
+        if self.count == 0:
+            return None
+        mean = self.total / self.count
+        return math.sqrt(max(self.total_sq / self.count - mean * mean, 0.0))
+
+class Telemetry():
+    """訓練の処理時間と学習状況を記録し、JSONL形式でファイルに書き出すクラス
+
+    処理ごとの時間はadd_timeで積算し、intervalステップごとに前回の記録からの
+    ステップ数/秒・更新回数/秒・処理ごとの時間と、報酬・損失の移動平均、εを1行のJSONとして書き出す。
+    DQNPlayer.trainingでのみ記録する(training_batched・training_distributedは記録しない)。
+    """
+
+    def __init__(self, file_path:str, interval:int=1000, window:int=100):
+        """コンストラクタ
+
+        Args:
+            file_path (str): 書き出すJSONLファイルのパス
+            interval (int, optional): 記録するステップ数の間隔. Defaults to 1000.
+            window (int, optional): 報酬・損失の移動平均に使う値の数. Defaults to 100.
+        """
+        self.file = open(file_path, 'w', encoding='utf-8')
+        self.interval = interval
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.rewards = RollingStats(window)
+        self.losses = RollingStats(window)
+        self.epsilon = None
+        self.episode = 0
+        self.steps = 0
+        self.updates = 0
+
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.last_steps = 0
+        self.last_updates = 0
+
+    def add_time(self, phase:str, seconds:float):
+        """処理時間を積算する
+
+        Args:
+            phase (str): 処理(PHASESのいずれか)
+            seconds (float): 処理時間(秒)
+        """
+        self.phase_times[phase] += seconds
+
+    def add_step(self):
+        """環境のステップ数を数え、intervalステップごとに記録を書き出す"""
+        self.steps += 1
+        if self.steps - self.last_steps >= self.interval:
+            self.write()
+
+    def add_update(self, loss:float):
+        """モデルの更新回数を数え、損失を記録する
+
+        Args:
+            loss (float): 損失
+        """
+        self.updates += 1
+        self.losses.add(loss)
+
+    def add_episode(self, total_reward:float, epsilon:float):
+        """エピソードの終了を記録する
+
+        Args:
+            total_reward (float): エピソードの獲得報酬
+            epsilon (float): エピソード中のε
+        """
+        self.episode += 1
+        self.rewards.add(total_reward)
+        self.epsilon = epsilon
+
+    def write(self):
+        """前回の記録からの集計を1行のJSONとして書き出す"""
+        now = time.perf_counter()
+        elapsed = max(now - self.last_time, 1e-9)
+        record = {
+            'time': now - self.start_time,
+            'episode': self.episode,
+            'steps': self.steps,
+            'updates': self.updates,
+            'steps_per_sec': (self.steps - self.last_steps) / elapsed,
+            'updates_per_sec': (self.updates - self.last_updates) / elapsed,
+            'phase_seconds': self.phase_times,
+            'other_seconds': max(elapsed - sum(self.phase_times.values()), 0.0),
+            'reward_mean': self.rewards.mean(),
+            'reward_std': self.rewards.std(),
+            'loss_mean': self.losses.mean(),
+            'loss_std': self.losses.std(),
+            'epsilon': self.epsilon,
+        }
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.last_time = now
+        self.last_steps = self.steps
+        self.last_updates = self.updates
+
+    def close(self):
+        """残りの集計を書き出してファイルを閉じる"""
+        if self.steps > self.last_steps:
+            self.write()
+        self.file.close()
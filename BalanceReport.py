@@ -0,0 +1,443 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import random
+import zlib
+from dataclasses import dataclass, fields, asdict
+from multiprocessing import Pool
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from RPGTurnBattle import Simulation
+from AIPlayer.NumpyPolicy import NumpyPolicy
+from battle.command import PlayerCommands, EnemyCommands
+from battle.content import UNIT_FIELDS, UnitPrototype, load_content
+from battle.event import Outcome
+from battle.items import Items
+from battle.stats import wilson_interval, mean_interval, ratio_interval
+from battle.unit import UnitType
+
+# 保存済み結果の形式のバージョン(戦闘処理や集計方法を変更した場合は上げて、保存済みの結果を無効にする)
+STORE_VERSION = 1
+
+def attack_policy(env, rng:random.Random)->int:
+    """常に「たたかう」を選ぶ"""
+    return env.battle.player.commands.index('attack')
+
+def random_policy(env, rng:random.Random)->int:
+    """使用可能なコマンドからランダムに選ぶ"""
+    return rng.randrange(env.get_n_actions())
+
+def cure_policy(env, rng:random.Random)->int:
+    """HPが1/3以下なら回復、それ以外は攻撃呪文、MPが足りなければ「たたかう」を選ぶ"""
+    player = env.battle.player
+    commands = player.commands
+    if 'cure' in commands and player.mp >= PlayerCommands['cure'].used_mp and player.hp * 3 <= player.max_hp:
+        return commands.index('cure')
+    if 'fire' in commands and player.mp >= PlayerCommands['fire'].used_mp:
+        return commands.index('fire')
+    return commands.index('attack')
+
+# ワーカープロセスごとの環境(組み合わせごとに1度だけ作成する)
+_envs = {}
+
+# 方策名 -> 行動選択関数(ワーカープロセスに名前で渡す)
+POLICIES = {
+    'attack': attack_policy,
+    'random': random_policy,
+    'cure': cure_policy,
+}
+
+# ワーカープロセスごとのnpzファイルの方策(ファイルごとに1度だけ読み込む)
+_npz_policies = {}
+
+def get_policy(policy_name:str):
+    """方策名から行動選択関数を取得する
+
+    POLICIESにない方策名は、export_npzで書き出したnpzファイルのパスとしてNumpyPolicyを読み込む。
+
+    Args:
+        policy_name (str): 方策名(POLICIESのキー)またはnpzファイルのパス
+
+    Returns:
+        行動選択関数(env, rng) -> 行動のindex
+    """
+    if policy_name in POLICIES:
+        return POLICIES[policy_name]
+    if policy_name not in _npz_policies:
+        _npz_policies[policy_name] = NumpyPolicy(policy_name)
+    return _npz_policies[policy_name]
+
+def policy_source(policy_name:str)->str:
+    """方策の内容を表す文字列(集計結果のハッシュ値の入力)
+
+    Args:
+        policy_name (str): 方策名(POLICIESのキー)またはnpzファイルのパス
+
+    Returns:
+        str: 関数のソースコード、npzファイルの場合はファイルの内容のハッシュ値
+    """
+    if policy_name in POLICIES:
+        return inspect.getsource(POLICIES[policy_name])
+    with open(policy_name, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+@dataclass
+class BalanceStats:
+    """エピソードの集計値
+
+    ワーカーはエピソードごとの結果を返さず、この集計値(和と二乗和)だけを返す。
+    集計値どうしは足し合わせることができる。
+    """
+    n_episode: int = 0
+    deaths: int = 0
+    survived: int = 0           # 生き残った戦闘回数
+    survived_sq: int = 0
+    encounters: int = 0         # 遭遇した敵の数(死亡した戦闘を含む)
+    encounters_sq: int = 0
+    wins: int = 0               # 倒した敵の数
+    wins_sq: int = 0
+    wins_encounters: int = 0
+    turns: int = 0              # 行動選択の回数
+    turns_sq: int = 0
+    turns_encounters: int = 0
+
+    def add_episode(self, dead:bool, survived:int, wins:int, turns:int):
+        """1エピソードの結果を加える
+
+        Args:
+            dead (bool): 死亡した
+            survived (int): 生き残った戦闘回数
+            wins (int): 倒した敵の数
+            turns (int): 行動選択の回数
+        """
+        encounters = survived + int(dead)
+        self.n_episode += 1
+        self.deaths += int(dead)
+        self.survived += survived
+        self.survived_sq += survived * survived
+        self.encounters += encounters
+        self.encounters_sq += encounters * encounters
+        self.wins += wins
+        self.wins_sq += wins * wins
+        self.wins_encounters += wins * encounters
+        self.turns += turns
+        self.turns_sq += turns * turns
+        self.turns_encounters += turns * encounters
+
+    def merge(self, other:'BalanceStats')->'BalanceStats':
+        """他の集計値を足し合わせる
+
+        Args:
+            other (BalanceStats): 足し合わせる集計値
+
+        Returns:
+            BalanceStats: self
+        """
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+        return self
+
+    def death_rate(self)->Tuple[float, float, float]:
+        """死亡率とWilsonスコアの信頼区間
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return wilson_interval(self.deaths, self.n_episode)
+
+    def mean_survived(self)->Tuple[float, float, float]:
+        """生き残った戦闘回数の平均と信頼区間
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return mean_interval(self.survived, self.survived_sq, self.n_episode)
+
+    def win_rate(self)->Tuple[float, float, float]:
+        """遭遇した敵を倒した割合と信頼区間
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return self.ratio(self.wins, self.wins_sq, self.wins_encounters)
+
+    def turns_per_encounter(self)->Tuple[float, float, float]:
+        """1回の戦闘の平均ターン数と信頼区間
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return self.ratio(self.turns, self.turns_sq, self.turns_encounters)
+
+    def ratio(self, total:int, total_sq:int, total_encounters:int)->Tuple[float, float, float]:
+        """遭遇した敵1体あたりの比率と、エピソード単位のデルタ法による信頼区間
+
+        Args:
+            total (int): 分子の和
+            total_sq (int): 分子の二乗和
+            total_encounters (int): 分子と遭遇数の積の和
+
+        Returns:
+            Tuple[float, float, float]: 推定値, 下限, 上限
+        """
+        return ratio_interval(total, total_sq, total_encounters, self.encounters, self.encounters_sq, self.n_episode)
+
+def run_episodes(task:Tuple[str, str, int, str, int, int])->Tuple[Tuple[str, int, str], BalanceStats]:
+    """ワーカープロセスでエピソードを実行し、集計値だけを返す
+
+    Args:
+        task (Tuple[str, str, int, str, int, int]): データフォルダ, シナリオ, プレイヤーのレベル, 方策名, エピソード数, 乱数シード
+
+    Returns:
+        Tuple[Tuple[str, int, str], BalanceStats]: (シナリオ, レベル, 方策名), 集計値
+    """
+    data_folder_path, scenario_code, player_lv, policy_name, n_episode, seed = task
+    env_key = (data_folder_path, scenario_code, player_lv)
+    if env_key not in _envs:
+        _envs[env_key] = Simulation(data_folder_path, scenario_code, headless=True, player_lv=player_lv)
+    env = _envs[env_key]
+    env.seed(seed)
+    policy = get_policy(policy_name)
+    rng = random.Random(seed)
+
+    stats = BalanceStats()
+    for _ in range(n_episode):
+        env.reset()
+        done = False
+        wins = 0
+        turns = 0
+        while not done:
+            _, _, done, _ = env.step(policy(env, rng))
+            turns += 1
+            if env.outcome == Outcome.DEFEAT:
+                wins += 1
+        stats.add_episode(env.battle.player.hp == 0, env.n_battle, wins, turns)
+    return (scenario_code, player_lv, policy_name), stats
+
+def unit_inputs(prototype:UnitPrototype)->dict:
+    """ユニットの戦闘結果に影響する入力(ユニットの行、使用するコマンドの性能、装備品の補正値)
+
+    Args:
+        prototype (UnitPrototype): ユニットのプロトタイプ
+
+    Returns:
+        dict: 入力の値
+    """
+    unit = dict(zip(UNIT_FIELDS, prototype.values))
+    commands = PlayerCommands if unit['unit_type'] == UnitType.PLAYER else EnemyCommands
+    return {
+        'unit': unit,
+        'commands': {key: [type(commands[key]).__name__, vars(commands[key])] for key in unit['commands']},
+        'items': {
+            'weapon': vars(Items.weapons[unit['weapon']]),
+            'armor': vars(Items.armors[unit['armor']]),
+            # Unitは盾の補正値もarmorsの表から引く
+            'shield': vars(Items.armors[unit['shield']]),
+        },
+    }
+
+def input_hash(content, scenario_code:str, player_lv:int, policy_name:str, n_episode:int, chunk_size:int, seed:int)->str:
+    """組み合わせの集計結果が依存する入力だけのハッシュ値
+
+    プレイヤーのレベルの行、シナリオに出現する敵の行、それらが使うコマンドの性能と装備品の補正値、
+    方策(関数のソースコード、npzファイルの場合はファイルの内容)、乱数シードの範囲から計算する。
+    他の敵やシナリオを変更してもハッシュ値は変わらない。
+
+    Args:
+        content: 読み込み済みのデータ
+        scenario_code (str): シナリオ
+        player_lv (int): プレイヤーのレベル
+        policy_name (str): 方策名(POLICIESのキー)またはnpzファイルのパス
+        n_episode (int): エピソード数
+        chunk_size (int): 1タスクのエピソード数
+        seed (int): 乱数シード
+
+    Returns:
+        str: ハッシュ値(16進数)
+    """
+    scenario = content.scenario(scenario_code)
+    inputs = {
+        'version': STORE_VERSION,
+        'player': unit_inputs(content.player(player_lv)),
+        'enemies': [unit_inputs(enemy) for enemy in content.scenario_enemies(scenario)],
+        'policy': [policy_name, policy_source(policy_name)],
+        'seeds': [scenario_code, player_lv, n_episode, chunk_size, seed],
+    }
+    text = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def task_seeds(scenario_code:str, player_lv:int, policy_name:str, n_tasks:int, seed:int)->List[int]:
+    """組み合わせのタスクごとの乱数シード
+
+    シナリオ・レベル・方策名とseedだけから決めるので、データを変更しても同じ乱数列で比較できる。
+
+    Args:
+        scenario_code (str): シナリオ
+        player_lv (int): プレイヤーのレベル
+        policy_name (str): 方策名
+        n_tasks (int): タスク数
+        seed (int): 乱数シード
+
+    Returns:
+        List[int]: タスクごとの乱数シード
+    """
+    key = zlib.crc32(f'{scenario_code}/{player_lv}/{policy_name}'.encode('utf-8'))
+    return np.random.SeedSequence([seed, key]).generate_state(n_tasks).tolist()
+
+class ResultStore():
+    """入力のハッシュ値ごとに集計結果を保存するJSONファイル
+
+    入力が変わっていない組み合わせは保存済みの結果を使い、再シミュレーションしない。
+    """
+    def __init__(self, file_path:str):
+        """コンストラクタ
+
+        Args:
+            file_path (str): 保存先のファイルパス(存在しない場合は空の状態から始める)
+        """
+        self.file_path = file_path
+        self.results:Dict[str, dict] = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == STORE_VERSION:
+                self.results = data['results']
+
+    def get(self, key:str)->BalanceStats:
+        """保存済みの集計値を取得する
+
+        Args:
+            key (str): 入力のハッシュ値
+
+        Returns:
+            BalanceStats: 集計値(保存されていない場合はNone)
+        """
+        if key not in self.results:
+            return None
+        return BalanceStats(**self.results[key]['stats'])
+
+    def put(self, key:str, scenario_code:str, player_lv:int, policy_name:str, stats:BalanceStats):
+        """集計値を保存する(saveを呼ぶまでファイルには書き込まない)
+
+        Args:
+            key (str): 入力のハッシュ値
+            scenario_code (str): シナリオ
+            player_lv (int): プレイヤーのレベル
+            policy_name (str): 方策名
+            stats (BalanceStats): 集計値
+        """
+        self.results[key] = {'scenario': scenario_code, 'lv': player_lv, 'policy': policy_name, 'stats': asdict(stats)}
+
+    def save(self):
+        """ファイルに書き込む(書き込み途中で中断しても元のファイルが壊れないように置き換える)"""
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_VERSION, 'results': self.results}, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.file_path)
+
+def balance_report(data_folder_path:str, n_episode:int, policies:List[str], n_workers:int=None, chunk_size:int=1000, seed:int=0, store_path:str=None)->List[dict]:
+    """全シナリオ・全プレイヤーレベル・全方策の組み合わせで戦闘を行い、難易度を集計する
+
+    各組み合わせのエピソードをchunk_size単位のタスクに分けてプロセスプールで実行する。
+    store_pathを指定した場合は、入力のハッシュ値が保存済みの組み合わせは再シミュレーションしない。
+
+    Args:
+        data_folder_path (str): Unitデータの格納先フォルダパス
+        n_episode (int): 組み合わせごとのエピソード数
+        policies (List[str]): 方策名のリスト(POLICIESのキー、またはexport_npzで書き出したnpzファイルのパス)
+        n_workers (int, optional): ワーカープロセス数. Defaults to None(CPUコア数).
+        chunk_size (int, optional): 1タスクのエピソード数. Defaults to 1000.
+        seed (int, optional): 乱数シード. Defaults to 0.
+        store_path (str, optional): 集計結果の保存先ファイルパス. Defaults to None(保存しない).
+
+    Returns:
+        List[dict]: 組み合わせごとの集計結果
+    """
+    content = load_content(data_folder_path)
+    levels = sorted(player.lv for player in content.players)
+    # 学習済みモデルは、行動数がモデルの出力数と同じプレイヤーのレベルだけで評価する
+    n_actions = {policy: NumpyPolicy(policy).n_actions for policy in policies if policy not in POLICIES}
+    commands = UNIT_FIELDS.index('commands')
+    keys = [(scenario.scenario_code, lv, policy) for scenario in content.scenarios for lv in levels for policy in policies
+            if policy in POLICIES or len(content.player(lv).values[commands]) == n_actions[policy]]
+    store = ResultStore(store_path) if store_path is not None else None
+
+    results = {}
+    hashes = {}
+    tasks = []
+    for key in keys:
+        hashes[key] = input_hash(content, *key, n_episode, chunk_size, seed)
+        stats = store.get(hashes[key]) if store is not None else None
+        if stats is not None:
+            results[key] = stats
+            continue
+        # 入力が変わった組み合わせだけタスクにする
+        results[key] = BalanceStats()
+        starts = range(0, n_episode, chunk_size)
+        for start, task_seed in zip(starts, task_seeds(*key, len(starts), seed)):
+            tasks.append((data_folder_path, *key, min(chunk_size, n_episode - start), task_seed))
+    simulated = {task[1:4] for task in tasks}
+
+    if tasks:
+        with Pool(n_workers) as pool:
+            for key, stats in pool.imap_unordered(run_episodes, tasks):
+                results[key].merge(stats)
+        if store is not None:
+            for key in simulated:
+                store.put(hashes[key], *key, results[key])
+            store.save()
+
+    report = []
+    for (scenario_code, lv, policy), stats in results.items():
+        report.append({
+            'scenario': scenario_code,
+            'lv': lv,
+            'policy': policy,
+            'episodes': stats.n_episode,
+            'win_rate': stats.win_rate(),
+            'death_rate': stats.death_rate(),
+            'survived': stats.mean_survived(),
+            'turns': stats.turns_per_encounter(),
+            'simulated': (scenario_code, lv, policy) in simulated,
+        })
+    return report
+
+def format_report(report:List[dict])->str:
+    """集計結果を表形式の文字列にする
+
+    Args:
+        report (List[dict]): balance_reportの結果
+
+    Returns:
+        str: 集計結果の表
+    """
+    def interval(value:Tuple[float, float, float])->str:
+        return f'{value[0]:.3f} [{value[1]:.3f}, {value[2]:.3f}]'
+
+    lines = ['scenario\tlv\tpolicy\tepisodes\twin_rate\tdeath_rate\tsurvived\tturns']
+    for row in report:
+        lines.append('\t'.join([
+            row['scenario'], str(row['lv']), row['policy'], str(row['episodes']),
+            interval(row['win_rate']), interval(row['death_rate']), interval(row['survived']), interval(row['turns']),
+        ]))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='全シナリオ・全プレイヤーレベルの戦闘バランスを集計します。')
+    parser.add_argument('--data', default='battle/data/', help='Unitデータの格納先フォルダパス')
+    parser.add_argument('--episodes', type=int, default=10000, help='組み合わせごとのエピソード数')
+    parser.add_argument('--policies', nargs='+', default=list(POLICIES), choices=list(POLICIES), help='評価する方策')
+    parser.add_argument('--policy-npz', nargs='+', default=[], help='評価する学習済みモデル(export_npzで書き出したnpzファイルのパス)')
+    parser.add_argument('--workers', type=int, default=None, help='ワーカープロセス数(既定はCPUコア数)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='1タスクのエピソード数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--store', default=None, help='集計結果の保存先(入力が変わっていない組み合わせは再シミュレーションしない)')
+    args = parser.parse_args()
+
+    report = balance_report(args.data, args.episodes, args.policies + args.policy_npz, args.workers, args.chunk_size, args.seed, args.store)
+    print(format_report(report))
+    print(f'再シミュレーション: {sum(row["simulated"] for row in report)}/{len(report)} 組み合わせ')
@@ -0,0 +1,354 @@
+import argparse
+import fnmatch
+import importlib.util
+import json
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from RPGTurnBattle import Simulation
+from battle.battle import Battle
+from battle.vector import VectorBattle
+
+# 計測の設定(1回の計測の目標時間(秒)と繰り返し回数)
+TARGET_SECONDS = 0.5
+N_REPEAT = 9
+
+# 既定の比較の閾値(基準値より遅くなった割合)。実行ごとのばらつき(10～25%程度)より大きくする
+DEFAULT_THRESHOLD = 0.30
+# 計測のばらつき(相対値)の何倍まで遅くなっても許容するか
+NOISE_FACTOR = 3
+
+DATA_FOLDER_PATH = 'battle/data/'
+SEED = 0
+
+def valid_action(env:Simulation, rng:random.Random)->int:
+    """選択可能な行動からランダムに選ぶ"""
+    return rng.choice(np.flatnonzero(env.action_mask).tolist())
+
+def bench_battle_act_one_turn()->Callable[[int], None]:
+    """Battle.act_one_turn(「たたかう」)。戦闘が終わったら次の敵と遭遇する"""
+    battle = Battle(DATA_FOLDER_PATH, 'default', headless=True, rng=random.Random(SEED))
+    battle.encount()
+    attack = battle.player.commands.index('attack')
+
+    def run(n:int):
+        for _ in range(n):
+            battle.act_one_turn(attack)
+            if battle.player.hp == 0:
+                battle.reset()
+                battle.encount()
+            elif battle.enemy.hp == 0 or battle.escape:
+                battle.encount()
+    return run
+
+def bench_vector_act_one_turn()->Callable[[int], None]:
+    """VectorBattle.act_one_turn(10万戦闘をまとめて1ターン、行動はランダム)。決着した戦闘は次の敵と遭遇する"""
+    n_battles = 100000
+    battle = VectorBattle(DATA_FOLDER_PATH, 'default', n_battles, np.random.default_rng(SEED))
+    battle.reset()
+    battle.encount()
+    actions = np.random.default_rng(SEED).integers(0, len(battle.player_command_ids), n_battles)
+
+    def run(n:int):
+        for _ in range(n):
+            battle.act_one_turn(actions)
+            dead = battle.player.hp == 0
+            battle.reset(dead)
+            battle.encount(~battle.active)
+    return run
+
+def bench_battle_encount()->Callable[[int], None]:
+    """Battle.encount"""
+    battle = Battle(DATA_FOLDER_PATH, 'default', headless=True, rng=random.Random(SEED))
+
+    def run(n:int):
+        for _ in range(n):
+            battle.encount()
+    return run
+
+def bench_simulation_step()->Callable[[int], None]:
+    """Simulation.step(選択可能な行動からランダム)。終了したらresetする"""
+    env = Simulation(DATA_FOLDER_PATH, 'default', headless=True)
+    env.seed(SEED)
+    env.reset()
+    rng = random.Random(SEED)
+
+    def run(n:int):
+        for _ in range(n):
+            _, _, done, _ = env.step(valid_action(env, rng))
+            if done:
+                env.reset()
+    return run
+
+def bench_simulation_get_status()->Callable[[int], None]:
+    """Simulation.get_status(毎回新しい配列を作る)"""
+    env = Simulation(DATA_FOLDER_PATH, 'default', headless=True)
+    env.seed(SEED)
+    env.reset()
+
+    def run(n:int):
+        for _ in range(n):
+            env.get_status()
+    return run
+
+def bench_simulation_write_status()->Callable[[int], None]:
+    """Simulation.get_status(set_observation_bufferで設定した配列に書き込む)"""
+    env = Simulation(DATA_FOLDER_PATH, 'default', headless=True)
+    env.seed(SEED)
+    env.set_observation_buffer(np.zeros(len(env.reset()), dtype=np.float32))
+
+    def run(n:int):
+        for _ in range(n):
+            env.get_status()
+    return run
+
+def bench_rollout(scenario_code:str)->Callable[[], Callable[[int], None]]:
+    """1エピソード全体(選択可能な行動からランダム)"""
+    def setup()->Callable[[int], None]:
+        env = Simulation(DATA_FOLDER_PATH, scenario_code, headless=True)
+        env.seed(SEED)
+        rng = random.Random(SEED)
+
+        def run(n:int):
+            for _ in range(n):
+                env.reset()
+                done = False
+                while not done:
+                    _, _, done, _ = env.step(valid_action(env, rng))
+        return run
+    setup.__doc__ = f'1エピソード全体({scenario_code}、選択可能な行動からランダム)'
+    return setup
+
+def bench_simulation_construct()->Callable[[int], None]:
+    """Simulationの作成(データは読み込み済み)"""
+    Simulation(DATA_FOLDER_PATH, 'default', headless=True)
+
+    def run(n:int):
+        for _ in range(n):
+            Simulation(DATA_FOLDER_PATH, 'default', headless=True)
+    return run
+
+def training_player():
+    """経験再生メモリを埋めたDQNPlayer(学習の計測用)"""
+    import torch
+    from AIPlayer.DQNPlayer import DQNPlayer
+
+    torch.manual_seed(SEED)
+    random.seed(SEED)
+    env = Simulation(DATA_FOLDER_PATH, 'default', headless=True)
+    env.seed(SEED)
+    player = DQNPlayer(env)
+    player.set_learning_parameters()
+    rng = random.Random(SEED)
+    state = env.reset().copy()
+    for _ in range(player.memory.capacity):
+        action = valid_action(env, rng)
+        next_state, reward, done, _ = env.step(action)
+        player.memory.push(state, action, None if done else next_state, reward, None if done else env.action_mask)
+        state = env.reset().copy() if done else next_state.copy()
+    return player
+
+def bench_replay_push()->Callable[[int], None]:
+    """ReplayMemory.push(1件)"""
+    player = training_player()
+    state = np.ones(player.obs_size, dtype=np.float32)
+    mask = np.ones(player.n_actions, dtype=bool)
+
+    def run(n:int):
+        for _ in range(n):
+            player.memory.push(state, 0, state, 1.0, mask)
+    return run
+
+def bench_replay_sample()->Callable[[int], None]:
+    """ReplayMemory.sample(バッチサイズ128)"""
+    player = training_player()
+
+    def run(n:int):
+        for _ in range(n):
+            player.memory.sample(player.BATCH_SIZE)
+    return run
+
+def bench_optimize_model()->Callable[[int], None]:
+    """DQNPlayer.optimize_model(1回の更新)"""
+    import torch
+
+    torch.set_num_threads(1)
+    player = training_player()
+
+    def run(n:int):
+        for _ in range(n):
+            player.optimize_model()
+    return run
+
+# 計測名 -> 計測の準備(n回実行する関数を返す)
+BENCHMARKS:Dict[str, Callable[[], Callable[[int], None]]] = {
+    'battle.act_one_turn': bench_battle_act_one_turn,
+    'battle.encount': bench_battle_encount,
+    'vector.act_one_turn': bench_vector_act_one_turn,
+    'simulation.step': bench_simulation_step,
+    'simulation.get_status': bench_simulation_get_status,
+    'simulation.write_status': bench_simulation_write_status,
+    'simulation.construct': bench_simulation_construct,
+    'rollout.default': bench_rollout('default'),
+    'rollout.sample': bench_rollout('sample'),
+    'replay.push': bench_replay_push,
+    'replay.sample': bench_replay_sample,
+    'dqn.optimize_model': bench_optimize_model,
+}
+
+# torchが必要な計測(torchがインストールされていなければスキップする)
+TORCH_BENCHMARKS = ('replay.push', 'replay.sample', 'dqn.optimize_model')
+
+def measure(setup:Callable[[], Callable[[int], None]], n_repeat:int=N_REPEAT, target_seconds:float=TARGET_SECONDS)->Tuple[float, float]:
+    """1回あたりの処理時間を計測する
+
+    1回の計測がtarget_seconds程度になる回数を求めてから、n_repeat回計測した中央値を使う。
+    ばらつきは中央絶対偏差を中央値で割った値(外れ値の影響を受けにくい)。
+
+    Args:
+        setup (Callable[[], Callable[[int], None]]): 計測の準備
+        n_repeat (int, optional): 計測の繰り返し回数. Defaults to N_REPEAT.
+        target_seconds (float, optional): 1回の計測の目標時間(秒). Defaults to TARGET_SECONDS.
+
+    Returns:
+        Tuple[float, float]: 1回あたりの処理時間(秒)、計測のばらつき(相対値)
+    """
+    run = setup()
+    n = 1
+    while True:
+        start = time.perf_counter()
+        run(n)
+        elapsed = time.perf_counter() - start
+        if elapsed >= target_seconds / 10:
+            break
+        n *= 10
+    n = max(int(n * target_seconds / max(elapsed, 1e-9)), 1)
+
+    times = []
+    for _ in range(n_repeat):
+        start = time.perf_counter()
+        run(n)
+        times.append((time.perf_counter() - start) / n)
+    median = float(np.median(times))
+    return median, float(np.median(np.abs(np.array(times) - median))) / median
+
+def run_benchmarks(pattern:str='*', n_repeat:int=N_REPEAT)->Tuple[Dict[str, float], Dict[str, float]]:
+    """計測名がpatternに一致する計測を実行する
+
+    torchがインストールされていない場合、torchが必要な計測はスキップする。
+
+    Args:
+        pattern (str, optional): 計測名のパターン(fnmatch形式). Defaults to '*'.
+        n_repeat (int, optional): 計測の繰り返し回数. Defaults to N_REPEAT.
+
+    Returns:
+        Tuple[Dict[str, float], Dict[str, float]]: 計測名 -> 1回あたりの処理時間(秒)、計測名 -> 計測のばらつき(相対値)
+    """
+    has_torch = importlib.util.find_spec('torch') is not None
+    results = {}
+    noises = {}
+    for name, setup in BENCHMARKS.items():
+        if fnmatch.fnmatch(name, pattern):
+            if name in TORCH_BENCHMARKS and not has_torch:
+                print(f'{name}: torchがインストールされていないためスキップします', file=sys.stderr)
+                continue
+            results[name], noises[name] = measure(setup, n_repeat)
+            print(f'{name}: {results[name] * 1e6:.2f} us (±{noises[name]:.1%})', file=sys.stderr)
+    return results, noises
+
+def allowed_ratio(name:str, threshold:float, noises:Dict[str, float], baseline_noises:Dict[str, float])->float:
+    """基準値に対して許容する処理時間の比を求める
+
+    今回と基準値の計測のばらつきが大きい場合は、ばらつきのNOISE_FACTOR倍まで閾値を広げる。
+
+    Args:
+        name (str): 計測名
+        threshold (float): 許容する遅くなった割合
+        noises (Dict[str, float]): 今回の計測のばらつき
+        baseline_noises (Dict[str, float]): 基準値の計測のばらつき
+
+    Returns:
+        float: 許容する処理時間の比
+    """
+    noise = noises.get(name, 0) + baseline_noises.get(name, 0)
+    return 1 + max(threshold, NOISE_FACTOR * noise)
+
+def compare(results:Dict[str, float], baseline:Dict[str, float], threshold:float, noises:Dict[str, float]=None, baseline_noises:Dict[str, float]=None)->List[str]:
+    """基準値と比較し、threshold(ばらつきが大きい場合はその分広げた割合)以上遅くなった計測名を返す
+
+    Args:
+        results (Dict[str, float]): 今回の計測結果
+        baseline (Dict[str, float]): 基準値
+        threshold (float): 許容する遅くなった割合
+        noises (Dict[str, float], optional): 今回の計測のばらつき. Defaults to None.
+        baseline_noises (Dict[str, float], optional): 基準値の計測のばらつき. Defaults to None.
+
+    Returns:
+        List[str]: 遅くなった計測名
+    """
+    noises = noises or {}
+    baseline_noises = baseline_noises or {}
+    return [name for name, seconds in results.items()
+            if name in baseline and seconds > baseline[name] * allowed_ratio(name, threshold, noises, baseline_noises)]
+
+def format_results(results:Dict[str, float], baseline:Dict[str, float]=None, threshold:float=DEFAULT_THRESHOLD, noises:Dict[str, float]=None, baseline_noises:Dict[str, float]=None)->str:
+    """計測結果を表形式の文字列にする
+
+    Args:
+        results (Dict[str, float]): 計測結果
+        baseline (Dict[str, float], optional): 基準値. Defaults to None.
+        threshold (float, optional): 許容する遅くなった割合. Defaults to DEFAULT_THRESHOLD.
+        noises (Dict[str, float], optional): 今回の計測のばらつき. Defaults to None.
+        baseline_noises (Dict[str, float], optional): 基準値の計測のばらつき. Defaults to None.
+
+    Returns:
+        str: 計測結果の表
+    """
+    noises = noises or {}
+    lines = ['benchmark\ttime_us\tops_per_sec\tnoise' + ('\tbaseline_us\tratio\tstatus' if baseline is not None else '')]
+    regressions = compare(results, baseline, threshold, noises, baseline_noises) if baseline is not None else []
+    for name, seconds in results.items():
+        noise = f'{noises[name]:.3f}' if name in noises else '-'
+        line = f'{name}\t{seconds * 1e6:.2f}\t{1 / seconds:.0f}\t{noise}'
+        if baseline is not None:
+            if name in baseline:
+                status = 'REGRESSION' if name in regressions else 'ok'
+                line += f'\t{baseline[name] * 1e6:.2f}\t{seconds / baseline[name]:.3f}\t{status}'
+            else:
+                line += '\t-\t-\tnew'
+        lines.append(line)
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='戦闘処理・環境・学習の主要な処理の速度を計測します。')
+    parser.add_argument('--filter', default='*', help='実行する計測名のパターン(例: "simulation.*")')
+    parser.add_argument('--repeat', type=int, default=N_REPEAT, help='計測の繰り返し回数')
+    parser.add_argument('--save', default=None, help='計測結果を基準値として保存するJSONファイル')
+    parser.add_argument('--compare', default=None, help='比較する基準値のJSONファイル')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='遅くなったと判定する割合')
+    args = parser.parse_args()
+
+    results, noises = run_benchmarks(args.filter, args.repeat)
+
+    baseline = None
+    baseline_noises = None
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        baseline = saved['results']
+        # ばらつきを保存していない基準値は、ばらつきなしとして比較する
+        baseline_noises = saved.get('noises', {})
+    print(format_results(results, baseline, args.threshold, noises, baseline_noises))
+
+    if args.save is not None:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results, 'noises': noises}, f, indent=1)
+
+    # 遅くなった計測があれば終了コード1で終了する(CIで検出するため)
+    if baseline is not None and compare(results, baseline, args.threshold, noises, baseline_noises):
+        sys.exit(1)
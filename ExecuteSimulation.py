@@ -1,18 +1,179 @@
+import argparse
+import json
+import random
+import sys
+from typing import Dict, Iterable, Sequence
+
 import RPGTurnBattle as RPG
+from BalanceReport import POLICIES
+from battle.content import load_content
+from battle.event import Outcome
+
+def play_interactive(data_folder_path:str='battle/data/'):
+    """人間がコマンドを入力して1エピソードプレイする
+
+    Args:
+        data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+    """
+    print(f'ターン制RPG戦闘シミュレーションを開始します。')
+    env = RPG.Simulation(data_folder_path, headless=True)
+    env.reset()
+    total_r = 0
+    print(f'\n{env.battle.enemy.name} が出現しました。コマンドを選択してください。')
+    while True:
+        action = int(input(env.render_command_list() + '\n'))
+        state, reward, done, _ = env.step(action)
+        print(env.render_message())
+        #print(state) # AIに渡すステータス
+        total_r += reward
+        if done:
+            break
+
+        print(env.render())
+    print(f'獲得報酬：{total_r}')
+
+def play_script(env:RPG.Simulation, job:dict)->dict:
+    """行動スクリプトまたは方策で1エピソードプレイし、結果を返す
+
+    Args:
+        env (RPG.Simulation): 環境(メッセージは生成しない)
+        job (dict): seed(乱数シード)と、actions(行動のindexまたはコマンド名のリスト)かpolicy(POLICIESのキー)
+
+    Returns:
+        dict: エピソードの結果
+    """
+    seed = job.get('seed', 0)
+    env.seed(seed)
+    env.reset()
+    commands = env.battle.player.commands
+
+    if 'actions' in job:
+        # コマンド名はプレイヤーのコマンドのindexに変換する
+        unknown = [a for a in job['actions'] if isinstance(a, str) and a not in commands]
+        if unknown:
+            raise ValueError(f'プレイヤーが使えないコマンドです: {", ".join(unknown)}')
+        # 負のindexは末尾のコマンドになってしまうので受け付けない(コマンド数以上は「様子を見る」になる)
+        negative = [str(a) for a in job['actions'] if isinstance(a, int) and a < 0]
+        if negative:
+            raise ValueError(f'行動のindexは0以上で指定してください: {", ".join(negative)}')
+        actions = iter([commands.index(a) if isinstance(a, str) else a for a in job['actions']])
+        policy = lambda env, rng: next(actions, None)
+    else:
+        policy = POLICIES[job['policy']]
+    rng = random.Random(seed)
+
+    total_reward = 0
+    wins = 0
+    escapes = 0
+    turns = 0
+    done = False
+    while not done:
+        action = policy(env, rng)
+        if action is None:
+            # スクリプトの行動が終わった
+            break
+        _, reward, done, _ = env.step(action)
+        total_reward += reward
+        turns += 1
+        if env.outcome == Outcome.DEFEAT:
+            wins += 1
+        elif env.outcome == Outcome.ESCAPE:
+            escapes += 1
+
+    return {
+        'total_reward': total_reward,
+        'done': done,
+        'dead': env.battle.player.hp == 0,
+        'battles': env.n_battle,
+        'wins': wins,
+        'escapes': escapes,
+        'turns': turns,
+    }
+
+def validate_job(job, scenario_codes:Sequence[str]=None)->None:
+    """ジョブの形式を確かめる
+
+    Args:
+        job: JSONとして読み込んだジョブ
+        scenario_codes (Sequence[str], optional): 指定できるシナリオ. Defaults to None(シナリオ名は確かめない).
+
+    Raises:
+        ValueError: ジョブの形式が正しくない
+    """
+    if not isinstance(job, dict):
+        raise ValueError('ジョブはJSONオブジェクトで指定してください')
+    seed = job.get('seed', 0)
+    if not isinstance(seed, int) or isinstance(seed, bool):
+        raise ValueError('seed は整数で指定してください')
+    if not isinstance(job.get('scenario', ''), str):
+        raise ValueError('scenario は文字列で指定してください')
+    if scenario_codes is not None and 'scenario' in job and job['scenario'] not in scenario_codes:
+        raise ValueError(f'存在しないシナリオです: {job["scenario"]}({", ".join(scenario_codes)} のいずれかを指定してください)')
+    if 'actions' in job:
+        actions = job['actions']
+        if not isinstance(actions, list) or not all(isinstance(a, str) or (isinstance(a, int) and not isinstance(a, bool)) for a in actions):
+            raise ValueError('actions は行動のindexまたはコマンド名のリストで指定してください')
+    elif not isinstance(job.get('policy'), str) or job['policy'] not in POLICIES:
+        raise ValueError(f'actions か policy({", ".join(POLICIES)}) を指定してください')
+
+def play_batch(lines:Iterable[str], data_folder_path:str='battle/data/', scenario_code:str='default', out=sys.stdout)->int:
+    """JSONL形式のジョブをすべてプレイし、エピソードごとの結果を1行のJSONとして書き出す
+
+    ジョブの形式: {"id": 任意, "seed": 乱数シード, "scenario": シナリオ(省略時はscenario_code),
+    "actions": [行動のindexまたはコマンド名, ...] または "policy": 方策名}
+    形式が正しくないジョブは、その行の結果としてerrorを書き出して次のジョブに進む。
+    結果は1ジョブごとに書き出してフラッシュする。
+
+    Args:
+        lines (Iterable[str]): ジョブの各行
+        data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+        scenario_code (str, optional): 既定のシナリオ. Defaults to 'default'.
+        out (optional): 結果の書き出し先. Defaults to sys.stdout.
+
+    Returns:
+        int: エラーになったジョブの数
+
+    Raises:
+        ValueError: 既定のシナリオが存在しない
+    """
+    scenario_codes = [scenario.scenario_code for scenario in load_content(data_folder_path).scenarios]
+    if scenario_code not in scenario_codes:
+        raise ValueError(f'存在しないシナリオです: {scenario_code}({", ".join(scenario_codes)} のいずれかを指定してください)')
+    # シナリオごとに環境を1度だけ作成する
+    envs:Dict[str, RPG.Simulation] = {}
+    n_error = 0
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = {'line': line_no}
+        try:
+            job = json.loads(line)
+            if isinstance(job, dict):
+                record['id'] = job.get('id')
+            validate_job(job, scenario_codes)
+            record.update(seed=job.get('seed', 0), scenario=job.get('scenario', scenario_code))
+            if record['scenario'] not in envs:
+                envs[record['scenario']] = RPG.Simulation(data_folder_path, record['scenario'], headless=True)
+            record.update(play_script(envs[record['scenario']], job))
+        except (ValueError, IndexError, KeyError) as e:
+            record['error'] = str(e)
+            n_error += 1
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        out.flush()
+    return n_error
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ターン制RPG戦闘シミュレーションを実行します。')
+    parser.add_argument('--data', default='battle/data/', help='Unitデータの格納先フォルダパス')
+    parser.add_argument('--batch', default=None, help='行動スクリプトのJSONLファイル("-"で標準入力)。指定した場合は結果をJSONLで標準出力に書き出す')
+    parser.add_argument('--scenario', default='default', help='バッチモードの既定のシナリオ')
+    args = parser.parse_args()
 
-print(f'ターン制RPG戦闘シミュレーションを開始します。')
-env = RPG.Simulation('battle/data/')
-env.reset()
-total_r = 0
-print(f'\n{env.battle.enemy.name} が出現しました。コマンドを選択してください。')
-while True:
-    action = int(input(env.render_command_list() + '\n'))
-    state, reward, done, message = env.step(action)
-    print(message)
-    #print(state) # AIに渡すステータス
-    total_r += reward
-    if done:
-        break
-
-    print(env.render())
-print(f'獲得報酬：{total_r}')
+    if args.batch is None:
+        play_interactive(args.data)
+    elif args.batch == '-':
+        sys.exit(1 if play_batch(sys.stdin, args.data, args.scenario) else 0)
+    else:
+        with open(args.batch, 'r', encoding='utf-8') as f:
+            sys.exit(1 if play_batch(f, args.data, args.scenario) else 0)
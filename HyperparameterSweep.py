@@ -0,0 +1,235 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import random
+import statistics
+from multiprocessing import Manager, Pool
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from RPGTurnBattle import Simulation
+from AIPlayer.DQNPlayer import DQNPlayer
+
+# 探索しないパラメータの値(DQNPlayerの既定値)
+DEFAULT_PARAMS = {
+    'batch_size': 128,
+    'gamma': 0.99,
+    'eps_decay': 0.9,                       # 訓練エピソード数に対する割合
+    'target_update': 10,
+    'n_hidden_channels': 100,
+}
+
+# 探索するパラメータ -> 候補の値
+DEFAULT_SPACE = {
+    'batch_size': [32, 64, 128],
+    'gamma': [0.9, 0.95, 0.99],
+    'eps_decay': [0.3, 0.6, 0.9],           # 訓練エピソード数に対する割合
+    'target_update': [5, 10, 20],
+    'n_hidden_channels': [50, 100, 200],
+}
+
+# 評価に使う環境の乱数シード(全試行で同じ戦闘で比較する)
+EVAL_SEED = 12345
+
+def validate_space(space:Dict[str, list])->None:
+    """探索するパラメータがDEFAULT_PARAMSのいずれかであることを確かめる
+
+    Args:
+        space (Dict[str, list]): パラメータ -> 候補の値
+
+    Raises:
+        ValueError: 探索できないパラメータが含まれている
+    """
+    unknown = [name for name in space if name not in DEFAULT_PARAMS]
+    if unknown:
+        raise ValueError(f'探索できないパラメータです: {", ".join(unknown)}({", ".join(DEFAULT_PARAMS)} のいずれかを指定してください)')
+
+def grid_trials(space:Dict[str, list])->List[dict]:
+    """グリッドサーチの試行(全組み合わせ)
+
+    Args:
+        space (Dict[str, list]): パラメータ -> 候補の値
+
+    Returns:
+        List[dict]: 試行ごとのパラメータ
+
+    Raises:
+        ValueError: 探索できないパラメータが含まれている
+    """
+    validate_space(space)
+    names = list(space)
+    return [{**DEFAULT_PARAMS, **dict(zip(names, values))} for values in itertools.product(*(space[name] for name in names))]
+
+def random_trials(space:Dict[str, list], n_trials:int, seed:int)->List[dict]:
+    """ランダムサーチの試行(各パラメータを候補から一様に選ぶ)
+
+    Args:
+        space (Dict[str, list]): パラメータ -> 候補の値
+        n_trials (int): 試行数
+        seed (int): 乱数シード
+
+    Returns:
+        List[dict]: 試行ごとのパラメータ
+
+    Raises:
+        ValueError: 探索できないパラメータが含まれている
+    """
+    validate_space(space)
+    rng = random.Random(seed)
+    return [{**DEFAULT_PARAMS, **{name: rng.choice(values) for name, values in space.items()}} for _ in range(n_trials)]
+
+def should_prune(reports:dict, lock, i_episode:int, score:float, min_reports:int)->bool:
+    """同じエピソード数で先に評価された試行の中央値を下回る試行を打ち切る(中央値による枝刈り)
+
+    Args:
+        reports (dict): エピソード数 -> 評価値のリスト(プロセス間で共有する)
+        lock: reportsの読み書き用ロック
+        i_episode (int): 評価時点の訓練エピソード数
+        score (float): 評価値
+        min_reports (int): 枝刈りを始める評価値の数
+
+    Returns:
+        bool: 打ち切る
+    """
+    with lock:
+        scores = reports.get(i_episode, [])
+        # 共有dictの値は置き換えないとプロセス間で反映されない
+        reports[i_episode] = scores + [score]
+    return len(scores) >= min_reports and score < statistics.median(scores)
+
+def run_trial(task:tuple)->dict:
+    """ワーカープロセスで1つの試行の訓練と評価を行う
+
+    eval_intervalエピソードごとにtestで評価し、他の試行より明らかに悪ければ訓練を打ち切る。
+
+    Args:
+        task (tuple): 試行番号, パラメータ, データフォルダ, シナリオ, 訓練エピソード数, 評価間隔, 評価エピソード数,
+            乱数シード, 共有の評価値, ロック, 枝刈りを始める評価値の数
+
+    Returns:
+        dict: 試行の結果
+    """
+    (trial, params, data_folder_path, scenario_code, num_episodes, eval_interval, n_eval_episode,
+     seed, reports, lock, min_reports) = task
+
+    # 試行ごとに1コアを使う
+    torch.set_num_threads(1)
+    torch.manual_seed(seed)
+    random.seed(seed)
+
+    env = Simulation(data_folder_path, scenario_code, headless=True)
+    env.seed(seed)
+    player = DQNPlayer(env, params['n_hidden_channels'])
+    player.set_learning_parameters(
+        batch_size=params['batch_size'],
+        gamma=params['gamma'],
+        eps_decay=max(int(params['eps_decay'] * num_episodes), 1),
+        target_update=params['target_update'],
+        num_episodes=num_episodes,
+    )
+    test_env = Simulation(data_folder_path, scenario_code, headless=True)
+
+    result = dict(trial=trial, **params, episodes=0, score=float('nan'), deaths=0, pruned=False)
+    while player.i_episode < num_episodes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            player.training(n_episodes=eval_interval)
+        test_env.seed(EVAL_SEED)
+        rewards, deaths = player.test(test_env, n_eval_episode)
+        result.update(episodes=player.i_episode, score=float(np.mean(rewards)), deaths=deaths)
+        if player.i_episode < num_episodes and should_prune(reports, lock, player.i_episode, result['score'], min_reports):
+            result['pruned'] = True
+            break
+    return result
+
+def sweep(trials:List[dict], data_folder_path:str, scenario_code:str, num_episodes:int, eval_interval:int,
+          n_eval_episode:int, n_workers:int=None, seed:int=0, min_reports:int=3)->List[dict]:
+    """試行をプロセスプールで並列に実行し、評価値の高い順に並べる
+
+    Args:
+        trials (List[dict]): 試行ごとのパラメータ
+        data_folder_path (str): Unitデータの格納先フォルダパス
+        scenario_code (str): ゲームのシナリオ
+        num_episodes (int): 試行ごとの訓練エピソード数
+        eval_interval (int): 評価するエピソード数の間隔
+        n_eval_episode (int): 1回の評価のエピソード数
+        n_workers (int, optional): ワーカープロセス数. Defaults to None(CPUコア数).
+        seed (int, optional): 乱数シード. Defaults to 0.
+        min_reports (int, optional): 枝刈りを始める評価値の数. Defaults to 3.
+
+    Returns:
+        List[dict]: 試行の結果(最後まで訓練した試行を評価値の高い順、その後に打ち切った試行)
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(len(trials)).tolist()
+    with Manager() as manager:
+        reports = manager.dict()
+        lock = manager.Lock()
+        tasks = [(trial, params, data_folder_path, scenario_code, num_episodes, eval_interval, n_eval_episode,
+                  trial_seed, reports, lock, min_reports)
+                 for trial, (params, trial_seed) in enumerate(zip(trials, seeds))]
+        results = []
+        with Pool(n_workers) as pool:
+            for result in pool.imap_unordered(run_trial, tasks):
+                status = 'pruned' if result['pruned'] else 'done'
+                print(f"trial {result['trial']} {status} at {result['episodes']} episode: {result['score']:.3f}")
+                results.append(result)
+    return rank_results(results)
+
+def rank_results(results:List[dict])->List[dict]:
+    """試行の結果を最後まで訓練した試行を評価値の高い順、その後に打ち切った試行(訓練の長い順)に並べる
+
+    Args:
+        results (List[dict]): 試行の結果
+
+    Returns:
+        List[dict]: 並べ替えた試行の結果
+    """
+    return sorted(results, key=lambda x: (x['pruned'], -x['episodes'], -x['score']))
+
+def format_results(results:List[dict])->str:
+    """試行の結果を順位付きの表形式の文字列にする
+
+    Args:
+        results (List[dict]): sweepの結果
+
+    Returns:
+        str: 試行の結果の表
+    """
+    columns = ['trial'] + list(DEFAULT_PARAMS) + ['episodes', 'score', 'deaths', 'pruned']
+    lines = ['\t'.join(['rank'] + columns)]
+    for rank, result in enumerate(results, 1):
+        values = [f'{result[c]:.3f}' if c == 'score' else str(result[c]) for c in columns]
+        lines.append('\t'.join([str(rank)] + values))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DQNPlayerの学習パラメータを並列に探索します。')
+    parser.add_argument('--data', default='battle/data/', help='Unitデータの格納先フォルダパス')
+    parser.add_argument('--scenario', default='default', help='ゲームのシナリオ')
+    parser.add_argument('--space', default=None, help='探索するパラメータと候補の値のJSONファイル(既定はDEFAULT_SPACE、含まないパラメータはDEFAULT_PARAMS)')
+    parser.add_argument('--trials', type=int, default=None, help='ランダムサーチの試行数(省略した場合はグリッドサーチ)')
+    parser.add_argument('--episodes', type=int, default=300, help='試行ごとの訓練エピソード数')
+    parser.add_argument('--eval-interval', type=int, default=50, help='評価するエピソード数の間隔')
+    parser.add_argument('--eval-episodes', type=int, default=100, help='1回の評価のエピソード数')
+    parser.add_argument('--min-reports', type=int, default=3, help='枝刈りを始める評価値の数')
+    parser.add_argument('--workers', type=int, default=None, help='ワーカープロセス数(既定はCPUコア数)')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--output', default=None, help='結果の表の保存先ファイルパス')
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space is not None:
+        with open(args.space, 'r', encoding='utf-8') as f:
+            space = json.load(f)
+    trials = grid_trials(space) if args.trials is None else random_trials(space, args.trials, args.seed)
+
+    results = sweep(trials, args.data, args.scenario, args.episodes, args.eval_interval, args.eval_episodes,
+                    args.workers, args.seed, args.min_reports)
+    table = format_results(results)
+    print(table)
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(table + '\n')
@@ -1,3 +1,4 @@
+import copy
 import sys
 import random
 from typing import Tuple
@@ -5,26 +6,61 @@ from typing import Tuple
 import numpy as np
 
 from battle.battle import Battle
-from battle.command import PlayerCommands
+from battle.command import PlayerCommands, Spell
+from battle.event import PLAYER_NO, EventCode, Outcome
+from battle.trace import TraceWriter, state_checksum
+
+# 記録中のエピソードの属性(複製した環境には引き継がない)
+TRACE_ATTRIBUTES = ('trace', 'trace_seed', 'trace_actions', 'trace_checksums')
 
 class Simulation:
 
-    def __init__(self, data_folder_path:str='battle/data/', scenario_code:str='default'):
+    def __init__(self, data_folder_path:str='battle/data/', scenario_code:str='default', headless:bool=False, rng=None, player_lv:int=None):
         """コンストラクタ
 
         Args:
             data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'Lv3/battle/data/'.
             scenario (str, optional): ゲームのシナリオ. Defaults to 'default'.
+            headless (bool, optional): stepでバトルメッセージを生成しない. Defaults to False.
+            rng (optional): この環境専用の乱数生成器(random.Random互換、battle.rng.BlockRandom等). Defaults to None(新しいrandom.Random).
+            player_lv (int, optional): プレイヤーのレベル. Defaults to None(シナリオのレベル).
         """
         self.data_folder_path = data_folder_path
+        self.scenario_code = scenario_code
+        self.player_lv = player_lv
+        # headlessの場合、メッセージはrender_messageで必要な時だけ生成する
+        self.headless = headless
 
         self.n_battle = 0
         self.message = ''
         self.total_damage = 0 # 現在の敵に与えたダメージの合計
         self.is_firat_attack = True
+        # 直前のstepで戦闘が終わった結果(Outcome)
+        self.outcome = Outcome.NONE
+
+        # 状態の書き込み先(set_observation_bufferで設定した場合のみ使用する)
+        self.observation = None
+        # 状態の書き込み先に敵のステータスを書き込み済みの敵
+        self.observation_enemy = None
+
+        # エピソードの記録先(set_traceで設定した場合のみ使用する)と、記録中のエピソード
+        self.trace = None
+        self.trace_seed = None
+        self.trace_actions = None
+        self.trace_checksums = None
 
         # 戦闘データ読み込み
-        self.battle = Battle(self.data_folder_path, scenario_code)
+        # メッセージは1ステップ分のイベントからまとめて生成するため、Battleは常にheadlessで動かす
+        self.rng = rng if rng is not None else random.Random()
+        self.battle = Battle(self.data_folder_path, scenario_code, headless=True, rng=self.rng, player_lv=player_lv)
+
+        # 行動ごとの消費MP(呪文以外はNone)と、現在選択して意味のある行動
+        self.action_mp = [PlayerCommands[key].used_mp if isinstance(PlayerCommands[key], Spell) else None for key in self.battle.player.commands]
+        self.action_mask = np.ones(len(self.action_mp), dtype=bool)
+        # 選択可否はプレイヤーのMPと呪文の封印だけで決まるので、その組み合わせごとに作った配列を使い回す
+        # (キーは封印中なら-1、それ以外はMP。action_mask_keyはaction_maskに書き込み済みのキー)
+        self.action_mask_cache = {}
+        self.action_mask_key = None
 
     def reset(self)->np.array:
         """環境を初期化する
@@ -36,53 +72,90 @@ class Simulation:
             np.array: 最初の状態
         """
 
+        if self.trace is not None:
+            self.start_trace()
+
         # 戦闘回数リセット
         self.n_battle = 0
+        self.outcome = Outcome.NONE
 
         # 戦闘準備
         self.battle.reset()
 
         # 最初の敵と遭遇
         self.battle.encount()
+        self.battle.events.clear()
 
+        self.action_mask_key = None
+        self.update_action_mask()
         return self.get_status()
 
     def step(self, action:int)->Tuple[np.array, int, bool, str]:
         """行動選択1回分、戦闘を進める
 
+        戦闘が終わった結果(勝利・逃走・死亡)はoutcomeに格納する。
+
         Args:
             action (int): プレイヤーの行動
 
         Returns:
-            Tuple[np.array, int, bool, str]: 状態、報酬、エピソード終端、戦闘結果メッセージ
+            Tuple[np.array, int, bool, str]: 状態、報酬、エピソード終端、戦闘結果メッセージ(headlessの場合は空文字)
+
+        Raises:
+            ValueError: 記録中に、1バイトで記録できない行動のindexを指定した
         """        
+        # 記録は行動を1バイトで持つので、戦闘を進める前に確かめる
+        # (使えないコマンドのindexは「様子を見る」として記録・再現できる)
+        if self.trace_actions is not None and not 0 <= action <= 255:
+            raise ValueError(f'記録中の行動のindexは0～255で指定してください: {action}')
         reward = 0
         done = False
+        outcome = Outcome.NONE
         # 行動選択して1ターン戦闘を進める
-        message = self.battle.act_one_turn(action)
+        battle = self.battle
+        battle.act_one_turn(action)
+        events = battle.events
 
         # 10回戦闘終了、またはプレイヤー死亡で終了
-        if self.battle.player.hp == 0:
-            message += f'\nあなたは死んでしまいました。'
+        if battle.player.hp == 0:
+            events.append(PLAYER_NO, battle.enemy_no, EventCode.DEAD)
             reward -= 20
             done = True
-        elif(self.battle.enemy.hp == 0 or self.battle.escape):
-            if not self.battle.escape:
-                message += f'\n\n{self.battle.enemy.name} を倒した！'
+            outcome = Outcome.DEAD
+        elif(battle.enemy.hp == 0 or battle.escape):
+            if battle.escape:
+                outcome = Outcome.ESCAPE
+            else:
+                events.append(PLAYER_NO, battle.enemy_no, EventCode.DEFEAT)
                 reward += 1
+                outcome = Outcome.DEFEAT
             self.n_battle += 1
-            self.battle.player.recovery_battle_condition()
+            battle.player.recovery_battle_condition()
             if self.n_battle < 10:
-                message += f'\n残り戦闘回数： {10 - self.n_battle} 回'
-                self.battle.encount()
-                message += f'\n\n新たに {self.battle.enemy.name} が出現しました。コマンドを選択してください。'
+                events.append(PLAYER_NO, battle.enemy_no, EventCode.REMAINING, 10 - self.n_battle)
+                battle.encount()
+                events.append(PLAYER_NO, battle.enemy_no, EventCode.APPEAR)
             else:
-                message += f'\n\n敵を 10 体倒しました！ シミュレーションを終了します。'
+                events.append(PLAYER_NO, battle.enemy_no, EventCode.COMPLETE, self.n_battle)
                 reward += 10
                 done = True
+        self.outcome = outcome
+
+        self.update_action_mask()
+
+        message = ''
+        if not self.headless:
+            message = self.render_message()
 
         # 1ターンの結果を返す(state, reward, done, info)
-        return self.get_status(), reward, done, message
+        state = self.get_status()
+        if self.trace_actions is not None:
+            self.trace_actions.append(action)
+            if self.trace_checksums is not None:
+                self.trace_checksums.append(state_checksum(state))
+            if done:
+                self.flush_trace(complete=True)
+        return state, reward, done, message
 
     def render(self)->str:
         """現在の状態を表示する
@@ -95,36 +168,98 @@ class Simulation:
         message += f'\nモンスター：{self.battle.enemy.name}'
         return message
 
+    def render_message(self)->str:
+        """直前のstepの戦闘結果メッセージを生成する
+
+        Returns:
+            str: 戦闘結果メッセージ
+        """
+        return self.battle.render_events()
+
     def get_status(self)->np.array:
         """現在の状態を取得する
 
+        set_observation_bufferで書き込み先を設定している場合は、新しい配列を作らずに書き込み先を更新して返す。
+
         Returns:
             np.array: 状態
         """
+        if self.observation is not None:
+            return self.write_status(self.observation)
+
+        player = self.battle.player
+        enemy = self.battle.enemy
         l = [
-            self.battle.player.max_hp,
-            self.battle.player.hp,
-            self.battle.player.mp,
-            self.battle.player.attack,
-            self.battle.player.difense,
-            self.battle.player.speed,
-            int(self.battle.player.seal_spell),
-            int(self.battle.player.sleep),
-            self.battle.enemy.max_hp,
-            self.battle.enemy.attack,
-            self.battle.enemy.difense,
-            self.battle.enemy.speed,
-            int(self.battle.enemy.seal_spell),
-            int(self.battle.enemy.sleep),
+            player.max_hp,
+            player.hp,
+            player.mp,
+            player.attack,
+            player.difense,
+            player.speed,
+            int(player.seal_spell),
+            int(player.sleep),
+            enemy.max_hp,
+            enemy.attack,
+            enemy.difense,
+            enemy.speed,
+            int(enemy.seal_spell),
+            int(enemy.sleep),
             self.battle.total_damage,
             self.n_battle
         ]
 
         l.extend(
-            self.battle.enemy.command_pattern
+            enemy.command_pattern
         )
         return np.array(l)
 
+    def set_observation_buffer(self, buffer:np.ndarray=None)->None:
+        """状態の書き込み先を設定する
+
+        設定すると、get_status(reset・stepの戻り値を含む)は毎回同じ書き込み先を更新して返す。
+        書き込み先はバッチ配列の1行やtorch.Tensorのnumpy()でもよい。
+
+        Args:
+            buffer (np.ndarray, optional): 状態の要素数の1次元配列(float32など). Defaults to None(毎回新しい配列を返す).
+        """
+        self.observation = buffer
+        self.observation_enemy = None
+
+    def write_status(self, out:np.ndarray)->np.ndarray:
+        """現在の状態を配列に書き込む
+
+        戦闘中に変化しないステータスは、敵が変わった場合のみ書き込む。
+
+        Args:
+            out (np.ndarray): 書き込み先(get_statusと同じ並び)
+
+        Returns:
+            np.ndarray: 書き込み先
+        """
+        player = self.battle.player
+        enemy = self.battle.enemy
+        if self.observation_enemy is not enemy:
+            out[0] = player.max_hp
+            out[3] = player.attack
+            out[4] = player.difense
+            out[5] = player.speed
+            out[8] = enemy.max_hp
+            out[9] = enemy.attack
+            out[10] = enemy.difense
+            out[11] = enemy.speed
+            out[16:] = enemy.command_pattern
+            self.observation_enemy = enemy
+
+        out[1] = player.hp
+        out[2] = player.mp
+        out[6] = player.seal_spell
+        out[7] = player.sleep
+        out[12] = enemy.seal_spell
+        out[13] = enemy.sleep
+        out[14] = self.battle.total_damage
+        out[15] = self.n_battle
+        return out
+
     def get_n_actions(self)->int:
         """選択可能な行動数を取得する
 
@@ -133,6 +268,37 @@ class Simulation:
         """
         return len(self.battle.player.commands)
 
+    def get_action_mask(self, out:np.ndarray=None)->np.ndarray:
+        """選択して意味のある行動(呪文は封印されておらずMPが足りるもの)を取得する
+
+        reset・stepの後はaction_maskにも同じ値が格納されている。
+
+        Args:
+            out (np.ndarray, optional): 書き込み先(行動数のbool配列). Defaults to None(新しい配列を返す).
+
+        Returns:
+            np.ndarray: 行動ごとの選択可否
+        """
+        player = self.battle.player
+        key = -1 if player.seal_spell else player.mp
+        mask = self.action_mask_cache.get(key)
+        if mask is None:
+            mask = np.array([used_mp is None or (key >= 0 and key >= used_mp) for used_mp in self.action_mp], dtype=bool)
+            mask.flags.writeable = False
+            self.action_mask_cache[key] = mask
+        if out is None:
+            return mask.copy()
+        out[:] = mask
+        return out
+
+    def update_action_mask(self):
+        """action_maskを現在の状態に更新する(MPと呪文の封印が前回から変わっていなければ何もしない)"""
+        player = self.battle.player
+        key = -1 if player.seal_spell else player.mp
+        if key != self.action_mask_key:
+            self.get_action_mask(self.action_mask)
+            self.action_mask_key = key
+
     def render_command_list(self)->str:
         """人間のプレイヤー向けにコマンドリストを表示する。
 
@@ -145,10 +311,93 @@ class Simulation:
             message += f'{PlayerCommands[command].name}:{i}, '
         return message
 
+    def snapshot(self, include_rng:bool=True)->tuple:
+        """現在の状態を取得する
+
+        deepcopyと異なり、ユニットのステータスのうち戦闘中に変化するものと乱数の状態だけを保持する。
+
+        Args:
+            include_rng (bool, optional): 乱数の状態も取得する. Defaults to True.
+
+        Returns:
+            tuple: 戦闘の状態、戦闘回数、戦闘の結果、乱数の状態(取得しない場合はNone)
+        """
+        rng_state = self.rng.getstate() if include_rng else None
+        return self.battle.snapshot(), self.n_battle, self.outcome, rng_state
+
+    def restore(self, snap:tuple, restore_rng:bool=True)->None:
+        """snapshotで取得した状態に戻す
+
+        Args:
+            snap (tuple): snapshotで取得した状態
+            restore_rng (bool, optional): 乱数の状態も戻す. Defaults to True.
+                探索で未来の乱数を知らずに先読みする場合はFalseにする。
+        """
+        battle_snap, self.n_battle, self.outcome, rng_state = snap
+        self.battle.restore(battle_snap)
+        # 戻した状態のMPと封印状態で、使えるコマンドを計算し直す
+        self.action_mask_key = None
+        self.update_action_mask()
+        if restore_rng and rng_state is not None:
+            self.rng.setstate(rng_state)
+
+    def __deepcopy__(self, memo:dict)->'Simulation':
+        """記録先(開いているファイル)を除いて複製する(複製した環境は記録しない)
+
+        Args:
+            memo (dict): copy.deepcopyの複製済みオブジェクト
+
+        Returns:
+            Simulation: 複製した環境
+        """
+        copied = type(self).__new__(type(self))
+        memo[id(self)] = copied
+        for key, value in self.__dict__.items():
+            if key in TRACE_ATTRIBUTES:
+                value = None
+            setattr(copied, key, copy.deepcopy(value, memo))
+        return copied
+
+    def set_trace(self, writer:TraceWriter=None)->None:
+        """エピソードの記録先を設定する
+
+        設定すると、resetごとにこの環境の乱数から新しい乱数シードを引いて乱数を固定し直し、
+        そのシードと行動の列(とステップ後の状態のチェックサム)を1エピソードずつ記録する。
+        そのため、記録を設定すると設定しない場合と乱数の系列が変わる(seedで固定した場合も記録は再現できる)。
+
+        Args:
+            writer (TraceWriter, optional): この環境で作成した記録先. Defaults to None(記録しない).
+        """
+        if self.trace is not None:
+            self.flush_trace(complete=False)
+        self.trace = writer
+
+    def start_trace(self)->None:
+        """エピソードの記録を開始する(途中のエピソードがあれば未完了として書き出す)"""
+        self.flush_trace(complete=False)
+        # 乱数シードはこの環境の乱数から引くので、seedで固定すれば記録全体も再現できる
+        self.trace_seed = int(self.rng.random() * (1 << 53))
+        self.rng.seed(self.trace_seed)
+        self.trace_actions = bytearray()
+        self.trace_checksums = [] if self.trace.checksum else None
+
+    def flush_trace(self, complete:bool)->None:
+        """記録中のエピソードを書き出す
+
+        Args:
+            complete (bool): エピソードの終端まで進んだ
+        """
+        if self.trace_actions is None:
+            return
+        if self.trace_actions:
+            self.trace.write_episode(self.trace_seed, self.trace_actions, self.trace_checksums, complete)
+        self.trace_actions = None
+        self.trace_checksums = None
+
     def seed(self, seed:int)->None:
-        """乱数を固定する
+        """この環境の乱数を固定する(他の環境やrandomモジュールの乱数には影響しない)
 
         Args:
             seed (int): 乱数シード
         """
-        random.seed(seed)
+        self.rng.seed(seed)
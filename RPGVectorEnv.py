@@ -0,0 +1,293 @@
+import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import numpy as np
+
+from RPGTurnBattle import Simulation
+
+class SharedArrays():
+    """K個の環境の行動・状態・報酬・終了フラグ・選択可能な行動を格納する配列
+
+    共有メモリを使う場合は、ワーカープロセスが名前で同じ領域を参照するので、
+    状態や報酬をプロセス間でpickleせずに受け渡せる。
+    """
+    def __init__(self, n_envs:int, obs_size:int, n_actions:int, name:str=None, create:bool=False):
+        """コンストラクタ
+
+        Args:
+            n_envs (int): 環境の数
+            obs_size (int): 状態の要素数
+            n_actions (int): 行動数
+            name (str, optional): 共有メモリの名前. Defaults to None.
+            create (bool, optional): 共有メモリを作成する. Defaults to False(nameがNoneの場合はプロセス内の配列).
+        """
+        specs = [
+            ('actions', np.int32, (n_envs,)),
+            ('observations', np.float32, (n_envs, obs_size)),
+            ('final_observations', np.float32, (n_envs, obs_size)),
+            ('rewards', np.float32, (n_envs,)),
+            ('dones', np.bool_, (n_envs,)),
+            ('action_masks', np.bool_, (n_envs, n_actions)),
+        ]
+        size = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, dtype, shape in specs)
+
+        self.shm = None
+        if create or name is not None:
+            self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+            buffer = self.shm.buf
+        else:
+            buffer = bytearray(size)
+
+        offset = 0
+        for array_name, dtype, shape in specs:
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            setattr(self, array_name, array)
+            offset += array.nbytes
+
+    @property
+    def name(self)->str:
+        return self.shm.name
+
+    def close(self, unlink:bool=False):
+        """共有メモリを解放する
+
+        Args:
+            unlink (bool, optional): 共有メモリ自体を削除する(作成したプロセスのみ). Defaults to False.
+        """
+        if self.shm is None:
+            return
+        # 共有メモリを参照する配列を先に破棄する
+        for array_name in ('actions', 'observations', 'final_observations', 'rewards', 'dones', 'action_masks'):
+            setattr(self, array_name, None)
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+        self.shm = None
+
+def bind_envs(envs:List[Simulation], arrays:SharedArrays, start:int):
+    """各環境の状態の書き込み先を配列の行にする
+
+    Args:
+        envs (List[Simulation]): 環境
+        arrays (SharedArrays): 書き込み先の配列
+        start (int): envs[0]の配列上のindex
+    """
+    for i, env in enumerate(envs, start):
+        env.set_observation_buffer(arrays.observations[i])
+
+def step_envs(envs:List[Simulation], arrays:SharedArrays, start:int):
+    """環境を1ステップ進め、結果を配列に書き込む(終了した環境は自動でresetする)
+
+    状態はbind_envsで設定した配列の行に各環境が直接書き込む。
+
+    Args:
+        envs (List[Simulation]): 環境
+        arrays (SharedArrays): 書き込み先の配列
+        start (int): envs[0]の配列上のindex
+    """
+    for i, env in enumerate(envs, start):
+        _, reward, done, _ = env.step(int(arrays.actions[i]))
+        arrays.rewards[i] = reward
+        arrays.dones[i] = done
+        if done:
+            # 終了時の状態を残し、次のエピソードの最初の状態を書き込む
+            arrays.final_observations[i] = arrays.observations[i]
+            env.reset()
+        env.get_action_mask(arrays.action_masks[i])
+
+def reset_envs(envs:List[Simulation], arrays:SharedArrays, start:int, seeds:List[int]=None):
+    """環境をresetし、最初の状態を配列に書き込む
+
+    Args:
+        envs (List[Simulation]): 環境
+        arrays (SharedArrays): 書き込み先の配列
+        start (int): envs[0]の配列上のindex
+        seeds (List[int], optional): 環境ごとの乱数シード. Defaults to None.
+    """
+    for i, env in enumerate(envs, start):
+        if seeds is not None:
+            env.seed(seeds[i - start])
+        env.reset()
+        env.get_action_mask(arrays.action_masks[i])
+        arrays.rewards[i] = 0
+        arrays.dones[i] = False
+
+def worker(connection, shm_name:str, n_envs:int, obs_size:int, n_actions:int, start:int, stop:int, data_folder_path:str, scenario_code:str):
+    """ワーカープロセスの処理
+
+    親プロセスからのコマンド('step', 'reset', 'close')を受け取り、担当する環境[start, stop)を進める。
+    例外が発生した場合は('error', トレースバック)を親プロセスに送って終了する。
+
+    Args:
+        connection: 親プロセスとの通信用パイプ
+        shm_name (str): 共有メモリの名前
+        n_envs (int): 全環境の数
+        obs_size (int): 状態の要素数
+        n_actions (int): 行動数
+        start (int): 担当する最初の環境のindex
+        stop (int): 担当する最後の環境のindex + 1
+        data_folder_path (str): Unitデータの格納先フォルダパス
+        scenario_code (str): ゲームのシナリオ
+    """
+    arrays = SharedArrays(n_envs, obs_size, n_actions, name=shm_name)
+    try:
+        envs = [Simulation(data_folder_path, scenario_code, headless=True) for _ in range(start, stop)]
+        bind_envs(envs, arrays, start)
+        while True:
+            command, argument = connection.recv()
+            if command == 'step':
+                step_envs(envs, arrays, start)
+            elif command == 'reset':
+                reset_envs(envs, arrays, start, argument)
+            elif command == 'close':
+                break
+            connection.send(None)
+    except Exception:
+        # 親プロセスがwaitで例外を送出できるように、トレースバックを送る
+        connection.send(('error', traceback.format_exc()))
+    finally:
+        arrays.close()
+        connection.close()
+
+class VectorSimulation():
+    """K個のSimulationをまとめて進める環境
+
+    状態・報酬・終了フラグ・選択可能な行動は事前に確保した配列(observations, rewards, dones, action_masks)に書き込まれ、
+    stepとresetはその配列をそのまま返す。終了した環境は自動でresetされ、
+    終了時の状態はfinal_observationsに格納される。
+    n_workers > 0 の場合は環境をワーカープロセスに分けて並列に進め、配列は共有メモリに置く。
+    """
+    def __init__(self, n_envs:int, data_folder_path:str='battle/data/', scenario_code:str='default', n_workers:int=0, seed:int=None):
+        """コンストラクタ
+
+        Args:
+            n_envs (int): 環境の数
+            data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+            scenario_code (str, optional): ゲームのシナリオ. Defaults to 'default'.
+            n_workers (int, optional): ワーカープロセス数. Defaults to 0(プロセス内で実行する).
+            seed (int, optional): 乱数シード(環境ごとのシードを生成する). Defaults to None.
+        """
+        self.n_envs = n_envs
+        self.n_workers = min(n_workers, n_envs)
+        self.seed_sequence = np.random.SeedSequence(seed)
+
+        # 状態の要素数と行動数は1つ目の環境から取得する
+        env = Simulation(data_folder_path, scenario_code, headless=True)
+        self.obs_size = len(env.reset())
+        self.n_actions = env.get_n_actions()
+
+        self.envs = []
+        self.connections = []
+        self.processes = []
+        if self.n_workers == 0:
+            self.arrays = SharedArrays(n_envs, self.obs_size, self.n_actions)
+            self.envs = [env] + [Simulation(data_folder_path, scenario_code, headless=True) for _ in range(n_envs - 1)]
+            bind_envs(self.envs, self.arrays, 0)
+        else:
+            self.arrays = SharedArrays(n_envs, self.obs_size, self.n_actions, create=True)
+            bounds = np.linspace(0, n_envs, self.n_workers + 1).astype(int)
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                parent, child = mp.Pipe()
+                process = mp.Process(
+                    target=worker,
+                    args=(child, self.arrays.name, n_envs, self.obs_size, self.n_actions, int(start), int(stop), data_folder_path, scenario_code),
+                    daemon=True)
+                process.start()
+                child.close()
+                self.connections.append(parent)
+                self.processes.append(process)
+            self.bounds = bounds
+
+        self.actions = self.arrays.actions
+        self.observations = self.arrays.observations
+        self.final_observations = self.arrays.final_observations
+        self.rewards = self.arrays.rewards
+        self.dones = self.arrays.dones
+        self.action_masks = self.arrays.action_masks
+
+    def get_n_actions(self)->int:
+        """選択可能な行動数を取得する
+
+        Returns:
+            int: 選択可能な行動数
+        """
+        return self.n_actions
+
+    def reset(self, seed:int=None)->np.ndarray:
+        """全環境を初期化する
+
+        Args:
+            seed (int, optional): 乱数シード. Defaults to None(コンストラクタのシードから続けて生成する).
+
+        Returns:
+            np.ndarray: 最初の状態 (環境数, 状態の要素数)
+        """
+        if seed is not None:
+            self.seed_sequence = np.random.SeedSequence(seed)
+        seeds = self.seed_sequence.spawn(1)[0].generate_state(self.n_envs).tolist()
+
+        if self.n_workers == 0:
+            reset_envs(self.envs, self.arrays, 0, seeds)
+        else:
+            for connection, start, stop in zip(self.connections, self.bounds[:-1], self.bounds[1:]):
+                connection.send(('reset', seeds[start:stop]))
+            self.wait()
+        return self.observations
+
+    def step(self, actions)->Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """全環境を1ステップ進める
+
+        Args:
+            actions: 環境ごとの行動 (環境数,)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: 状態、報酬、エピソード終端、終了時の状態
+                (いずれも事前に確保した配列で、次のstepで上書きされる)
+        """
+        self.actions[:] = actions
+        if self.n_workers == 0:
+            step_envs(self.envs, self.arrays, 0)
+        else:
+            for connection in self.connections:
+                connection.send(('step', None))
+            self.wait()
+        return self.observations, self.rewards, self.dones, self.final_observations
+
+    def wait(self):
+        """全ワーカーの処理の完了を待つ
+
+        Raises:
+            RuntimeError: ワーカーで例外が発生した(ワーカーのトレースバックを含む)
+        """
+        errors = []
+        for connection in self.connections:
+            result = connection.recv()
+            if result is not None:
+                errors.append(result[1])
+        if errors:
+            raise RuntimeError('ワーカープロセスで例外が発生しました\n' + '\n'.join(errors))
+
+    def close(self):
+        """ワーカープロセスを終了し、共有メモリを解放する(以降、stepやresetが返した配列は参照できない)"""
+        for connection in self.connections:
+            try:
+                connection.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+        self.processes = []
+
+        self.actions = self.observations = self.final_observations = self.rewards = self.dones = self.action_masks = None
+        self.arrays.close(unlink=self.n_workers > 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
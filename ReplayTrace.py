@@ -0,0 +1,82 @@
+import argparse
+import sys
+
+from battle.command import PlayerCommands
+from battle.trace import TraceReader, TraceEpisode, new_env, replay
+
+# 使えないコマンドのindex(コマンド数以上)を選択した時の表示名
+WAIT_COMMAND_NAME = '様子を見る'
+
+def replay_episode(episode:TraceEpisode, reader:TraceReader, data_folder_path:str='battle/data/', out=sys.stdout)->int:
+    """記録したエピソードを再現し、戦闘メッセージを書き出す
+
+    Args:
+        episode (TraceEpisode): エピソード
+        reader (TraceReader): エピソードを読み出した記録ファイル(シナリオ・プレイヤーのレベル・乱数生成器の種類を使う)
+        data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+        out (optional): 書き出し先. Defaults to sys.stdout.
+
+    Returns:
+        int: 状態のチェックサムが最初に一致しなかったステップ(すべて一致した場合は-1)
+    """
+    env = new_env(reader, data_folder_path, headless=False)
+    mismatch = -1
+    total_reward = 0
+    commands = env.battle.player.commands
+
+    def write_header(env):
+        out.write(f'seed: {episode.seed}\n\n{env.battle.enemy.name} が出現しました。\n{env.render()}\n')
+
+    for i, (action, (_, reward, done, message), matched) in enumerate(replay(env, episode, write_header)):
+        name = PlayerCommands[commands[action]].name if action < len(commands) else WAIT_COMMAND_NAME
+        out.write(f'\n[{i + 1}] {name}\n{message}\n')
+        total_reward += reward
+        if matched is False and mismatch < 0:
+            mismatch = i
+            out.write(f'!! ステップ{i + 1}で状態が記録と一致しません(データか戦闘処理が変更されています)\n')
+        if not done:
+            out.write(env.render() + '\n')
+    out.write(f'\n獲得報酬：{total_reward}' + ('' if episode.complete else '(エピソードの途中まで)') + '\n')
+    return mismatch
+
+def summarize(reader:TraceReader, data_folder_path:str='battle/data/', out=sys.stdout)->int:
+    """すべてのエピソードを再現し、エピソードごとの結果を表形式で書き出す
+
+    Args:
+        reader (TraceReader): 記録ファイル
+        data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+        out (optional): 書き出し先. Defaults to sys.stdout.
+
+    Returns:
+        int: 状態のチェックサムが一致しなかったエピソードの数
+    """
+    env = new_env(reader, data_folder_path)
+    n_mismatch = 0
+    out.write('episode\tseed\tsteps\tbattles\treward\tdead\tcomplete\tchecksum\n')
+    for i, episode in enumerate(reader):
+        total_reward = 0
+        matched = None
+        for _, (_, reward, _, _), step_matched in replay(env, episode):
+            total_reward += reward
+            if step_matched is not None:
+                matched = step_matched if matched is None else matched and step_matched
+        n_mismatch += int(matched is False)
+        checksum = '-' if matched is None else ('ok' if matched else 'MISMATCH')
+        out.write(f'{i}\t{episode.seed}\t{len(episode.actions)}\t{env.n_battle}\t{total_reward}\t'
+                  f'{int(env.battle.player.hp == 0)}\t{int(episode.complete)}\t{checksum}\n')
+    return n_mismatch
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulation.set_traceで記録したエピソードを再現します。')
+    parser.add_argument('trace', help='記録ファイルのパス')
+    parser.add_argument('--episode', type=int, default=None, help='戦闘メッセージ付きで再現するエピソードの番号(負の値は末尾から)。省略した場合は全エピソードの結果を一覧表示する')
+    parser.add_argument('--data', default='battle/data/', help='Unitデータの格納先フォルダパス')
+    args = parser.parse_args()
+
+    reader = TraceReader(args.trace)
+    if args.episode is None:
+        n_mismatch = summarize(reader, args.data)
+    else:
+        n_mismatch = int(replay_episode(reader[args.episode], reader, args.data) >= 0)
+    # 記録と一致しないエピソードがあれば終了コード1で終了する
+    sys.exit(1 if n_mismatch else 0)
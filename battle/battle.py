@@ -1,49 +1,46 @@
-import os.path as path
 import random
-import json
-from typing import Tuple
 
-from battle.scenario import Scenario, load_scenarios
-from battle.unit import UnitType, Unit, load_units
-from battle.command import PlayerCommands, EnemyCommands, ActionResults
+from battle.content import load_content
+from battle.command import PlayerCommands, EnemyCommands
+from battle.event import PLAYER_NO, EventCode, EventFlag, EventBuffer
+
+# イベントのコマンドID -> コマンド
+PLAYER_COMMAND_LIST = tuple(PlayerCommands.values())
+ENEMY_COMMAND_LIST = tuple(EnemyCommands.values())
 
 class Battle():
-    def __init__(self, data_folder_path:str, scenario_code):
+    def __init__(self, data_folder_path:str, scenario_code, headless:bool=False, rng=None, player_lv:int=None):
         """コンストラクタ
 
         Args:
             data_folder_path (str, optional): Unitデータの格納先フォルダパス.
             scenario (str, optional): ゲームのシナリオ. Defaults to 'default'.
+            headless (bool, optional): バトルメッセージを生成しない. Defaults to False.
+            rng (optional): 乱数生成器(random.Random互換). Defaults to None(新しいrandom.Random).
+            player_lv (int, optional): プレイヤーのレベル. Defaults to None(シナリオのレベル).
         """
-        # シナリオ読み込み
-        scenarios = load_scenarios(path.join(data_folder_path, 'scenarios.json'))
-        scenario = list(filter(lambda x: x.scenario_code == scenario_code, scenarios))[0]
+        self.headless = headless
+        # 戦闘中の乱数はすべてこの乱数生成器から取得する
+        self.rng = rng if rng is not None else random.Random()
+        # 戦闘中のイベント(メッセージは必要になった時にイベントから生成する)
+        self.events = EventBuffer()
+        # イベント -> バトルメッセージ(メッセージはイベントの値とユニット名だけで決まるので、生成済みのものを使い回す)
+        self.messages = {}
 
-        # プレイヤーデータ読み込み
-        self.player_list = load_units(path.join(data_folder_path, 'player.json'))
-        self.set_command_pattern(self.player_list, UnitType.PLAYER)
-        self.player = list(filter(lambda x: x.lv == scenario.player_lv, self.player_list))[0]
+        # データ読み込み(同じフォルダはプロセス内で1度だけ読み込み、ユニットはプロトタイプから複製する)
+        content = load_content(data_folder_path)
+        scenario = content.scenario(scenario_code)
 
-        # 敵データ読み込み
-        self.enemy_list = load_units(path.join(data_folder_path, 'enemies.json'))
-        self.set_command_pattern(self.enemy_list, UnitType.ENEMY)
-        self.enemies = list(filter(lambda x: x.id in scenario.enemies, self.enemy_list))
+        # プレイヤー
+        if player_lv is None:
+            player_lv = scenario.player_lv
+        self.player = content.player(player_lv).create()
 
-    def set_command_pattern(self, units:list, unit_type:UnitType):
-        """ユニットが使用可能なコマンドをセットする
+        # 出現する敵(戦闘ごとに独立したインスタンスなので、encountで変更しても他の戦闘に影響しない)
+        self.enemies = [prototype.create() for prototype in content.scenario_enemies(scenario)]
 
-        Args:
-            units (list): コマンド設定対象のユニットリスト
-            unit_type (UnitType): コマンド設定対象のユニットのユニットタイプ
-        """
-        for unit in units:
-            unit.command_pattern = []
-            if unit_type == UnitType.PLAYER:
-                commands = PlayerCommands
-            else:
-                commands = EnemyCommands
-            for key in commands:
-                unit.command_pattern.append(int(key in unit.commands))
+        # イベントのユニット番号 -> ユニット
+        self.units = [self.player] + self.enemies
 
     def reset(self):
         """最初の戦闘開始状態に初期化する
@@ -52,20 +49,51 @@ class Battle():
         self.total_damage = 0
         self.escape = False
 
+    def snapshot(self)->tuple:
+        """戦闘中に変化する状態だけを取得する
+
+        Returns:
+            tuple: プレイヤー・敵の状態、与えたダメージ合計、逃走、先攻
+        """
+        player = self.player
+        enemy = self.enemy
+        return (
+            player.hp, player.mp, player.seal_spell, player.sleep, player.n_sleep_tern,
+            self.enemy_no, enemy.hp, enemy.mp, enemy.seal_spell, enemy.sleep, enemy.n_sleep_tern,
+            self.total_damage, self.escape, self.is_firat_attack,
+        )
+
+    def restore(self, snap:tuple):
+        """snapshotで取得した状態に戻す
+
+        Args:
+            snap (tuple): snapshotで取得した状態
+        """
+        player = self.player
+        (
+            player.hp, player.mp, player.seal_spell, player.sleep, player.n_sleep_tern,
+            self.enemy_no, hp, mp, seal_spell, sleep, n_sleep_tern,
+            self.total_damage, self.escape, self.is_firat_attack,
+        ) = snap
+        enemy = self.units[self.enemy_no]
+        enemy.hp, enemy.mp, enemy.seal_spell, enemy.sleep, enemy.n_sleep_tern = hp, mp, seal_spell, sleep, n_sleep_tern
+        self.enemy = enemy
+
     def encount(self):
         """敵とランダムエンカウント"""
-        self.enemy = self.enemies[random.randrange(len(self.enemies))]
+        self.enemy_no = self.rng.randrange(len(self.enemies)) + 1
+        self.enemy = self.units[self.enemy_no]
         self.enemy.recovery_all()
 
         # 遭遇時の敵のHPはランダムで75～100％の状態。
-        self.enemy.hp -= int(self.enemy.max_hp * (random.randrange(256) / 1024))
+        self.enemy.hp -= int(self.enemy.max_hp * (self.rng.randrange(256) / 1024))
 
         # 各種戦闘ステータスリセット
         self.total_damage = 0
         self.escape = False
 
         # 先攻後攻を決める
-        self.is_firat_attack = random.random() < (self.player.speed * 4) / ((self.player.speed * 4) + self.enemy.speed)
+        self.is_firat_attack = self.rng.random() < (self.player.speed * 4) / ((self.player.speed * 4) + self.enemy.speed)
 
     def act_one_turn(self, action:int)->str:
         """戦闘を1ターン進める
@@ -74,66 +102,125 @@ class Battle():
             action (int): プレイヤーの行動
 
         Returns:
-            str: バトルメッセージ
+            str: バトルメッセージ(headlessの場合は空文字)
         """
-        message = ''
+        self.events.clear()
 
         if self.is_firat_attack :
             # 味方の行動
-            self.escape, message = self.act_player(action)
+            self.escape = self.act_player(action)
 
             # 敵の行動 ※敵の逃走は未実装
             if(self.enemy.hp > 0):
-                _, tmp_message = self.act_enemy()
-                message += tmp_message
+                self.act_enemy()
         else:
-            _, message = self.act_enemy()
+            self.act_enemy()
             if(self.player.hp > 0):
-                self.escape, tmp_message = self.act_player(action)
-                message += tmp_message
+                self.escape = self.act_player(action)
 
-        return message
+        if self.headless:
+            return ''
+        return self.render_events()
     
-    def act_player(self, action:int)->Tuple[bool, str]:
+    def act_player(self, action:int)->bool:
         """プレイヤーの行動
 
         Args:
             action (int): プレイヤーが選択した行動
 
         Returns:
-            Tuple[bool, str]: 逃走成功, バトルメッセージ
+            bool: 逃走成功
         """
-        awake_message = ''
-        if self.player.sleep:
-            if self.player.judge_awake():
-                awake_message = f'\n{self.player.name} は目を覚ました！'
+        player = self.player
+        flags = EventFlag.NONE
+        if player.sleep:
+            if player.judge_awake(self.rng):
+                flags = EventFlag.WOKE_UP
             else:
-                return False, f'\n{self.player.name} は眠っている･･･'
+                self.events.append(PLAYER_NO, self.enemy_no, EventCode.SLEEPING)
+                return False
 
         # AIにプレイさせる際、まだ覚えていないコマンドを使おうとすることがあるので
         # その場合は何もしない。
-        if action > len(self.player.commands) - 1:
-            return False, f'\n{self.player.name} は 様子を見ている'
-        results = PlayerCommands[self.player.commands[action]].action(self.player, self.enemy)
-        results.message = awake_message + results.message
-        self.total_damage += results.damage
-        return results.escape, results.message
-
-    def act_enemy(self)->Tuple[bool, str]:
+        if action > len(player.commands) - 1:
+            self.events.append(PLAYER_NO, self.enemy_no, EventCode.WAIT, 0, flags)
+            return False
+        command_id = player.command_ids[action]
+        damage, recover, escape, result_flags = PLAYER_COMMAND_LIST[command_id].action(player, self.enemy, self.rng)
+        self.events.append(PLAYER_NO, self.enemy_no, command_id, damage + recover, flags | result_flags)
+        self.total_damage += damage
+        return escape
+
+    def act_enemy(self)->bool:
         """敵の行動
 
         Returns:
-            Tuple[bool, str]: 逃走成功、バトルメッセージ
+            bool: 逃走成功
         """
-        awake_message = ''
-        if self.enemy.sleep:
-            if self.enemy.judge_awake():
-                awake_message = f'\n{self.enemy.name} は目を覚ました！'
+        enemy = self.enemy
+        flags = EventFlag.NONE
+        if enemy.sleep:
+            if enemy.judge_awake(self.rng):
+                flags = EventFlag.WOKE_UP
             else:
-                return False, f'\n{self.enemy.name} は眠っている･･･'
+                self.events.append(self.enemy_no, PLAYER_NO, EventCode.SLEEPING)
+                return False
 
-        action = self.enemy.commands[random.randrange(len(self.enemy.commands))]
-        results = EnemyCommands[action].action(self.enemy, self.player)
-        results.message = awake_message + results.message
-        self.total_damage -= results.recover
-        return results.escape, results.message
+        command_id = enemy.command_ids[self.rng.randrange(len(enemy.command_ids))]
+        damage, recover, escape, result_flags = ENEMY_COMMAND_LIST[command_id].action(enemy, self.player, self.rng)
+        self.events.append(self.enemy_no, PLAYER_NO, command_id, damage + recover, flags | result_flags)
+        self.total_damage -= recover
+        return escape
+
+    def render_events(self)->str:
+        """記録されたイベントからバトルメッセージを生成する
+
+        Returns:
+            str: バトルメッセージ
+        """
+        message = ''
+        messages = self.messages
+        for event in self.events:
+            text = messages.get(event)
+            if text is None:
+                text = messages[event] = self.render_event(*event)
+            message += text
+        return message
+
+    def render_event(self, actor_no:int, target_no:int, code:int, amount:int, flags:int)->str:
+        """1件のイベントのバトルメッセージを生成する
+
+        Args:
+            actor_no (int): 行動者のユニット番号
+            target_no (int): 対象者のユニット番号
+            code (int): コマンドIDまたはEventCode
+            amount (int): ダメージ量・回復量などの数値
+            flags (int): EventFlag
+
+        Returns:
+            str: バトルメッセージ
+        """
+        actor = self.units[actor_no]
+        target = self.units[target_no]
+        if code >= 0:
+            # コマンドの実行
+            message = ''
+            if flags & EventFlag.WOKE_UP:
+                message = f'\n{actor.name} は目を覚ました！'
+            command = PLAYER_COMMAND_LIST[code] if actor_no == PLAYER_NO else ENEMY_COMMAND_LIST[code]
+            return message + command.render(actor, target, amount, flags)
+        if code == EventCode.SLEEPING:
+            return f'\n{actor.name} は眠っている･･･'
+        if code == EventCode.WAIT:
+            # 目を覚ましても、様子を見ている場合は起床メッセージを表示しない
+            return f'\n{actor.name} は 様子を見ている'
+        if code == EventCode.DEAD:
+            return f'\nあなたは死んでしまいました。'
+        if code == EventCode.DEFEAT:
+            return f'\n\n{target.name} を倒した！'
+        if code == EventCode.REMAINING:
+            return f'\n残り戦闘回数： {amount} 回'
+        if code == EventCode.APPEAR:
+            return f'\n\n新たに {target.name} が出現しました。コマンドを選択してください。'
+        # EventCode.COMPLETE
+        return f'\n\n敵を {amount} 体倒しました！ シミュレーションを終了します。'
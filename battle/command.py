@@ -1,17 +1,20 @@
 import random
 from typing import Tuple
 from abc import ABCMeta, abstractmethod
-from dataclasses import dataclass, field
 
 from battle.unit import UnitType, Unit
+from battle.event import EventFlag
+from battle.damage import N_ATTACK_SAMPLES, attack_table
 
-@dataclass
-class ActionResults():
-    """1ユニットの行動結結果を格納する"""
-    message: str
-    damage: int = field(default=0)
-    recover: int = field(default=0)
-    escape: bool = field(default=False)
+# 1ユニットの行動結果 (ダメージ, 回復量, 逃走成功, EventFlag)
+# 毎ターン作成するので、クラスではなくタプルで返す
+ActionResults = Tuple[int, int, bool, int]
+# 何も起きなかった行動の結果
+NO_RESULT = (0, 0, False, EventFlag.NONE)
+
+# 列挙型のメンバの参照は遅いので、毎ターンの判定には値を取り出して使う
+PLAYER_TYPE = int(UnitType.PLAYER)
+ENEMY_TYPE = int(UnitType.ENEMY)
 
 class Command(metaclass=ABCMeta):
     """戦闘コマンド"""
@@ -29,7 +32,7 @@ class Command(metaclass=ABCMeta):
             str: バトルメッセージ
         """
         message = ''
-        if damaged_unit.unit_type == UnitType.PLAYER:
+        if damaged_unit.unit_type == PLAYER_TYPE:
             message = f'{damaged_unit.name} は {damage} のダメージを受けた！'
         else:
             message = f'{damaged_unit.name} に {damage} のダメージを与えた！'
@@ -37,7 +40,32 @@ class Command(metaclass=ABCMeta):
         return message
 
     @abstractmethod
-    def action(self, action_unit:Unit, target_unit:Unit)->ActionResults:
+    def action(self, action_unit:Unit, target_unit:Unit, rng=random)->ActionResults:
+        """行動する
+
+        Args:
+            action_unit (Unit): 行動するユニット
+            target_unit (Unit): 行動対象のユニット
+            rng (optional): 乱数生成器(random.Random互換). Defaults to random.
+
+        Returns:
+            ActionResults: ダメージ, 回復量, 逃走成功, EventFlag
+        """
+        pass
+
+    @abstractmethod
+    def render(self, action_unit:Unit, target_unit:Unit, amount:int, flags:int)->str:
+        """行動結果のバトルメッセージを生成する
+
+        Args:
+            action_unit (Unit): 行動したユニット
+            target_unit (Unit): 行動対象のユニット
+            amount (int): ダメージ量または回復量
+            flags (int): 行動結果のEventFlag
+
+        Returns:
+            str: バトルメッセージ
+        """
         pass
 
 class Attack(Command):
@@ -45,25 +73,31 @@ class Attack(Command):
     def __init__(self):
         super().__init__('こうげき')
 
-    def action(self, action_unit:Unit, target_unit:Unit)->ActionResults:
+    def action(self, action_unit:Unit, target_unit:Unit, rng=random)->ActionResults:
         """通常攻撃
 
         Args:
             action_unit (Unit): 攻撃側ユニット
             target_unit (Unit): 攻撃対象ユニット
+            rng (optional): 乱数生成器(random.Random互換). Defaults to random.
 
         Returns:
-            ActionResults: ダメージ, バトルメッセージ
+            ActionResults: ダメージ
         """
-        damage = int((action_unit.attack - (target_unit.difense // 2)) // (2 + random.randrange(256) / 128))
+        damage = attack_table(action_unit.attack, target_unit.difense)[rng.randrange(N_ATTACK_SAMPLES)]
         if damage <= 0:
-            damage = random.randint(0, 1)
+            damage = rng.randint(0, 1)
         target_unit.hp -= damage
-        message = f'\n{action_unit.name} の攻撃！ ' + self.damage_message(target_unit, damage)
         if target_unit.hp < 0:
             target_unit.hp = 0
+            return damage, 0, False, EventFlag.KNOCKED_OUT
+        return damage, 0, False, EventFlag.NONE
+
+    def render(self, action_unit:Unit, target_unit:Unit, amount:int, flags:int)->str:
+        message = f'\n{action_unit.name} の攻撃！ ' + self.damage_message(target_unit, amount)
+        if flags & EventFlag.KNOCKED_OUT:
             message += f'\n{target_unit.name} は 倒れた！'
-        return ActionResults(damage=damage, message=message)
+        return message
 
 class Spell(Command):
     """呪文"""
@@ -71,7 +105,7 @@ class Spell(Command):
         super().__init__(name)
         self.used_mp = used_mp
 
-    def valid_spell(self, unit:Unit, mp_use:int)->Tuple[bool, str]:
+    def valid_spell(self, unit:Unit, mp_use:int)->int:
         """呪文の成否判定
 
         Args:
@@ -79,17 +113,34 @@ class Spell(Command):
             mp_use (int): 呪文の消費MP
 
         Returns:
-            Tuple[bool, str]: 呪文の成否, 失敗時のメッセージ
+            int: 失敗理由のEventFlag(成功時はEventFlag.NONE)
         """
         # 封印状態の場合
         if unit.seal_spell:
-            return False, 'しかし呪文は封じられている！'
+            return EventFlag.SEALED
 
         # MP不足チェック
         if unit.mp < mp_use:
-            return False, 'しかしMPが足りなかった！'
+            return EventFlag.NO_MP
+
+        return EventFlag.NONE
 
-        return True, ''
+    def spell_message(self, action_unit:Unit, flags:int)->Tuple[bool, str]:
+        """呪文を唱えたときのメッセージ
+
+        Args:
+            action_unit (Unit): 呪文を唱えたユニット
+            flags (int): 行動結果のEventFlag
+
+        Returns:
+            Tuple[bool, str]: 呪文の成否, バトルメッセージ
+        """
+        message = f'\n{action_unit.name} は {self.name} の呪文を唱えた！ '
+        if flags & EventFlag.SEALED:
+            return False, message + 'しかし呪文は封じられている！'
+        if flags & EventFlag.NO_MP:
+            return False, message + 'しかしMPが足りなかった！'
+        return True, message
 
 class AttackSpell(Spell):
     """攻撃呪文"""
@@ -98,31 +149,37 @@ class AttackSpell(Spell):
         self.min_damage = min_damage
         self.max_damage = max_damage
 
-    def action(self, action_unit:Unit, target_unit:Unit)->ActionResults:
+    def action(self, action_unit:Unit, target_unit:Unit, rng=random)->ActionResults:
         """攻撃呪文を唱える
 
         Args:
             action_unit (Unit): 攻撃側ユニット
             target_unit (Unit): 攻撃対象ユニット
+            rng (optional): 乱数生成器(random.Random互換). Defaults to random.
 
         Returns:
-            ActionResults: ダメージ, バトルメッセージ
+            ActionResults: ダメージ
         """
-        message = f'\n{action_unit.name} は {self.name} の呪文を唱えた！ '
-
-        valid, tmp_message = super().valid_spell(action_unit, self.used_mp)
-        if not valid:
-            message += tmp_message
-            return ActionResults(damage=0, message=message)
+        flags = self.valid_spell(action_unit, self.used_mp)
+        if flags:
+            return 0, 0, False, flags
 
-        damage = random.randint(self.min_damage, self.max_damage)
+        damage = rng.randint(self.min_damage, self.max_damage)
         action_unit.mp -= self.used_mp
         target_unit.hp -= damage
-        message += super().damage_message(target_unit, damage)
         if target_unit.hp < 0:
             target_unit.hp = 0
+            flags = EventFlag.KNOCKED_OUT
+        return damage, 0, False, flags
+
+    def render(self, action_unit:Unit, target_unit:Unit, amount:int, flags:int)->str:
+        valid, message = self.spell_message(action_unit, flags)
+        if not valid:
+            return message
+        message += super().damage_message(target_unit, amount)
+        if flags & EventFlag.KNOCKED_OUT:
             message += f'\n{target_unit.name} は 倒れた！'
-        return ActionResults(damage=damage, message=message)
+        return message
 
 class RecoverSpell(Spell):
     """回復呪文"""
@@ -131,117 +188,131 @@ class RecoverSpell(Spell):
         self.min_recover = min_recover
         self.max_recover = max_recover
 
-    def action(self, action_unit:Unit, target_unit:Unit)->ActionResults:
+    def action(self, action_unit:Unit, target_unit:Unit, rng=random)->ActionResults:
         """回復呪文を唱える
 
         Args:
             action_unit (Unit): 呪文を唱えたユニット
             target_unit (Unit): 回復対象ユニット
+            rng (optional): 乱数生成器(random.Random互換). Defaults to random.
 
         Returns:
-            ActionResults: 回復量、バトルメッセージ
+            ActionResults: 回復量
         """
 
         # Todo:DQ1の戦闘は1対1なので、単純化のため呪文を唱えたユニット=回復対象ユニットとする。
-        message = f'\n{action_unit.name} は {self.name} の呪文を唱えた！ '
-        valid, tmp_message = self.valid_spell(action_unit, self.used_mp)
-        if not valid:
-            message += tmp_message
-            return ActionResults(recover=0, message=message)
+        flags = self.valid_spell(action_unit, self.used_mp)
+        if flags:
+            return 0, 0, False, flags
 
-        recover = action_unit.recovery_hp(random.randint(self.min_recover, self.max_recover))
+        recover = action_unit.recovery_hp(rng.randint(self.min_recover, self.max_recover))
         action_unit.mp -= self.used_mp
-        message += f'{action_unit.name} の HP が {recover} 回復した！'
-        return ActionResults(recover=recover, message=message)
+        return 0, recover, False, EventFlag.NONE
+
+    def render(self, action_unit:Unit, target_unit:Unit, amount:int, flags:int)->str:
+        valid, message = self.spell_message(action_unit, flags)
+        if not valid:
+            return message
+        return message + f'{action_unit.name} の HP が {amount} 回復した！'
 
 class SealSpell(Spell):
     """呪文を封印する呪文"""
     def __init__(self, name:str, used_mp:int):
         super().__init__(name, used_mp)
 
-    def action(self, action_unit:Unit, target_unit:Unit)->ActionResults:
+    def action(self, action_unit:Unit, target_unit:Unit, rng=random)->ActionResults:
         """封印呪文を唱える
 
         Args:
             action_unit (Unit): 呪文を唱えたユニット
             target_unit (Unit): 封印対象ユニット
+            rng (optional): 乱数生成器(random.Random互換). Defaults to random.
 
         Returns:
-            ActionResults: バトルメッセージ
+            ActionResults: 行動結果
         """
-
-        message = f'\n{action_unit.name} は {self.name} の呪文を唱えた！ '
-        valid, tmp_message = self.valid_spell(action_unit, self.used_mp)
-        if not valid:
-            message += tmp_message
-            return ActionResults(message=message)
+        flags = self.valid_spell(action_unit, self.used_mp)
+        if flags:
+            return 0, 0, False, flags
 
         target_unit.seal_spell = True
         action_unit.mp -= self.used_mp
-        message += f'{target_unit.name} は呪文が使えなくなった！'
-        return ActionResults(message=message)
+        return NO_RESULT
+
+    def render(self, action_unit:Unit, target_unit:Unit, amount:int, flags:int)->str:
+        valid, message = self.spell_message(action_unit, flags)
+        if not valid:
+            return message
+        return message + f'{target_unit.name} は呪文が使えなくなった！'
 
 class SleepSpell(Spell):
     """相手を睡眠状態にする呪文"""
     def __init__(self, name:str, used_mp:int):
         super().__init__(name, used_mp)
 
-    def action(self, action_unit:Unit, target_unit:Unit)->ActionResults:
+    def action(self, action_unit:Unit, target_unit:Unit, rng=random)->ActionResults:
         """睡眠呪文を唱える
 
         Args:
             action_unit (Unit): 呪文を唱えたユニット
             target_unit (Unit): 睡眠対象ユニット
+            rng (optional): 乱数生成器(random.Random互換). Defaults to random.
 
         Returns:
-            ActionResults: バトルメッセージ
+            ActionResults: 行動結果
         """
-
-        message = f'\n{action_unit.name} は {self.name} の呪文を唱えた！ '
-        valid, tmp_message = self.valid_spell(action_unit, self.used_mp)
-        if not valid:
-            message += tmp_message
-            return ActionResults(message=message)
+        flags = self.valid_spell(action_unit, self.used_mp)
+        if flags:
+            return 0, 0, False, flags
 
         target_unit.sleep = True
         target_unit.n_sleep_tern = 0
         action_unit.mp -= self.used_mp
-        message += f'{target_unit.name} は眠ってしまった！'
-        return ActionResults(message=message)
+        return NO_RESULT
+
+    def render(self, action_unit:Unit, target_unit:Unit, amount:int, flags:int)->str:
+        valid, message = self.spell_message(action_unit, flags)
+        if not valid:
+            return message
+        return message + f'{target_unit.name} は眠ってしまった！'
 
 class Escape(Command):
     """逃走"""
     def __init__(self):
         super().__init__('にげる')
 
-    def action(self, action_unit:Unit, target_unit:Unit)->ActionResults:
+    def action(self, action_unit:Unit, target_unit:Unit, rng=random)->ActionResults:
         """逃げる
 
         Args:
             action_unit (Unit): 逃げるユニット
             target_unit (Unit): 相手ユニット
+            rng (optional): 乱数生成器(random.Random互換). Defaults to random.
 
         Returns:
-            ActionResults: 逃走成否, バトルメッセージ
+            ActionResults: 逃走成否
         """
-        message = f'\n{action_unit.name} は逃げ出した！'
-
         # モンスターは必ず逃走成功
-        if action_unit.unit_type == UnitType.ENEMY:
+        if action_unit.unit_type == ENEMY_TYPE:
             action_unit.hp = 0
-            return ActionResults(escape=True, message=message)
+            return 0, 0, True, EventFlag.ESCAPED
 
-        escape = False
         # プレイヤーはモンスターとのSpeed差により確率で成功
-        if random.random() < (action_unit.speed * 4) / ((action_unit.speed * 4) + target_unit.speed):
-            message += f'\nうまく逃げ切った！'
+        if rng.random() < (action_unit.speed * 4) / ((action_unit.speed * 4) + target_unit.speed):
             target_unit.hp = 0
-            escape = True
+            return 0, 0, True, EventFlag.ESCAPED
+
+        return NO_RESULT
+
+    def render(self, action_unit:Unit, target_unit:Unit, amount:int, flags:int)->str:
+        message = f'\n{action_unit.name} は逃げ出した！'
+        if action_unit.unit_type == ENEMY_TYPE:
+            return message
+        if flags & EventFlag.ESCAPED:
+            message += f'\nうまく逃げ切った！'
         else:
             message += f'\nしかし回り込まれてしまった！'
-            escape = False
-
-        return ActionResults(escape=escape, message=message)
+        return message
 
 PlayerCommands = {
     'attack': Attack(),
@@ -0,0 +1,467 @@
+import argparse
+import mmap
+import os
+import os.path as path
+import struct
+from dataclasses import dataclass, fields
+from functools import cached_property, lru_cache
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+from battle.scenario import Scenario, load_scenarios
+from battle.unit import UnitType, Unit, load_units
+from battle.command import PlayerCommands, EnemyCommands
+
+# 読み込むデータファイル
+CONTENT_FILES = ('scenarios.json', 'player.json', 'enemies.json')
+
+# 戦闘中に変化しないUnitの属性(プロトタイプからそのままコピーする)
+UNIT_FIELDS = tuple(f.name for f in fields(Unit))
+
+# コンパイル済みデータファイル
+COMPILED_FILE = 'content.bin'
+COMPILED_MAGIC = b'RPGC'
+COMPILED_VERSION = 1
+# ヘッダ：マジックナンバー, バージョン, ユニット数, コマンド列の幅, シナリオ数, シナリオの敵の数の合計, 文字列の長さ,
+# 元のJSONファイルの (更新日時, サイズ) × 3
+COMPILED_HEADER = struct.Struct('<4sIIIIII6q')
+
+# ユニット表の1行(固定長)。文字列は (文字列領域の開始位置, 長さ)
+UNIT_DTYPE = np.dtype([
+    ('unit_type', '<i4'), ('id', '<i4'), ('lv', '<i4'),
+    ('power', '<i4'), ('guard', '<i4'), ('attack', '<i4'), ('difense', '<i4'),
+    ('speed', '<i4'), ('max_hp', '<i4'), ('max_mp', '<i4'),
+    ('command_mask', '<u4'), ('n_commands', '<i4'),
+    ('name', '<i4', 2), ('weapon', '<i4', 2), ('armor', '<i4', 2), ('shield', '<i4', 2),
+])
+# シナリオ表の1行。敵はシナリオの敵のindex列の (開始位置, 数)
+SCENARIO_DTYPE = np.dtype([
+    ('scenario_code', '<i4', 2), ('player_lv', '<i4'), ('enemy_ids', '<i4', 2), ('enemies', '<i4', 2),
+])
+# レベルがないユニット(敵)のlv
+NO_LV = -1
+
+@dataclass(frozen=True, slots=True)
+class UnitPrototype():
+    """読み込み済みのユニットデータ(変更不可)
+
+    Unitの全属性の値をUNIT_FIELDSの順に保持し、戦闘に使うUnitはcreateで複製して作成する。
+    """
+    values: tuple
+
+    def create(self)->Unit:
+        """戦闘用のUnitを作成する(JSONの再読み込みや装備の再計算は行わない)
+
+        Returns:
+            Unit: 完全回復した状態のUnit
+        """
+        unit = Unit.__new__(Unit)
+        for name, value in zip(UNIT_FIELDS, self.values):
+            setattr(unit, name, value)
+        return unit
+
+    @property
+    def lv(self)->int:
+        return self.values[UNIT_FIELDS.index('lv')]
+
+    @property
+    def id(self)->int:
+        return self.values[UNIT_FIELDS.index('id')]
+
+@dataclass(frozen=True, slots=True)
+class Content():
+    """1つのデータフォルダから読み込んだシナリオとユニットのプロトタイプ"""
+    scenarios: Tuple[Scenario, ...]
+    players: Tuple[UnitPrototype, ...]
+    enemies: Tuple[UnitPrototype, ...]
+
+    def scenario(self, scenario_code:str)->Scenario:
+        """シナリオを取得する
+
+        Args:
+            scenario_code (str): シナリオコード
+
+        Returns:
+            Scenario: シナリオ
+        """
+        return list(filter(lambda x: x.scenario_code == scenario_code, self.scenarios))[0]
+
+    def player(self, lv:int)->UnitPrototype:
+        """指定したレベルのプレイヤーのプロトタイプを取得する
+
+        Args:
+            lv (int): プレイヤーのレベル
+
+        Returns:
+            UnitPrototype: プレイヤーのプロトタイプ
+        """
+        return list(filter(lambda x: x.lv == lv, self.players))[0]
+
+    def scenario_enemies(self, scenario:Scenario)->Tuple[UnitPrototype, ...]:
+        """シナリオに出現する敵のプロトタイプを取得する(enemies.jsonの並び順)
+
+        Args:
+            scenario (Scenario): シナリオ
+
+        Returns:
+            Tuple[UnitPrototype, ...]: 敵のプロトタイプ
+        """
+        return tuple(filter(lambda x: x.id in scenario.enemies, self.enemies))
+
+# データフォルダの絶対パス -> (ファイルの更新日時とサイズ, 読み込み結果)
+_cache:Dict[str, Tuple[tuple, Union[Content, 'CompiledContent']]] = {}
+
+def create_prototypes(units:list, unit_type:UnitType)->Tuple[UnitPrototype, ...]:
+    """読み込んだユニットに使用可能なコマンドをセットし、プロトタイプにする
+
+    Args:
+        units (list): 読み込んだユニットのリスト
+        unit_type (UnitType): ユニットタイプ
+
+    Returns:
+        Tuple[UnitPrototype, ...]: プロトタイプ
+    """
+    commands = PlayerCommands if unit_type == UnitType.PLAYER else EnemyCommands
+    prototypes = []
+    for unit in units:
+        # 複製したUnitどうしで共有するため、リストは変更不可のタプルにする
+        unit.commands = tuple(unit.commands)
+        unit.command_pattern = tuple(int(key in unit.commands) for key in commands)
+        unit.command_ids = tuple(list(commands).index(key) for key in unit.commands)
+        prototypes.append(UnitPrototype(tuple(getattr(unit, name) for name in UNIT_FIELDS)))
+    return tuple(prototypes)
+
+def load_content(data_folder_path:str)->Content:
+    """データフォルダを読み込む
+
+    同じプロセスで同じフォルダを読み込む場合は、ファイルが更新されていなければ前回の読み込み結果を返す。
+    フォルダに最新のJSONからコンパイルしたcontent.binがある場合は、JSONを読み込まずにそれを使う。
+
+    Args:
+        data_folder_path (str): Unitデータの格納先フォルダパス
+
+    Returns:
+        Content: 読み込み結果
+    """
+    folder = path.abspath(data_folder_path)
+    stamp = source_stamp(folder)
+    cached = _cache.get(folder)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    # 元のJSONから作成されたコンパイル済みデータがあれば、JSONの代わりにメモリマップして使う
+    content = None
+    compiled_path = path.join(folder, COMPILED_FILE)
+    if path.exists(compiled_path):
+        content = CompiledContent(compiled_path)
+        if content.source_stamp != stamp:
+            content = None
+    if content is None:
+        content = load_json_content(folder)
+    _cache[folder] = (stamp, content)
+    return content
+
+def load_json_content(data_folder_path:str)->Content:
+    """データフォルダのJSONファイルを読み込む
+
+    Args:
+        data_folder_path (str): Unitデータの格納先フォルダパス
+
+    Returns:
+        Content: 読み込み結果
+    """
+    return Content(
+        scenarios=tuple(load_scenarios(path.join(data_folder_path, 'scenarios.json'))),
+        players=create_prototypes(load_units(path.join(data_folder_path, 'player.json')), UnitType.PLAYER),
+        enemies=create_prototypes(load_units(path.join(data_folder_path, 'enemies.json')), UnitType.ENEMY),
+    )
+
+def source_stamp(data_folder_path:str)->tuple:
+    """データフォルダのJSONファイルの更新日時とサイズ
+
+    Args:
+        data_folder_path (str): Unitデータの格納先フォルダパス
+
+    Returns:
+        tuple: ファイルごとの (更新日時, サイズ)
+    """
+    return tuple((s.st_mtime_ns, s.st_size) for s in (os.stat(path.join(data_folder_path, name)) for name in CONTENT_FILES))
+
+def compile_content(data_folder_path:str, file_path:str=None)->str:
+    """データフォルダのJSONファイルを1つのバイナリファイルに変換する
+
+    ステータスは固定長の列、コマンドはコマンド表のビットマスクと使用順のID列、
+    装備の補正は計算済みの攻撃力・守備力として格納する。
+
+    Args:
+        data_folder_path (str): Unitデータの格納先フォルダパス
+        file_path (str, optional): 出力先. Defaults to None(データフォルダのcontent.bin).
+
+    Returns:
+        str: 出力したファイルのパス
+    """
+    folder = path.abspath(data_folder_path)
+    file_path = file_path or path.join(folder, COMPILED_FILE)
+    stamp = source_stamp(folder)
+    content = load_json_content(folder)
+
+    strings = bytearray()
+    def add_string(value:str)->Tuple[int, int]:
+        encoded = value.encode('utf-8')
+        strings.extend(encoded)
+        return len(strings) - len(encoded), len(encoded)
+
+    prototypes = content.players + content.enemies
+    units = [prototype.create() for prototype in prototypes]
+    width = max(len(unit.commands) for unit in units)
+    unit_table = np.zeros(len(units), dtype=UNIT_DTYPE)
+    commands = np.full((len(units), width), -1, dtype=np.int8)
+    for i, unit in enumerate(units):
+        keys = list(PlayerCommands if unit.unit_type == UnitType.PLAYER else EnemyCommands)
+        row = unit_table[i]
+        for name in ('unit_type', 'id', 'power', 'guard', 'attack', 'difense', 'speed', 'max_hp', 'max_mp'):
+            row[name] = getattr(unit, name)
+        row['lv'] = NO_LV if unit.lv is None else unit.lv
+        row['command_mask'] = sum(bit << j for j, bit in enumerate(unit.command_pattern))
+        row['n_commands'] = len(unit.commands)
+        for name in ('name', 'weapon', 'armor', 'shield'):
+            row[name] = add_string(getattr(unit, name))
+        commands[i, :len(unit.commands)] = [keys.index(key) for key in unit.commands]
+
+    # シナリオの敵はユニット表のindexで持つ(JSONと同じくenemies.jsonの並び順)
+    scenario_table = np.zeros(len(content.scenarios), dtype=SCENARIO_DTYPE)
+    enemy_ids = []
+    scenario_enemies = []
+    for i, scenario in enumerate(content.scenarios):
+        row = scenario_table[i]
+        row['scenario_code'] = add_string(scenario.scenario_code)
+        row['player_lv'] = scenario.player_lv
+        row['enemy_ids'] = len(enemy_ids), len(scenario.enemies)
+        enemy_ids.extend(scenario.enemies)
+        index = [len(content.players) + j for j, enemy in enumerate(content.enemies) if enemy.id in scenario.enemies]
+        row['enemies'] = len(scenario_enemies), len(index)
+        scenario_enemies.extend(index)
+
+    sections = [
+        unit_table.tobytes(), commands.tobytes(), scenario_table.tobytes(),
+        np.array(enemy_ids, dtype='<i4').tobytes(), np.array(scenario_enemies, dtype='<i4').tobytes(), bytes(strings),
+    ]
+    header = COMPILED_HEADER.pack(
+        COMPILED_MAGIC, COMPILED_VERSION, len(units), width, len(content.scenarios), len(scenario_enemies), len(strings),
+        *[value for file_stamp in stamp for value in file_stamp])
+
+    # 書き込み途中のファイルを読み込まないよう、一時ファイルに書いてから置き換える
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+    # Windowsではメモリマップ中のファイルを置き換えられないので、このプロセスで読み込んだものは先に閉じる
+    release_compiled(file_path)
+    os.replace(temp_path, file_path)
+    return file_path
+
+def release_compiled(file_path:str):
+    """読み込み済みのコンパイル済みデータファイルのメモリマップを閉じ、読み込み結果を破棄する
+
+    Args:
+        file_path (str): コンパイル済みデータファイルのパス
+    """
+    file_path = path.abspath(file_path)
+    for folder, (_, content) in list(_cache.items()):
+        if isinstance(content, CompiledContent) and content.file_path == file_path:
+            content.close()
+            del _cache[folder]
+
+class CompiledContent():
+    """compile_contentで作成したバイナリファイルをメモリマップして参照するContent
+
+    ファイルは読み取り専用でメモリマップするので、同じファイルを読み込むプロセス間でページが共有される。
+    ユニットは必要になったものだけをプロトタイプに変換する。
+    """
+    def __init__(self, file_path:str):
+        """コンストラクタ
+
+        Args:
+            file_path (str): コンパイル済みデータファイルのパス
+        """
+        self.file_path = path.abspath(file_path)
+        with open(file_path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, n_units, width, n_scenarios, n_scenario_enemies, n_strings,
+            *stamp) = COMPILED_HEADER.unpack_from(self.buffer, 0)
+        if magic != COMPILED_MAGIC or version != COMPILED_VERSION:
+            raise ValueError(f'unsupported content file: {file_path}')
+        self.source_stamp = tuple(zip(stamp[0::2], stamp[1::2]))
+
+        offset = COMPILED_HEADER.size
+        def section(dtype, count:int, shape:tuple=None)->np.ndarray:
+            nonlocal offset
+            array = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array if shape is None else array.reshape(shape)
+
+        self.units = section(UNIT_DTYPE, n_units)
+        self.commands = section(np.int8, n_units * width, (n_units, width))
+        self.scenario_table = section(SCENARIO_DTYPE, n_scenarios)
+        n_enemy_ids = int(self.scenario_table['enemy_ids'][:, 1].sum())
+        self.enemy_ids = section('<i4', n_enemy_ids)
+        self.scenario_enemy_index = section('<i4', n_scenario_enemies)
+        self.strings = self.buffer[offset:offset + n_strings]
+
+        # lru_cacheはインスタンスごとに持つ
+        self.prototype = lru_cache(maxsize=None)(self.prototype)
+
+    def close(self):
+        """メモリマップを閉じる
+
+        作成済みのプロトタイプとシナリオはファイルを参照しないので、閉じた後も使用できる。
+        それ以外のファイルを参照する操作はValueErrorを送出する。
+        """
+        # ファイルを参照している配列を先に解放しないとメモリマップを閉じられない
+        self.units = self.commands = self.scenario_table = self.enemy_ids = self.scenario_enemy_index = None
+        self.buffer.close()
+
+    def check_open(self):
+        """メモリマップが閉じられていないことを確かめる
+
+        Raises:
+            ValueError: closeでメモリマップを閉じた後に、ファイルを参照しようとした
+        """
+        if self.buffer.closed:
+            raise ValueError(f'content is closed: {self.file_path}')
+
+    def string(self, position)->str:
+        """文字列領域から文字列を取り出す
+
+        Args:
+            position: (開始位置, 長さ)
+
+        Returns:
+            str: 文字列
+        """
+        start, length = int(position[0]), int(position[1])
+        return self.strings[start:start + length].decode('utf-8')
+
+    def prototype(self, index:int)->UnitPrototype:
+        """ユニット表の1行をプロトタイプに変換する
+
+        Args:
+            index (int): ユニット表のindex
+
+        Returns:
+            UnitPrototype: プロトタイプ
+        """
+        self.check_open()
+        row = self.units[index]
+        unit_type = int(row['unit_type'])
+        keys = list(PlayerCommands if unit_type == UnitType.PLAYER else EnemyCommands)
+        mask = int(row['command_mask'])
+        lv = int(row['lv'])
+        command_ids = tuple(int(i) for i in self.commands[index, :int(row['n_commands'])])
+        values = {
+            'unit_type': unit_type,
+            'id': int(row['id']),
+            'name': self.string(row['name']),
+            'attack': int(row['attack']),
+            'power': int(row['power']),
+            'difense': int(row['difense']),
+            'guard': int(row['guard']),
+            'speed': int(row['speed']),
+            'max_hp': int(row['max_hp']),
+            'hp': int(row['max_hp']),
+            'max_mp': int(row['max_mp']),
+            'mp': int(row['max_mp']),
+            'commands': tuple(keys[i] for i in command_ids),
+            'lv': None if lv == NO_LV else lv,
+            'weapon': self.string(row['weapon']),
+            'armor': self.string(row['armor']),
+            'shield': self.string(row['shield']),
+            'seal_spell': False,
+            'sleep': False,
+            'n_sleep_tern': 0,
+            'command_pattern': tuple((mask >> i) & 1 for i in range(len(keys))),
+            'command_ids': command_ids,
+        }
+        return UnitPrototype(tuple(values[name] for name in UNIT_FIELDS))
+
+    def scenario_row(self, scenario_code:str)->int:
+        """シナリオ表のindexを取得する
+
+        Args:
+            scenario_code (str): シナリオコード
+
+        Returns:
+            int: シナリオ表のindex
+        """
+        self.check_open()
+        return [self.string(code) for code in self.scenario_table['scenario_code']].index(scenario_code)
+
+    @cached_property
+    def scenarios(self)->Tuple[Scenario, ...]:
+        self.check_open()
+        scenarios = []
+        for row in self.scenario_table:
+            start, count = row['enemy_ids']
+            scenarios.append(Scenario(
+                scenario_code=self.string(row['scenario_code']),
+                player_lv=int(row['player_lv']),
+                enemies=self.enemy_ids[start:start + count].tolist(),
+            ))
+        return tuple(scenarios)
+
+    @property
+    def players(self)->Tuple[UnitPrototype, ...]:
+        self.check_open()
+        return tuple(self.prototype(int(i)) for i in np.flatnonzero(self.units['unit_type'] == UnitType.PLAYER))
+
+    @property
+    def enemies(self)->Tuple[UnitPrototype, ...]:
+        self.check_open()
+        return tuple(self.prototype(int(i)) for i in np.flatnonzero(self.units['unit_type'] == UnitType.ENEMY))
+
+    def scenario(self, scenario_code:str)->Scenario:
+        """シナリオを取得する
+
+        Args:
+            scenario_code (str): シナリオコード
+
+        Returns:
+            Scenario: シナリオ
+        """
+        return self.scenarios[self.scenario_row(scenario_code)]
+
+    def player(self, lv:int)->UnitPrototype:
+        """指定したレベルのプレイヤーのプロトタイプを取得する
+
+        Args:
+            lv (int): プレイヤーのレベル
+
+        Returns:
+            UnitPrototype: プレイヤーのプロトタイプ
+        """
+        self.check_open()
+        index = np.flatnonzero((self.units['unit_type'] == UnitType.PLAYER) & (self.units['lv'] == lv))[0]
+        return self.prototype(int(index))
+
+    def scenario_enemies(self, scenario:Scenario)->Tuple[UnitPrototype, ...]:
+        """シナリオに出現する敵のプロトタイプを取得する(enemies.jsonの並び順)
+
+        Args:
+            scenario (Scenario): シナリオ
+
+        Returns:
+            Tuple[UnitPrototype, ...]: 敵のプロトタイプ
+        """
+        self.check_open()
+        start, count = self.scenario_table[self.scenario_row(scenario.scenario_code)]['enemies']
+        return tuple(self.prototype(int(i)) for i in self.scenario_enemy_index[start:start + count])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='データフォルダのJSONファイルをバイナリファイルに変換します。')
+    parser.add_argument('data', nargs='?', default='battle/data/', help='Unitデータの格納先フォルダパス')
+    parser.add_argument('--output', default=None, help='出力先(既定はデータフォルダのcontent.bin)')
+    args = parser.parse_args()
+    print(compile_content(args.data, args.output))
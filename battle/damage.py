@@ -0,0 +1,57 @@
+from functools import lru_cache
+from typing import Tuple
+
+# 通常攻撃のダメージの乱数(randrange(256))の種類
+N_ATTACK_SAMPLES = 256
+
+@lru_cache(maxsize=None)
+def attack_table(attack:int, difense:int)->Tuple[int, ...]:
+    """通常攻撃のダメージ表
+
+    攻撃力・守備力の組み合わせごとに1度だけ計算し、乱数(randrange(256))をindexとして参照する。
+    0以下の値はダメージなし(0か1がランダムで決まる)を表す。
+
+    Args:
+        attack (int): 攻撃側の攻撃力
+        difense (int): 攻撃対象の守備力
+
+    Returns:
+        Tuple[int, ...]: 乱数ごとのダメージ
+    """
+    base = attack - (difense // 2)
+    return tuple(int(base // (2 + sample / 128)) for sample in range(N_ATTACK_SAMPLES))
+
+@lru_cache(maxsize=None)
+def attack_distribution(attack:int, difense:int)->Tuple[Tuple[int, float], ...]:
+    """通常攻撃のダメージの確率分布
+
+    Args:
+        attack (int): 攻撃側の攻撃力
+        difense (int): 攻撃対象の守備力
+
+    Returns:
+        Tuple[Tuple[int, float], ...]: (ダメージ, 確率)のタプル
+    """
+    distribution = {}
+    for damage in attack_table(attack, difense):
+        if damage <= 0:
+            # ダメージが0以下の場合は 0 か 1 がランダムで決まる
+            distribution[0] = distribution.get(0, 0.0) + 0.5 / N_ATTACK_SAMPLES
+            distribution[1] = distribution.get(1, 0.0) + 0.5 / N_ATTACK_SAMPLES
+        else:
+            distribution[damage] = distribution.get(damage, 0.0) + 1 / N_ATTACK_SAMPLES
+    return tuple(sorted(distribution.items()))
+
+@lru_cache(maxsize=None)
+def uniform_distribution(min_value:int, max_value:int)->Tuple[Tuple[int, float], ...]:
+    """呪文のダメージ・回復量(randint(min_value, max_value))の確率分布
+
+    Args:
+        min_value (int): 最小値
+        max_value (int): 最大値
+
+    Returns:
+        Tuple[Tuple[int, float], ...]: (値, 確率)のタプル
+    """
+    p = 1 / (max_value - min_value + 1)
+    return tuple((value, p) for value in range(min_value, max_value + 1))
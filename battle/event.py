@@ -0,0 +1,82 @@
+from itertools import islice
+from typing import Iterator, Tuple
+
+# ユニット番号(イベントの行動者・対象者)
+# 0 = プレイヤー、1以降 = 出現する敵(Battle.enemiesのindex + 1)
+PLAYER_NO = 0
+
+class EventCode():
+    """コマンド以外のイベント
+
+    コマンドの実行はコマンド表(PlayerCommands/EnemyCommands)のキーの並び順(0以上)で表し、
+    それ以外のイベントは負の値で表す。
+    毎ターン記録するので、列挙型ではなくintの定数にする。
+    """
+    SLEEPING = -1   # 眠っていて行動できない
+    WAIT = -2       # 様子を見ている(使えないコマンドを選択した)
+    DEAD = -3       # プレイヤー死亡
+    DEFEAT = -4     # 敵を倒した
+    REMAINING = -5  # 残り戦闘回数
+    APPEAR = -6     # 新たな敵が出現した
+    COMPLETE = -7   # 10回の戦闘を終了した
+
+class EventFlag():
+    """イベントの付加情報(intのビットフラグ)"""
+    NONE = 0
+    WOKE_UP = 1      # 行動前に目を覚ました
+    KNOCKED_OUT = 2  # 対象ユニットが倒れた
+    ESCAPED = 4      # 逃走に成功した
+    SEALED = 8       # 呪文が封じられていて失敗した
+    NO_MP = 16       # MP不足で呪文が失敗した
+
+class Outcome():
+    """stepで戦闘が終わった結果(Simulation.outcome)
+
+    報酬の値からは逃走と勝利を区別できない場合があるため、集計ではこの値を使う。
+    """
+    NONE = 0        # 戦闘継続中(またはreset直後)
+    DEFEAT = 1      # 敵を倒した(敵が逃げ出した場合を含む)
+    ESCAPE = 2      # プレイヤーが逃げ切った
+    DEAD = 3        # プレイヤーが死亡した
+
+class EventBuffer():
+    """戦闘イベントを整数レコードとして格納する再利用可能なバッファ
+
+    1レコードは (行動者のユニット番号, 対象者のユニット番号, コマンドIDまたはEventCode, 数値, EventFlag) の5つの整数のタプル。
+    レコードは確保済みのリストに先頭から上書きし、clearは件数を戻すだけにする。
+    """
+
+    def __init__(self, capacity:int=8):
+        """コンストラクタ
+
+        Args:
+            capacity (int, optional): 最初に確保するレコード数(足りない場合は倍に増やす). Defaults to 8.
+        """
+        self.records = [None] * capacity
+        self.n = 0
+
+    def clear(self):
+        """格納したイベントを破棄する"""
+        self.n = 0
+
+    def append(self, actor:int, target:int, code:int, amount:int=0, flags:int=EventFlag.NONE):
+        """イベントを記録する
+
+        Args:
+            actor (int): 行動者のユニット番号
+            target (int): 対象者のユニット番号
+            code (int): コマンドIDまたはEventCode
+            amount (int, optional): ダメージ量・回復量などの数値. Defaults to 0.
+            flags (int, optional): EventFlag. Defaults to EventFlag.NONE.
+        """
+        n = self.n
+        if n == len(self.records):
+            self.records.extend([None] * n)
+        self.records[n] = (actor, target, code, amount, flags)
+        self.n = n + 1
+
+    def __len__(self)->int:
+        return self.n
+
+    def __iter__(self)->Iterator[Tuple[int, int, int, int, int]]:
+        return islice(self.records, self.n)
@@ -0,0 +1,83 @@
+import numpy as np
+
+class BlockRandom():
+    """NumPyの乱数生成器で乱数をまとめて生成し、1つずつ取り出す乱数生成器
+
+    random.Random と同じ random/randrange/randint/seed を持つので、
+    Battle・コマンド・Unitに渡す乱数生成器として使用できる。
+    """
+    def __init__(self, seed:int=None, block_size:int=4096):
+        """コンストラクタ
+
+        Args:
+            seed (int, optional): 乱数シード. Defaults to None.
+            block_size (int, optional): 1回にまとめて生成する乱数の数. Defaults to 4096.
+        """
+        self.block_size = block_size
+        self.seed(seed)
+
+    def seed(self, seed:int=None):
+        """乱数を固定する
+
+        Args:
+            seed (int, optional): 乱数シード. Defaults to None.
+        """
+        self.generator = np.random.default_rng(seed)
+        self.fill()
+
+    def fill(self):
+        """次のブロックの乱数を生成する"""
+        self.block = self.generator.random(self.block_size).tolist()
+        self.position = 0
+
+    def random(self)->float:
+        """[0, 1)の乱数
+
+        Returns:
+            float: 乱数
+        """
+        if self.position == self.block_size:
+            self.fill()
+        value = self.block[self.position]
+        self.position += 1
+        return value
+
+    def randrange(self, stop:int)->int:
+        """[0, stop)の整数の乱数
+
+        Args:
+            stop (int): 上限(この値を含まない)
+
+        Returns:
+            int: 乱数
+        """
+        return int(self.random() * stop)
+
+    def randint(self, a:int, b:int)->int:
+        """[a, b]の整数の乱数
+
+        Args:
+            a (int): 下限
+            b (int): 上限(この値を含む)
+
+        Returns:
+            int: 乱数
+        """
+        return a + int(self.random() * (b - a + 1))
+
+    def getstate(self)->tuple:
+        """乱数生成器の内部状態を取得する
+
+        Returns:
+            tuple: 内部状態
+        """
+        return self.generator.bit_generator.state, self.block, self.position
+
+    def setstate(self, state:tuple):
+        """乱数生成器の内部状態を復元する
+
+        Args:
+            state (tuple): getstateで取得した内部状態
+        """
+        bit_generator_state, self.block, self.position = state
+        self.generator.bit_generator.state = bit_generator_state
@@ -0,0 +1,601 @@
+import argparse
+import math
+from functools import lru_cache, reduce
+from typing import List, Tuple
+
+import numpy as np
+
+from battle.battle import Battle
+from battle.damage import attack_distribution, uniform_distribution
+from battle.command import PlayerCommands, EnemyCommands, Command, Attack, AttackSpell, RecoverSpell, SealSpell, SleepSpell, Escape
+from battle.unit import Unit
+
+# 報酬・戦闘回数(RPGTurnBattle.Simulation.stepと同じ値)
+N_BATTLE = 10
+WIN_REWARD = 1
+CLEAR_REWARD = 10
+DEAD_REWARD = -20
+
+# 睡眠状態(Unit.sleep, Unit.n_sleep_tern の組み合わせ)
+AWAKE = 0         # 起きている
+FALL_ASLEEP = 1   # 眠った直後(n_sleep_tern == 0、次の起床判定では必ず眠ったまま)
+ASLEEP = 2        # 眠っている(n_sleep_tern >= 1、起床判定で1/3の確率で起きる)
+
+# 状態空間の軸
+(PLAYER_HP, PLAYER_SPENT, PLAYER_SEAL, PLAYER_SLEEP, ENEMY_HP, ENEMY_SPENT, ENEMY_SEAL, ENEMY_SLEEP) = range(8)
+N_AXES = 8
+
+# 解の成分(価値、死亡確率、倒した敵の数の期待値)
+VALUE = 0
+DEATH = 1
+WINS = 2
+N_COMPONENTS = 3
+
+@lru_cache(maxsize=None)
+def encount_hp_distribution(max_hp:int)->Tuple[Tuple[int, float], ...]:
+    """遭遇時の敵のHP(最大HPの75～100％)の確率分布
+
+    Args:
+        max_hp (int): 敵の最大HP
+
+    Returns:
+        Tuple[Tuple[int, float], ...]: (HP, 確率)のタプル
+    """
+    distribution = {}
+    for sample in range(256):
+        hp = max_hp - int(max_hp * (sample / 1024))
+        distribution[hp] = distribution.get(hp, 0.0) + 1 / 256
+    return tuple(sorted(distribution.items()))
+
+def hp_matrix(max_hp:int, distribution)->np.ndarray:
+    """HPの変化の遷移確率の行列(HPは0～最大HPに収まる)
+
+    Args:
+        max_hp (int): 最大HP
+        distribution: (HPの変化量, 確率)のタプル
+
+    Returns:
+        np.ndarray: 遷移確率 (変化前のHP, 変化後のHP)
+    """
+    hp = np.arange(max_hp + 1)
+    matrix = np.zeros((max_hp + 1, max_hp + 1))
+    for change, p in distribution:
+        matrix[hp, np.clip(hp + change, 0, max_hp)] += p
+    return matrix
+
+def mp_unit(unit:Unit, commands:dict)->int:
+    """ユニットのMPの変化の最小単位(使用する呪文の消費MPの最大公約数)
+
+    Args:
+        unit (Unit): 対象ユニット
+        commands (dict): ユニットが使用するコマンド表
+
+    Returns:
+        int: MPの変化の最小単位(呪文を使わない場合は0)
+    """
+    costs = [commands[key].used_mp for key in unit.commands if hasattr(commands[key], 'used_mp')]
+    return reduce(math.gcd, costs, 0)
+
+def sleep_state(unit:Unit, n_states:int)->int:
+    """ユニットの睡眠状態を状態空間の座標に変換する
+
+    Args:
+        unit (Unit): 対象ユニット
+        n_states (int): 状態空間の睡眠状態の数(眠らない場合は1)
+
+    Returns:
+        int: 睡眠状態
+    """
+    if n_states == 1 or not unit.sleep:
+        return AWAKE
+    return FALL_ASLEEP if unit.n_sleep_tern == 0 else ASLEEP
+
+class StateSpace():
+    """1種類の敵との戦闘中の状態空間
+
+    状態は (プレイヤーHP, プレイヤーの消費MP, プレイヤー封印, プレイヤー睡眠,
+    敵HP, 敵の消費MP, 敵封印, 敵睡眠) の格子で表し、1次元のindexに変換して扱う。
+    消費MPはMPの変化の最小単位を1とした値。
+    """
+    def __init__(self, player:Unit, enemy:Unit, player_sleep:bool):
+        """コンストラクタ
+
+        Args:
+            player (Unit): プレイヤー
+            enemy (Unit): 敵
+            player_sleep (bool): プレイヤーが眠る可能性がある(シナリオのいずれかの敵が睡眠呪文を使う)
+        """
+        self.player = player
+        self.enemy = enemy
+        self.player_mp_unit = mp_unit(player, PlayerCommands)
+        self.enemy_mp_unit = mp_unit(enemy, EnemyCommands)
+
+        self.shape = (
+            player.max_hp + 1,
+            player.max_mp // self.player_mp_unit + 1 if self.player_mp_unit else 1,
+            2 if 'magic_seal' in enemy.commands else 1,
+            3 if player_sleep else 1,
+            enemy.max_hp + 1,
+            enemy.max_mp // self.enemy_mp_unit + 1 if self.enemy_mp_unit else 1,
+            2 if 'magic_seal' in player.commands else 1,
+            3 if 'sleep' in player.commands else 1,
+        )
+        self.size = int(np.prod(self.shape))
+        self.strides = np.cumprod((1,) + self.shape[:0:-1])[::-1]
+
+        (self.player_hp, player_spent, self.player_seal, self.player_sleep,
+            self.enemy_hp, enemy_spent, self.enemy_seal, self.enemy_sleep) = np.indices(self.shape, dtype=np.int32).reshape(len(self.shape), -1)
+        self.player_mp = player.max_mp - player_spent * self.player_mp_unit
+        self.enemy_mp = enemy.max_mp - enemy_spent * self.enemy_mp_unit
+        # 各軸の座標(状態空間の形に放送できる形)
+        self.grid = np.indices(self.shape, sparse=True)
+
+        # 戦闘継続中の状態(両者のHPが1以上)
+        self.interior = (self.player_hp > 0) & (self.enemy_hp > 0)
+
+    def to_index(self, player_hp, player_mp, player_seal, player_sleep, enemy_hp, enemy_mp, enemy_seal, enemy_sleep)->np.ndarray:
+        """各ステータスの値を状態のindexに変換する
+
+        Returns:
+            np.ndarray: 状態のindex
+        """
+        player_spent = (self.player.max_mp - player_mp) // self.player_mp_unit if self.player_mp_unit else 0
+        enemy_spent = (self.enemy.max_mp - enemy_mp) // self.enemy_mp_unit if self.enemy_mp_unit else 0
+        coordinates = (player_hp, player_spent, player_seal, player_sleep, enemy_hp, enemy_spent, enemy_seal, enemy_sleep)
+        return sum(np.asarray(c, dtype=np.int64) * int(s) for c, s in zip(coordinates, self.strides))
+
+class Transition():
+    """1つのコマンドの実行による状態遷移
+
+    状態の変化は状態空間の軸ごとに独立なので、遷移先のindexを使わずに格子のまま計算する。
+    HPの変化はHPの軸に沿った遷移確率の行列、MPの消費は消費MPの軸に沿ったずらし、
+    封印・睡眠・逃走は対象の軸の値の固定で表す。
+    """
+    def __init__(self, p:float=1.0, valid:np.ndarray=None, mp_axis:int=None, mp_cost:int=0,
+                 hp_axis:int=None, hp_matrix:np.ndarray=None, set_axis:int=None, set_value:int=0):
+        """コンストラクタ
+
+        Args:
+            p (float, optional): 遷移の確率. Defaults to 1.0.
+            valid (np.ndarray, optional): コマンドが効果を持つ状態(状態空間に放送できる形). Defaults to None(すべて).
+            mp_axis (int, optional): 消費MPの軸. Defaults to None.
+            mp_cost (int, optional): 消費MP(MPの変化の最小単位を1とした値). Defaults to 0.
+            hp_axis (int, optional): HPが変化する軸. Defaults to None.
+            hp_matrix (np.ndarray, optional): HPの遷移確率の行列 (変化前のHP, 変化後のHP). Defaults to None.
+            set_axis (int, optional): 値を固定する軸. Defaults to None.
+            set_value (int, optional): 固定する値. Defaults to 0.
+        """
+        self.p = p
+        self.valid = valid
+        # 軸は末尾から数える(価値の配列の先頭に行動などの次元を追加できるようにする)
+        self.mp_axis = None if mp_axis is None else mp_axis - N_AXES
+        self.mp_cost = mp_cost
+        self.hp_axis = None if hp_axis is None else hp_axis - N_AXES
+        self.hp_matrix = hp_matrix
+        self.set_axis = None if set_axis is None else set_axis - N_AXES
+        self.set_value = set_value
+
+    def apply(self, value:np.ndarray)->np.ndarray:
+        """遷移後の価値から、遷移前の状態の価値(確率を掛けたもの)を求める
+
+        Args:
+            value (np.ndarray): 遷移後の状態の価値 (..., 状態空間の形)
+
+        Returns:
+            np.ndarray: 遷移前の状態の価値 (valueと放送できる形)
+        """
+        next_value = value
+        if self.mp_cost:
+            # MPが足りない状態は範囲外になるが、validで元の状態の価値に置き換える
+            size = value.shape[self.mp_axis]
+            next_value = np.take(next_value, np.minimum(np.arange(size) + self.mp_cost, size - 1), axis=self.mp_axis)
+        if self.set_axis is not None:
+            next_value = np.take(next_value, [self.set_value], axis=self.set_axis)
+        if self.hp_matrix is not None:
+            next_value = np.moveaxis(np.tensordot(self.hp_matrix, next_value, axes=([1], [self.hp_axis])), 0, self.hp_axis)
+        if self.valid is not None:
+            next_value = np.where(self.valid, next_value, value)
+        return self.p * next_value
+
+class HalfStep():
+    """一方のユニットが1回行動したときの状態遷移表
+
+    行動ごとに状態遷移(Transition)のリストと逃走成功確率を保持する。
+    状態遷移は行動するユニットが起きているものとして計算し、
+    眠っている場合は起床判定の遷移を別に適用する。
+    """
+    def __init__(self, transitions:List[List[Transition]], escape:List[float], sleep_axis:int=None):
+        """コンストラクタ
+
+        Args:
+            transitions (List[List[Transition]]): 行動ごとの状態遷移のリスト
+            escape (List[float]): 行動ごとの逃走成功確率
+            sleep_axis (int, optional): 行動するユニットの睡眠状態の軸. Defaults to None(眠らない).
+        """
+        self.transitions = transitions
+        self.escape = escape
+        self.sleep_axis = None if sleep_axis is None else sleep_axis - N_AXES
+
+    def action_values(self, value:np.ndarray, escape_value:np.ndarray=None)->np.ndarray:
+        """行動後の価値から、各行動を選んだときの行動前の価値を求める
+
+        Args:
+            value (np.ndarray): 行動後の状態の価値 (..., 状態空間の形)
+            escape_value (np.ndarray, optional): 逃走成功時の価値 (状態空間の形). Defaults to None.
+
+        Returns:
+            np.ndarray: 各行動の価値 (行動数, ..., 状態空間の形)
+        """
+        awake_value = value
+        if self.sleep_axis is not None:
+            # 行動しても自分の睡眠状態は変わらないので、起きている状態だけ計算する
+            awake_value = np.take(value, [AWAKE], axis=self.sleep_axis)
+            if escape_value is not None:
+                escape_value = np.take(escape_value, [AWAKE], axis=self.sleep_axis)
+        q = np.zeros((len(self.transitions),) + awake_value.shape)
+        for action, transitions in enumerate(self.transitions):
+            for transition in transitions:
+                q[action] += transition.apply(awake_value)
+            if self.escape[action] > 0:
+                q[action] += self.escape[action] * escape_value
+        if self.sleep_axis is None:
+            return q
+
+        # 眠った直後は必ず眠ったまま、以降は起床判定で1/3の確率で起きて行動する
+        asleep_value = np.broadcast_to(np.take(value, [ASLEEP], axis=self.sleep_axis), q.shape)
+        return np.concatenate([q, asleep_value, q / 3 + asleep_value * 2 / 3], axis=self.sleep_axis)
+
+class Solver():
+    """動的計画法による最適方策と勝率・死亡率の厳密解
+
+    プレイヤーと敵のHP・MP・封印・睡眠状態、先攻後攻、戦闘回数からなる状態空間を列挙し、
+    価値反復で最適な行動価値を求める。敵の残りHPや先攻後攻はAIに与えられる状態には含まれないため、
+    求まる値は完全情報下での上限(DQNの評価の基準)となる。
+    """
+    def __init__(self, data_folder_path:str, scenario_code:str, tolerance:float=1e-9, max_iterations:int=100000):
+        """コンストラクタ
+
+        Args:
+            data_folder_path (str): Unitデータの格納先フォルダパス
+            scenario_code (str): ゲームのシナリオ
+            tolerance (float, optional): 価値反復の収束判定の閾値. Defaults to 1e-9.
+            max_iterations (int, optional): 価値反復の最大回数. Defaults to 100000.
+        """
+        battle = Battle(data_folder_path, scenario_code)
+        self.player = battle.player
+        self.enemies = battle.enemies
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+        player_sleep = any('sleep' in enemy.commands for enemy in self.enemies)
+        self.spaces = [StateSpace(self.player, enemy, player_sleep) for enemy in self.enemies]
+        self.steps = [(self.player_step(space), self.enemy_step(space)) for space in self.spaces]
+
+        # 戦闘開始時の価値は (プレイヤーHP, プレイヤーの消費MP, プレイヤー睡眠) の格子で持つ
+        self.start_shape = self.spaces[0].shape[:2] + self.spaces[0].shape[3:4]
+
+        # 解：[戦闘回数][敵の種類][先攻] ごとの最適行動
+        self.policies = None
+        # 解：戦闘回数ごとの戦闘開始時の価値 (プレイヤーの状態数, 成分数)
+        self.start_values = None
+
+    def player_step(self, space:StateSpace)->HalfStep:
+        """プレイヤーの行動の状態遷移表を作成する
+
+        Args:
+            space (StateSpace): 状態空間
+
+        Returns:
+            HalfStep: プレイヤーの行動の状態遷移表
+        """
+        transitions = []
+        escape = []
+        for key in self.player.commands:
+            transition, p_escape = self.command_transition(space, PlayerCommands[key], True)
+            transitions.append([transition])
+            escape.append(p_escape)
+        return HalfStep(transitions, escape, None if space.shape[PLAYER_SLEEP] == 1 else PLAYER_SLEEP)
+
+    def enemy_step(self, space:StateSpace)->HalfStep:
+        """敵の行動の状態遷移表を作成する(コマンドは等確率で選ばれる)
+
+        Args:
+            space (StateSpace): 状態空間
+
+        Returns:
+            HalfStep: 敵の行動の状態遷移表(行動は1種類)
+        """
+        transitions = []
+        commands = space.enemy.commands
+        for key in sorted(set(commands), key=commands.index):
+            transition, _ = self.command_transition(space, EnemyCommands[key], False, commands.count(key) / len(commands))
+            transitions.append(transition)
+        return HalfStep([transitions], [0.0], None if space.shape[ENEMY_SLEEP] == 1 else ENEMY_SLEEP)
+
+    def command_transition(self, space:StateSpace, command:Command, is_player:bool, p:float=1.0)->Tuple[Transition, float]:
+        """1つのコマンドの実行結果の状態遷移を求める
+
+        Args:
+            space (StateSpace): 状態空間
+            command (Command): 実行するコマンド
+            is_player (bool): プレイヤーの行動か
+            p (float, optional): コマンドが選ばれる確率. Defaults to 1.0.
+
+        Returns:
+            Tuple[Transition, float]: 状態遷移, 逃走成功確率
+        """
+        grid = space.grid
+        if is_player:
+            action_unit, target_unit, mp_unit = space.player, space.enemy, space.player_mp_unit
+            hp_axis, mp_axis, seal_axis = PLAYER_HP, PLAYER_SPENT, PLAYER_SEAL
+            target_hp_axis, target_seal_axis, target_sleep_axis = ENEMY_HP, ENEMY_SEAL, ENEMY_SLEEP
+        else:
+            action_unit, target_unit, mp_unit = space.enemy, space.player, space.enemy_mp_unit
+            hp_axis, mp_axis, seal_axis = ENEMY_HP, ENEMY_SPENT, ENEMY_SEAL
+            target_hp_axis, target_seal_axis, target_sleep_axis = PLAYER_HP, PLAYER_SEAL, PLAYER_SLEEP
+
+        if isinstance(command, Attack):
+            distribution = [(-damage, q) for damage, q in attack_distribution(action_unit.attack, target_unit.difense)]
+            return Transition(p, hp_axis=target_hp_axis, hp_matrix=hp_matrix(target_unit.max_hp, distribution)), 0.0
+
+        if isinstance(command, Escape):
+            if not is_player:
+                # モンスターは必ず逃走成功(HPが0になる)
+                return Transition(p, set_axis=hp_axis, set_value=0), 0.0
+            speed = action_unit.speed * 4
+            p_escape = speed / (speed + target_unit.speed)
+            return Transition(p * (1 - p_escape)), p * p_escape
+
+        # 呪文：封印状態またはMP不足の場合は何も起こらない
+        valid = (grid[seal_axis] == 0) & (action_unit.max_mp - grid[mp_axis] * mp_unit >= command.used_mp)
+        spell = dict(valid=valid, mp_axis=mp_axis, mp_cost=command.used_mp // mp_unit)
+        if isinstance(command, AttackSpell):
+            distribution = [(-damage, q) for damage, q in uniform_distribution(command.min_damage, command.max_damage)]
+            return Transition(p, hp_axis=target_hp_axis, hp_matrix=hp_matrix(target_unit.max_hp, distribution), **spell), 0.0
+        if isinstance(command, RecoverSpell):
+            distribution = uniform_distribution(command.min_recover, command.max_recover)
+            return Transition(p, hp_axis=hp_axis, hp_matrix=hp_matrix(action_unit.max_hp, distribution), **spell), 0.0
+        if isinstance(command, SealSpell):
+            return Transition(p, set_axis=target_seal_axis, set_value=1, **spell), 0.0
+        if isinstance(command, SleepSpell):
+            return Transition(p, set_axis=target_sleep_axis, set_value=FALL_ASLEEP, **spell), 0.0
+        raise ValueError(f'unknown command: {command.name}')
+
+    def solve(self)->'Solver':
+        """全戦闘回数・全状態の最適方策と価値を求める
+
+        Returns:
+            Solver: self
+        """
+        # 10回戦闘終了後の価値
+        next_start = np.zeros((int(np.prod(self.start_shape)), N_COMPONENTS))
+        next_start[:, VALUE] = CLEAR_REWARD
+
+        self.policies = [None] * N_BATTLE
+        self.start_values = [None] * N_BATTLE
+        # 1つ後の戦闘回数の解を価値反復の初期値にする(方策はほぼ変わらないので収束が早い)
+        values = {}
+        for n_battle in reversed(range(N_BATTLE)):
+            start = np.zeros_like(next_start)
+            self.policies[n_battle] = []
+            for enemy_no, (space, (player_step, enemy_step)) in enumerate(zip(self.spaces, self.steps)):
+                policies = {}
+                for is_first_attack in (True, False):
+                    key = (enemy_no, is_first_attack)
+                    value, policies[is_first_attack] = self.solve_battle(space, player_step, enemy_step, is_first_attack, next_start, values.get(key))
+                    values[key] = value
+                    p_first = self.first_attack_probability(space.enemy)
+                    weight = (p_first if is_first_attack else 1 - p_first) / len(self.spaces)
+                    start += weight * self.encount_values(space, value)
+                self.policies[n_battle].append(policies)
+            self.start_values[n_battle] = start
+            next_start = start
+        return self
+
+    def first_attack_probability(self, enemy:Unit)->float:
+        """プレイヤーが先攻になる確率
+
+        Args:
+            enemy (Unit): 遭遇した敵
+
+        Returns:
+            float: 先攻になる確率
+        """
+        speed = self.player.speed * 4
+        return speed / (speed + enemy.speed)
+
+    def encount_values(self, space:StateSpace, value:np.ndarray)->np.ndarray:
+        """敵と遭遇した時点の価値を、遭遇時の敵HPの分布で平均して求める
+
+        Args:
+            space (StateSpace): 遭遇した敵の状態空間
+            value (np.ndarray): 戦闘中の状態の価値 (状態数, 成分数)
+
+        Returns:
+            np.ndarray: 戦闘開始時の価値 (プレイヤーの状態数, 成分数)
+        """
+        player_hp, player_spent, player_sleep = np.indices(self.start_shape).reshape(3, -1)
+        player_mp = self.player.max_mp - player_spent * space.player_mp_unit
+        result = np.zeros((len(player_hp), N_COMPONENTS))
+        for enemy_hp, p in encount_hp_distribution(space.enemy.max_hp):
+            index = space.to_index(player_hp, player_mp, 0, player_sleep, enemy_hp, space.enemy.max_mp, 0, AWAKE)
+            result += p * value[index]
+        return result
+
+    def solve_battle(self, space:StateSpace, player_step:HalfStep, enemy_step:HalfStep, is_first_attack:bool, next_start:np.ndarray, initial_value:np.ndarray=None)->Tuple[np.ndarray, np.ndarray]:
+        """1回の戦闘の最適方策と価値を価値反復で求める
+
+        方策は価値の成分だけで決まるので、価値反復は価値の成分だけで行い、
+        求めた方策を固定して死亡確率を評価する。倒した敵の数の期待値は報酬の内訳から求める
+        (価値 = WIN_REWARD × 倒した数 + CLEAR_REWARD × (1 - 死亡確率) + DEAD_REWARD × 死亡確率)。
+
+        Args:
+            space (StateSpace): 戦闘中の敵の状態空間
+            player_step (HalfStep): プレイヤーの行動の状態遷移表
+            enemy_step (HalfStep): 敵の行動の状態遷移表
+            is_first_attack (bool): プレイヤーが先攻か
+            next_start (np.ndarray): 次の戦闘開始時の価値 (プレイヤーの状態数, 成分数)
+            initial_value (np.ndarray, optional): 価値反復の初期値 (状態数, 成分数). Defaults to None(0で初期化).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 各状態の価値 (状態数, 成分数), 各状態の最適行動
+        """
+        # 戦闘終了時の価値
+        start_index = (space.player_hp * space.shape[1] + (space.player.max_mp - space.player_mp) // max(space.player_mp_unit, 1)) * space.shape[3] + space.player_sleep
+        escape_value = next_start[start_index]
+        terminal = escape_value + np.array([WIN_REWARD, 0, 1])
+        terminal[space.player_hp == 0] = (DEAD_REWARD, 1, 0)
+        if initial_value is None:
+            initial_value = np.zeros((space.size, N_COMPONENTS))
+
+        # 価値の成分で最適方策を求める
+        value = initial_value[:, VALUE]
+        for _ in range(self.max_iterations):
+            q = self.action_values(space, player_step, enemy_step, is_first_attack, np.where(space.interior, value, terminal[:, VALUE]), escape_value[:, VALUE])
+            policy = np.argmax(q, axis=0)
+            new_value = np.take_along_axis(q, policy[None], axis=0)[0]
+            delta = np.max(np.abs(new_value - value)[space.interior])
+            value = new_value
+            if delta < self.tolerance:
+                break
+
+        # 方策を固定して死亡確率を求める
+        death = initial_value[:, DEATH]
+        for _ in range(self.max_iterations):
+            q = self.action_values(space, player_step, enemy_step, is_first_attack, np.where(space.interior, death, terminal[:, DEATH]), escape_value[:, DEATH])
+            new_death = np.take_along_axis(q, policy[None], axis=0)[0]
+            delta = np.max(np.abs(new_death - death)[space.interior])
+            death = new_death
+            if delta < self.tolerance:
+                break
+
+        wins = (value - CLEAR_REWARD - (DEAD_REWARD - CLEAR_REWARD) * death) / WIN_REWARD
+        value = np.stack([value, death, wins], axis=1)
+        return np.where(space.interior[:, None], value, terminal), policy.astype(np.int8)
+
+    def action_values(self, space:StateSpace, player_step:HalfStep, enemy_step:HalfStep, is_first_attack:bool, after:np.ndarray, escape_value:np.ndarray)->np.ndarray:
+        """1ターン後の価値から、ターン開始時に各行動を選んだときの価値を求める
+
+        Args:
+            space (StateSpace): 戦闘中の敵の状態空間
+            player_step (HalfStep): プレイヤーの行動の状態遷移表
+            enemy_step (HalfStep): 敵の行動の状態遷移表
+            is_first_attack (bool): プレイヤーが先攻か
+            after (np.ndarray): 1ターン後の状態の価値(戦闘終了した状態は終了時の価値) (状態数,)
+            escape_value (np.ndarray): 逃走成功時の価値 (状態数,)
+
+        Returns:
+            np.ndarray: 各行動の価値 (行動数, 状態数)
+        """
+        # 状態は格子の形のまま計算する
+        after = after.reshape(space.shape)
+        escape_value = escape_value.reshape(space.shape)
+        if is_first_attack:
+            # プレイヤーの行動後、敵が生きていれば敵が行動する
+            enemy_q = enemy_step.action_values(after)[0]
+            q = player_step.action_values(np.where(space.grid[ENEMY_HP] > 0, enemy_q, after), escape_value)
+            return q.reshape(len(q), -1)
+
+        # 敵の行動後、プレイヤーが生きていればプレイヤーが行動する
+        player_q = player_step.action_values(after, escape_value)
+        player_q = np.where(space.grid[PLAYER_HP] > 0, player_q, after)
+        return enemy_step.action_values(player_q)[0].reshape(len(player_q), -1)
+
+    def results(self)->dict:
+        """最初の戦闘開始時(プレイヤーが全快の状態)の厳密解
+
+        Returns:
+            dict: 報酬の期待値(value)、死亡確率(death)、10回の戦闘を生き残る確率(survive)、倒した敵の数の期待値(wins)
+        """
+        index = np.ravel_multi_index((self.player.max_hp, 0, AWAKE), self.start_shape)
+        value, death, wins = self.start_values[0][index]
+        return {'value': value, 'death': death, 'survive': 1 - death, 'wins': wins}
+
+    def select_action(self, env)->int:
+        """環境の現在の状態での最適行動を選択する(solveの実行後に使用する)
+
+        Args:
+            env : 行動を選択する環境(RPGTurnBattle.Simulation)
+
+        Returns:
+            int: 最適行動のindex
+        """
+        battle = env.battle
+        player, enemy = battle.player, battle.enemy
+        space = self.spaces[battle.enemy_no - 1]
+        index = space.to_index(player.hp, player.mp, int(player.seal_spell), sleep_state(player, space.shape[3]),
+            enemy.hp, enemy.mp, int(enemy.seal_spell), sleep_state(enemy, space.shape[7]))
+        return int(self.policies[env.n_battle][battle.enemy_no - 1][battle.is_firat_attack][index])
+
+    def test(self, test_env, n_episode:int, is_render:bool=False)->Tuple[list, int]:
+        """最適方策によるプレイのテスト(solveの実行後に使用する)
+
+        Args:
+            test_env: テスト対象の環境
+            n_episode (int): テストするエピソード数
+            is_render (bool): テスト中のバトルメッセージを表示する. Defaults to False.
+
+        Returns:
+            Tuple[list, int]: 各エピソードの獲得報酬、全エピソードの死亡回数の合計
+        """
+        result_rewards = []
+        dead_count = 0
+
+        # バトルメッセージは表示する場合のみ生成する
+        headless = test_env.headless
+        test_env.headless = not is_render
+
+        try:
+            for i in range(n_episode):
+                test_env.reset()
+                total_reward = 0
+                done = False
+
+                while not done:
+                    if is_render:
+                        print(test_env.render())
+
+                    _, reward, done, message = test_env.step(self.select_action(test_env))
+                    total_reward += reward
+
+                    if is_render:
+                        print(message)
+
+                result_rewards.append(total_reward)
+
+                # HPが0になったら死亡回数をカウントする
+                if test_env.battle.player.hp == 0:
+                    dead_count += 1
+
+                if is_render:
+                    print(f'獲得報酬は{total_reward}です。')
+        finally:
+            # 例外で中断した場合も環境の設定を戻す
+            test_env.headless = headless
+        return result_rewards, dead_count
+
+if __name__ == '__main__':
+    from RPGTurnBattle import Simulation
+    from battle.content import load_content
+
+    parser = argparse.ArgumentParser(description='シナリオごとに最適方策の報酬の期待値・死亡確率・倒した敵の数の期待値を求めます。')
+    parser.add_argument('--data', default='battle/data/', help='Unitデータの格納先フォルダパス')
+    parser.add_argument('--scenarios', nargs='+', default=None, help='対象のシナリオ(既定はすべてのシナリオ)')
+    parser.add_argument('--episodes', type=int, default=0, help='最適方策でプレイして厳密解と比べるエピソード数')
+    parser.add_argument('--policy-npz', default=None, help='最適方策と比べる学習済みモデル(export_npzで書き出したnpzファイルのパス)')
+    args = parser.parse_args()
+
+    scenario_codes = args.scenarios or [scenario.scenario_code for scenario in load_content(args.data).scenarios]
+    print('scenario\tvalue\tdeath\twins' + ('\ttest_reward\ttest_death' if args.episodes > 0 else '') + ('\tpolicy_reward' if args.policy_npz else ''))
+    for scenario_code in scenario_codes:
+        solver = Solver(args.data, scenario_code).solve()
+        results = solver.results()
+        columns = [scenario_code, f'{results["value"]:.3f}', f'{results["death"]:.4f}', f'{results["wins"]:.3f}']
+        if args.episodes > 0:
+            rewards, dead_count = solver.test(Simulation(args.data, scenario_code, headless=True), args.episodes)
+            columns += [f'{np.mean(rewards):.3f}', f'{dead_count / args.episodes:.4f}']
+        if args.policy_npz:
+            from AIPlayer.Evaluation import evaluate
+            from AIPlayer.NumpyPolicy import NumpyPolicy
+            columns.append(f'{evaluate(NumpyPolicy(args.policy_npz), args.data, scenario_code).mean_reward()[0]:.3f}')
+        print('\t'.join(columns))
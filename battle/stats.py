@@ -0,0 +1,72 @@
+import math
+from typing import Tuple
+
+# 信頼区間(95％)の係数
+Z_95 = 1.96
+
+def wilson_interval(successes:int, n:int, z:float=Z_95)->Tuple[float, float, float]:
+    """比率とWilsonスコアの信頼区間
+
+    エピソードが0件の場合は、推定値をnan、信頼区間を[0, 1]にする。
+
+    Args:
+        successes (int): 該当したエピソードの数
+        n (int): エピソード数
+        z (float, optional): 信頼区間の係数. Defaults to Z_95.
+
+    Returns:
+        Tuple[float, float, float]: 推定値, 下限, 上限
+    """
+    if n == 0:
+        return math.nan, 0.0, 1.0
+    p = successes / n
+    center = (p + z ** 2 / (2 * n)) / (1 + z ** 2 / n)
+    width = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n * n)) / (1 + z ** 2 / n)
+    return p, max(center - width, 0.0), min(center + width, 1.0)
+
+def mean_interval(total:float, total_sq:float, n:int, z:float=Z_95)->Tuple[float, float, float]:
+    """エピソードごとの値の平均と信頼区間
+
+    エピソードが0件の場合はすべてnanにする。
+
+    Args:
+        total (float): 値の和
+        total_sq (float): 値の二乗和
+        n (int): エピソード数
+        z (float, optional): 信頼区間の係数. Defaults to Z_95.
+
+    Returns:
+        Tuple[float, float, float]: 推定値, 下限, 上限
+    """
+    if n == 0:
+        return math.nan, math.nan, math.nan
+    mean = total / n
+    variance = max(total_sq - n * mean * mean, 0.0) / max(n - 1, 1)
+    width = z * math.sqrt(variance / n)
+    return mean, mean - width, mean + width
+
+def ratio_interval(total:float, total_sq:float, total_encounters:float, encounters:int, encounters_sq:int, n:int, z:float=Z_95)->Tuple[float, float, float]:
+    """遭遇した敵1体あたりの比率と、エピソード単位のデルタ法による信頼区間
+
+    遭遇数はエピソードごとに異なるので、エピソードを単位として (分子 - 比率 × 遭遇数) の分散から幅を求める。
+    遭遇した敵が0体の場合はすべてnanにする。
+
+    Args:
+        total (float): 分子の和
+        total_sq (float): 分子の二乗和
+        total_encounters (float): 分子と遭遇数の積の和
+        encounters (int): 遭遇数の和
+        encounters_sq (int): 遭遇数の二乗和
+        n (int): エピソード数
+        z (float, optional): 信頼区間の係数. Defaults to Z_95.
+
+    Returns:
+        Tuple[float, float, float]: 推定値, 下限, 上限
+    """
+    if encounters == 0:
+        return math.nan, math.nan, math.nan
+    r = total / encounters
+    # 残差 (分子 - r * 遭遇数) の二乗和
+    residual = max(total_sq - 2 * r * total_encounters + r * r * encounters_sq, 0.0)
+    width = z * math.sqrt(residual / max(n - 1, 1) / n) / (encounters / n)
+    return r, r - width, r + width
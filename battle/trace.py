@@ -0,0 +1,215 @@
+import mmap
+import os
+import random
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Tuple
+
+import numpy as np
+
+from battle.rng import BlockRandom
+
+# ファイルヘッダ: マジック, バージョン, プレイヤーのレベル(0はシナリオのレベル), シナリオ名のバイト数, 乱数生成器のクラス名のバイト数
+# (ヘッダの後にシナリオ名と乱数生成器のクラス名が続く)
+TRACE_MAGIC = b'RPGT'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<4sIIHH')
+# エピソードのヘッダ: 乱数シード, ステップ数, フラグ
+EPISODE_HEADER = struct.Struct('<QIB')
+
+# エピソードのフラグ
+FLAG_CHECKSUM = 1       # ステップごとの状態のチェックサムを含む
+FLAG_INCOMPLETE = 2     # エピソードの途中でresetされた
+
+def state_checksum(state:np.ndarray)->int:
+    """状態のチェックサム(float32に変換した値のCRC32)
+
+    get_statusの戻り値とset_observation_bufferの書き込み先のどちらでも同じ値になる。
+
+    Args:
+        state (np.ndarray): 状態
+
+    Returns:
+        int: チェックサム
+    """
+    return zlib.crc32(np.ascontiguousarray(state, dtype=np.float32))
+
+@dataclass(frozen=True)
+class TraceEpisode:
+    """記録したエピソード(乱数シードと行動の列)"""
+    seed: int
+    actions: bytes              # ステップごとの行動のindex
+    checksums: np.ndarray       # ステップ後の状態のチェックサム(記録しない場合はNone)
+    complete: bool              # エピソードの終端まで記録した
+
+class TraceWriter():
+    """エピソードを乱数シードと行動の列として追記するクラス
+
+    1エピソード分のレコードを1回のwriteで書き込んでフラッシュするので、
+    途中で強制終了しても、それまでに終わったエピソードは読み出せる。
+    """
+
+    def __init__(self, file_path:str, env, checksum:bool=False):
+        """コンストラクタ
+
+        既存のファイルに追記する場合は、シナリオ・プレイヤーのレベル・乱数生成器の種類が一致している必要がある。
+
+        Args:
+            file_path (str): 記録ファイルのパス
+            env (Simulation): 記録する環境
+            checksum (bool, optional): ステップごとの状態のチェックサムも記録する. Defaults to False.
+        """
+        self.checksum = checksum
+        self.file = open(file_path, 'ab')
+        header = encode_header(env.scenario_code, env.player_lv, type(env.rng).__name__)
+        if self.file.tell() == 0:
+            self.file.write(header)
+            self.file.flush()
+        else:
+            with open(file_path, 'rb') as f:
+                if f.read(len(header)) != header:
+                    self.file.close()
+                    raise ValueError(f'シナリオ・プレイヤーのレベル・乱数生成器の種類が異なる記録ファイルです: {file_path}')
+
+    def write_episode(self, seed:int, actions:bytearray, checksums:List[int]=None, complete:bool=True):
+        """1エピソードを追記する
+
+        Args:
+            seed (int): エピソード開始時の乱数シード
+            actions (bytearray): ステップごとの行動のindex
+            checksums (List[int], optional): ステップ後の状態のチェックサム. Defaults to None.
+            complete (bool, optional): エピソードの終端まで記録した. Defaults to True.
+        """
+        flags = (FLAG_CHECKSUM if checksums is not None else 0) | (0 if complete else FLAG_INCOMPLETE)
+        record = EPISODE_HEADER.pack(seed, len(actions), flags) + bytes(actions)
+        if checksums is not None:
+            record += np.asarray(checksums, dtype='<u4').tobytes()
+        self.file.write(record)
+        self.file.flush()
+
+    def close(self):
+        """ファイルを閉じる"""
+        self.file.close()
+
+class TraceReader():
+    """TraceWriterで記録したファイルを読み出すクラス
+
+    ファイルはメモリマップし、エピソードの位置だけを先に調べる。
+    書き込み途中で途切れた末尾のレコードは無視する。
+    """
+
+    def __init__(self, file_path:str):
+        """コンストラクタ
+
+        Args:
+            file_path (str): 記録ファイルのパス
+        """
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < TRACE_HEADER.size:
+                raise ValueError(f'unsupported trace file: {file_path}')
+            self.buffer = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+        magic, version, player_lv, n_scenario, n_rng = TRACE_HEADER.unpack_from(self.buffer, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f'unsupported trace file: {file_path}')
+        offset = TRACE_HEADER.size
+        self.scenario_code = self.buffer[offset:offset + n_scenario].decode('utf-8')
+        offset += n_scenario
+        self.rng_name = self.buffer[offset:offset + n_rng].decode('utf-8')
+        offset += n_rng
+        self.player_lv = player_lv if player_lv > 0 else None
+
+        # エピソードごとのレコードの位置
+        self.offsets:List[int] = []
+        while offset + EPISODE_HEADER.size <= size:
+            _, n_steps, flags = EPISODE_HEADER.unpack_from(self.buffer, offset)
+            end = offset + EPISODE_HEADER.size + n_steps * (5 if flags & FLAG_CHECKSUM else 1)
+            if end > size:
+                break
+            self.offsets.append(offset)
+            offset = end
+
+    def __len__(self)->int:
+        return len(self.offsets)
+
+    def __getitem__(self, i:int)->TraceEpisode:
+        """i番目のエピソードを読み出す
+
+        Args:
+            i (int): エピソードの番号
+
+        Returns:
+            TraceEpisode: エピソード
+        """
+        offset = self.offsets[i]
+        seed, n_steps, flags = EPISODE_HEADER.unpack_from(self.buffer, offset)
+        offset += EPISODE_HEADER.size
+        actions = self.buffer[offset:offset + n_steps]
+        checksums = None
+        if flags & FLAG_CHECKSUM:
+            checksums = np.frombuffer(self.buffer, dtype='<u4', count=n_steps, offset=offset + n_steps).copy()
+        return TraceEpisode(seed, actions, checksums, not flags & FLAG_INCOMPLETE)
+
+    def __iter__(self)->Iterator[TraceEpisode]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """メモリマップを閉じる"""
+        self.buffer.close()
+
+def encode_header(scenario_code:str, player_lv:int=None, rng_name:str='Random')->bytes:
+    """ファイルヘッダを作成する
+
+    Args:
+        scenario_code (str): ゲームのシナリオ
+        player_lv (int, optional): プレイヤーのレベル. Defaults to None(シナリオのレベル).
+        rng_name (str, optional): 乱数生成器のクラス名. Defaults to 'Random'.
+
+    Returns:
+        bytes: ファイルヘッダ
+    """
+    scenario = scenario_code.encode('utf-8')
+    rng = rng_name.encode('utf-8')
+    return TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, player_lv or 0, len(scenario), len(rng)) + scenario + rng
+
+def new_env(reader:TraceReader, data_folder_path:str='battle/data/', headless:bool=True):
+    """記録した時と同じシナリオ・レベル・乱数生成器の環境を作成する
+
+    Args:
+        reader (TraceReader): 記録ファイル
+        data_folder_path (str, optional): Unitデータの格納先フォルダパス. Defaults to 'battle/data/'.
+        headless (bool, optional): stepでバトルメッセージを生成しない. Defaults to True.
+
+    Returns:
+        Simulation: 環境
+    """
+    # RPGTurnBattleはこのモジュールを読み込むので、ここで読み込む
+    from RPGTurnBattle import Simulation
+
+    rng = BlockRandom() if reader.rng_name == BlockRandom.__name__ else random.Random()
+    return Simulation(data_folder_path, reader.scenario_code, headless=headless, rng=rng, player_lv=reader.player_lv)
+
+def replay(env, episode:TraceEpisode, on_reset:Callable[..., None]=None)->Iterator[Tuple[int, tuple, bool]]:
+    """記録したエピソードを環境で再現する
+
+    Args:
+        env (Simulation): 記録した時と同じシナリオ・レベル・乱数生成器の環境(記録は設定しない、new_envで作成できる)
+        episode (TraceEpisode): エピソード
+        on_reset (Callable[..., None], optional): resetの直後に環境を渡して呼び出す関数(最初の状態の表示などに使う). Defaults to None.
+
+    Yields:
+        Tuple[int, tuple, bool]: 行動のindex, stepの戻り値, 状態のチェックサムが一致した(記録しない場合はNone)
+    """
+    env.seed(episode.seed)
+    env.reset()
+    if on_reset is not None:
+        on_reset(env)
+    for i, action in enumerate(episode.actions):
+        result = env.step(action)
+        matched = None
+        if episode.checksums is not None:
+            matched = state_checksum(result[0]) == int(episode.checksums[i])
+        yield action, result, matched
@@ -10,7 +10,7 @@ class UnitType(IntEnum):
     PLAYER = 0
     ENEMY = 1
 
-@dataclass
+@dataclass(slots=True)
 class Unit:
     """戦闘ユニット"""
     # ステータス
@@ -39,6 +39,8 @@ class Unit:
 
     # プレイヤーやモンスターが使えるコマンドのリストをAIに通知するためのリスト
     command_pattern: list = field(default=None, init=False)
+    # commandsの各コマンドのコマンドID(コマンド表のキーの並び順)
+    command_ids: tuple = field(default=None, init=False)
 
     def __post_init__(self):
         item = items.Items()
@@ -75,13 +77,16 @@ class Unit:
         self.sleep = False
         self.n_sleep_tern == 0
 
-    def judge_awake(self)->bool:
+    def judge_awake(self, rng=random)->bool:
         """起床判定
 
+        Args:
+            rng (optional): 乱数生成器(random.Random互換). Defaults to random.
+
         Returns:
             bool: True = 起床
         """
-        sample = random.randrange(3)
+        sample = rng.randrange(3)
         if self.n_sleep_tern == 0:
             self.n_sleep_tern += 1
         elif sample == 0:
@@ -0,0 +1,524 @@
+import math
+
+import numpy as np
+
+from battle.battle import Battle
+from battle.damage import attack_table
+from battle.command import PlayerCommands, EnemyCommands, Attack, AttackSpell, RecoverSpell, SealSpell, SleepSpell, Escape
+
+# 乱数は16bitの一様乱数として生成し、確率・範囲はこのビット数を基準に計算する
+RANDOM_BITS = 16
+RANDOM_RANGE = 1 << RANDOM_BITS
+# 通常攻撃のダメージ表のindexのビット数(randrange(256) + ダメージなしの場合の randint(0, 1))
+ATTACK_BITS = 9
+# 遭遇時の敵のHP(randrange(256))のビット数
+ENCOUNT_HP_BITS = 8
+# 起床判定(randrange(3) == 0)が成功する16bit乱数の上限
+AWAKE_THRESHOLD = -(-RANDOM_RANGE // 3)
+# 1ターンに使う乱数の組の数(プレイヤーの行動, 敵の行動, 敵のコマンド選択)
+N_RANDOM_BLOCKS = 3
+# HP・MP・ダメージ・回復量の型(小さい型ほど配列演算が速い)
+# 通常はint8で計算し、データのステータスがint8に収まらない場合だけWIDE_STATUS_DTYPEで計算する
+STATUS_DTYPE = np.int8
+WIDE_STATUS_DTYPE = np.int16
+# 表のindexの型(表がint16で引ける大きさに収まらない場合だけWIDE_INDEX_DTYPEを使う)
+INDEX_DTYPE = np.int16
+WIDE_INDEX_DTYPE = np.int32
+
+def probability_limit(p:float)->int:
+    """確率pで成功する16bit乱数の上限(乱数 <= 上限 で成功)"""
+    return min(max(int(round(p * RANDOM_RANGE)) - 1, 0), RANDOM_RANGE - 1)
+
+def uniform_attack_table(attack:int, difense:int)->np.ndarray:
+    """通常攻撃のダメージ表(配列演算用)
+
+    indexの上位8bitは randrange(256)、最下位bitはダメージなしの場合の randint(0, 1) の値とする。
+
+    Args:
+        attack (int): 攻撃側の攻撃力
+        difense (int): 攻撃対象の守備力
+
+    Returns:
+        np.ndarray: 乱数ごとのダメージ
+    """
+    table = np.repeat(np.array(attack_table(attack, difense), dtype=np.int16), 2)
+    no_damage = table <= 0
+    table[no_damage] = np.tile(np.array([0, 1], dtype=np.int16), len(table) // 2)[no_damage]
+    return table
+
+class UnitArrays():
+    """N体分のユニットの戦闘中に変化するステータスを配列で保持する"""
+    def __init__(self, n:int, status_dtype=STATUS_DTYPE):
+        self.hp = np.zeros(n, dtype=status_dtype)
+        self.mp = np.zeros(n, dtype=status_dtype)
+        self.seal_spell = np.zeros(n, dtype=bool)
+        self.sleep = np.zeros(n, dtype=bool)
+        self.n_sleep_tern = np.zeros(n, dtype=status_dtype)
+
+class ActionArrays():
+    """N体分のユニットの1ターンの行動結果のうち、行動時の状態によらない部分
+
+    配列は作成時に確保して毎ターン上書きする。
+    このターンに選択した戦闘がない結果はNone、選択していない戦闘の値は0(False)。
+    """
+    def __init__(self, n:int, status_dtype=STATUS_DTYPE):
+        self.buffers = {
+            # 呪文を選択した戦闘と消費MP
+            'spell': np.zeros(n, dtype=bool),
+            'used_mp': np.zeros(n, dtype=status_dtype),
+            # 相手へのダメージ
+            'damage': np.zeros(n, dtype=status_dtype),
+            # 回復量(最大HPを超える分は行動時に除く)
+            'recover': np.zeros(n, dtype=status_dtype),
+            # 逃走成功
+            'escape': np.zeros(n, dtype=bool),
+            # 相手の呪文を封印する・相手を眠らせる
+            'seal_spell': np.zeros(n, dtype=bool),
+            'sleep': np.zeros(n, dtype=bool),
+        }
+        self.clear()
+
+    def clear(self):
+        """すべての結果をNoneにする"""
+        for name in self.buffers:
+            setattr(self, name, None)
+
+    def add(self, name:str, value:np.ndarray):
+        """コマンドの結果を足し合わせる(選択した戦闘が重ならないので、和が各戦闘の結果になる)
+
+        Args:
+            name (str): 結果の名前
+            value (np.ndarray): 選択していない戦闘を0(False)にしたコマンドの結果
+        """
+        total = getattr(self, name)
+        if total is None:
+            total = self.buffers[name]
+            if value is not total:
+                np.copyto(total, value)
+            setattr(self, name, total)
+        else:
+            np.add(total, value, out=total)
+
+    def out(self, name:str, work:np.ndarray)->np.ndarray:
+        """コマンドの結果の書き込み先(最初の結果は足し合わせる配列に直接書き込む)
+
+        Args:
+            name (str): 結果の名前
+            work (np.ndarray): 2つ目以降の結果の書き込み先(作業用の配列)
+
+        Returns:
+            np.ndarray: 書き込み先
+        """
+        return self.buffers[name] if getattr(self, name) is None else work
+
+class VectorBattle():
+    """N個の戦闘を配列演算でまとめて進める戦闘エンジン
+
+    battle.Battleと同じルールで、N人のプレイヤーとN体の敵の戦闘を同時に進める。
+    メッセージは生成しない。
+    決着した戦闘(activeがFalse)は行動しないので、次の戦闘はencount(プレイヤーが死亡した場合はreset後にencount)で開始する。
+
+    乱数は1ターン分をまとめて16bitの一様乱数として生成し、確率・ダメージは乱数から計算する(確率の誤差は 1/65536 程度)。
+    コマンドは戦闘を並べ替えたり添字で取り出したりせず、全戦闘の配列にマスクを掛けて反映する。
+    途中の計算は作成時に確保した作業用の配列に書き込み、毎ターン新しい配列を確保しない。
+    ステータスはint8で計算し、マスク(bool)はint8として掛ける(同じ型同士の演算の方が速い)。
+    ステータスがint8に収まらないデータや、表がint16のindexで引けない大きさになるデータでは、
+    作成時にint16のステータス・int32のindexに切り替える(遅くなるが、同じ結果になる)。
+    """
+    def __init__(self, data_folder_path:str, scenario_code:str, n:int, rng:np.random.Generator=None):
+        """コンストラクタ
+
+        Args:
+            data_folder_path (str): Unitデータの格納先フォルダパス
+            scenario_code (str): ゲームのシナリオ
+            n (int): 同時に進める戦闘の数
+            rng (np.random.Generator, optional): 乱数生成器. Defaults to None.
+        """
+        battle = Battle(data_folder_path, scenario_code)
+        player = battle.player
+        enemies = battle.enemies
+        self.n = n
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        # プレイヤーのステータス(全戦闘で同じ)
+        self.player_max_hp = player.max_hp
+        self.player_max_mp = player.max_mp
+        # 行動index -> コマンド
+        self.player_commands = [PlayerCommands[key] for key in player.commands]
+        self.player_command_ids = np.arange(len(player.commands), dtype=np.int32)
+        enemy_command_keys = list(dict.fromkeys(key for e in enemies for key in e.commands))
+        self.enemy_commands = [EnemyCommands[key] for key in enemy_command_keys]
+        # 敵のコマンド選択の乱数の範囲(各敵のコマンド数の最小公倍数)
+        self.enemy_choice_size = math.lcm(*(len(e.commands) for e in enemies))
+
+        # 通常攻撃のダメージ表
+        player_attack_tables = [uniform_attack_table(player.attack, e.difense) for e in enemies]
+        enemy_attack_tables = [uniform_attack_table(e.attack, player.difense) for e in enemies]
+
+        # 表のindexはint16、ステータスはint8で計算する(収まらない場合だけ大きい型にする)
+        table_size = len(enemies) * self.enemy_choice_size << ATTACK_BITS
+        self.index_dtype = INDEX_DTYPE if table_size <= np.iinfo(INDEX_DTYPE).max else WIDE_INDEX_DTYPE
+        if table_size > np.iinfo(self.index_dtype).max:
+            raise ValueError(f'出現する敵の種類・コマンドが多すぎます: {len(enemies)}')
+        statuses = [player.max_hp, player.max_mp] + [status for e in enemies for status in (e.max_hp, e.max_mp)]
+        statuses += [int(table.max()) for table in player_attack_tables + enemy_attack_tables]
+        for command in self.player_commands + self.enemy_commands:
+            statuses += [getattr(command, name, 0) for name in ('used_mp', 'max_damage', 'max_recover')]
+        self.status_dtype = STATUS_DTYPE if max(statuses) <= np.iinfo(STATUS_DTYPE).max else WIDE_STATUS_DTYPE
+        if max(statuses) > np.iinfo(self.status_dtype).max:
+            raise ValueError(f'ステータスが大きすぎます: {max(statuses)}')
+        status_dtype = self.status_dtype
+        # 表の値に詰めるステータスのビット数
+        # 遭遇時の表は下位から HP, MP, 先攻・逃走の判定の上限、敵の行動表は下位から コマンド, 通常攻撃のダメージ の順に詰める
+        self.status_bits = np.iinfo(status_dtype).bits
+
+        # プレイヤーの通常攻撃のダメージ表 [敵の種類, 乱数]
+        self.player_attack_table = np.concatenate(player_attack_tables).astype(status_dtype)
+
+        # 出現する敵の種類ごとのステータス表
+        self.enemy_max_hp = np.array([e.max_hp for e in enemies], dtype=status_dtype)
+        self.enemy_max_mp = np.array([e.max_mp for e in enemies], dtype=status_dtype)
+        # 遭遇時の表 [敵の種類, randrange(256)]
+        # 遭遇時のHP(ランダムで75～100％の状態)、MP、先攻・プレイヤーの逃走が成功する16bit乱数の上限(どちらもSpeed差による同じ確率)を
+        # 1つの値に詰めて、1回の表引きでまとめて取り出す
+        player_speed = player.speed * 4
+        self.encount_table = np.array([
+            [
+                e.max_hp - int(e.max_hp * (sample / 1024))
+                | e.max_mp << self.status_bits
+                | probability_limit(player_speed / (player_speed + e.speed)) << (self.status_bits * 2)
+                for sample in range(1 << ENCOUNT_HP_BITS)
+            ]
+            for e in enemies
+        ], dtype=np.uint32 if self.status_bits == 8 else np.uint64).ravel()
+
+        # 敵の行動表 [敵の種類, コマンド選択の乱数, 通常攻撃の乱数]
+        # コマンドは各敵のコマンド数の最小公倍数の列に均等に並べ、乱数で列を選ぶ(どの敵もコマンドを等確率で選ぶ)
+        # コマンドと通常攻撃のダメージを1つの値に詰めて、1回の表引きでまとめて取り出す
+        self.enemy_action_table = np.array([
+            [
+                enemy_command_keys.index(e.commands[i * len(e.commands) // self.enemy_choice_size])
+                | table.astype(np.int32) << self.status_bits
+                for i in range(self.enemy_choice_size)
+            ]
+            for e, table in zip(enemies, enemy_attack_tables)
+        ], dtype=np.int32).ravel()
+
+        # 現在戦闘中の敵と、先攻・逃走が成功する16bit乱数の上限
+        self.enemy_index = np.zeros(n, dtype=self.index_dtype)
+        self.speed_limit = np.zeros(n, dtype=np.uint16)
+        # 敵の行動表の敵の種類の先頭index
+        self.enemy_action_base = np.zeros(n, dtype=self.index_dtype)
+        self.player = UnitArrays(n, status_dtype)
+        self.enemy = UnitArrays(n, status_dtype)
+
+        self.total_damage = np.zeros(n, dtype=np.int16 if status_dtype == STATUS_DTYPE else np.int32)
+        self.escape = np.zeros(n, dtype=bool)
+        self.is_firat_attack = np.zeros(n, dtype=bool)
+        # 戦闘中(encountしてから決着していない)
+        self.active = np.zeros(n, dtype=bool)
+
+        # 1ターン分の行動結果と作業用の配列
+        self.player_actions = ActionArrays(n, status_dtype)
+        self.enemy_actions = ActionArrays(n, status_dtype)
+        self.player_selected = [np.zeros(n, dtype=bool) for _ in self.player_commands]
+        self.enemy_selected = [np.zeros(n, dtype=bool) for _ in self.enemy_commands]
+        self.enemy_action = np.zeros(n, dtype=np.int32)
+        self.enemy_command = np.zeros(n, dtype=np.int8)
+        self.acting = np.zeros(n, dtype=bool)
+        self.mask = np.zeros(n, dtype=bool)
+        self.index = np.zeros(n, dtype=self.index_dtype)
+        self.values = np.zeros(n, dtype=status_dtype)
+        self.shifted = np.zeros(n, dtype=np.uint16)
+        # 表のindexに足し合わせる乱数(int16のindexでは同じ大きさの型として見る)
+        self.shifted_index = self.shifted.view(np.int16) if self.index_dtype == np.int16 else self.shifted
+        self.scaled = np.zeros(n, dtype=np.uint32)
+        self.encount_values = np.zeros(n, dtype=self.encount_table.dtype)
+        # HPの下限(np.maximumはスカラーより配列同士の方が速い)
+        self.zeros = np.zeros(n, dtype=status_dtype)
+
+    def random(self, n_blocks:int)->np.ndarray:
+        """戦闘数分の16bitの一様乱数をまとめて生成する
+
+        Args:
+            n_blocks (int): 乱数の組の数
+
+        Returns:
+            np.ndarray: [n_blocks, 戦闘数] の乱数
+        """
+        # 64bitの乱数を4つの16bit乱数として使う
+        total = n_blocks * self.n
+        return self.rng.bit_generator.random_raw(-(-total // 4)).view(np.uint16)[:total].reshape(n_blocks, self.n)
+
+    def scaled_random(self, sample:np.ndarray, n:int, out:np.ndarray)->np.ndarray:
+        """16bit乱数を 0～n-1 の一様乱数にする
+
+        Args:
+            sample (np.ndarray): 16bit乱数
+            n (int): 乱数の範囲
+            out (np.ndarray): 書き込み先
+
+        Returns:
+            np.ndarray: out
+        """
+        if n & (n - 1) == 0:
+            # 2のべき乗の場合は上位ビットをそのまま使う
+            scaled = np.right_shift(sample, RANDOM_BITS + 1 - n.bit_length(), out=self.shifted)
+        else:
+            np.multiply(sample, n, out=self.scaled, dtype=np.uint32)
+            scaled = np.right_shift(self.scaled, RANDOM_BITS, out=self.scaled)
+        np.copyto(out, scaled, casting='unsafe')
+        return out
+
+    def table_index(self, sample:np.ndarray, bits:int)->np.ndarray:
+        """敵の種類ごとの表([敵の種類, 2**bits])のindexを、16bit乱数の上位bitsビットから計算する
+
+        Args:
+            sample (np.ndarray): 16bit乱数
+            bits (int): 表の列のビット数
+
+        Returns:
+            np.ndarray: 表のindex(作業用の配列)
+        """
+        index = np.left_shift(self.enemy_index, bits, out=self.index)
+        np.right_shift(sample, RANDOM_BITS - bits, out=self.shifted)
+        return np.bitwise_or(index, self.shifted_index, out=index)
+
+    def reset(self, mask:np.ndarray=None):
+        """最初の戦闘開始状態に初期化する
+
+        Args:
+            mask (np.ndarray, optional): 初期化対象の戦闘. Defaults to None(すべて).
+        """
+        if mask is None:
+            mask = np.ones(self.n, dtype=bool)
+        elif not mask.any():
+            return
+        keep = np.logical_not(mask, out=self.mask)
+        self.blend(self.player.hp, self.player_max_hp, mask, self.values)
+        self.blend(self.player.mp, self.player_max_mp, mask, self.values)
+        self.player.seal_spell &= keep
+        self.player.sleep &= keep
+        self.total_damage *= keep
+        self.escape &= keep
+        self.active &= keep
+
+    def encount(self, mask:np.ndarray=None):
+        """敵とランダムエンカウント
+
+        新しい状態は全戦闘分を計算し、対象の戦闘だけに書き込む。
+
+        Args:
+            mask (np.ndarray, optional): エンカウント対象の戦闘. Defaults to None(すべて).
+        """
+        if mask is None:
+            mask = np.ones(self.n, dtype=bool)
+        elif not mask.any():
+            return
+        keep = np.logical_not(mask, out=self.mask)
+        # [敵の種類, 遭遇時のHP, 先攻] の乱数
+        type_sample, hp_sample, first_sample = self.random(3)
+
+        self.blend(self.enemy_index, self.scaled_random(type_sample, len(self.enemy_max_hp), self.index), mask, self.index)
+        np.multiply(self.enemy_index, self.enemy_choice_size << ATTACK_BITS, out=self.enemy_action_base)
+        # 表の値は下位からステータスのビット数ずつ取り出す
+        encount_values = self.encount_table.take(self.table_index(hp_sample, ENCOUNT_HP_BITS), out=self.encount_values, mode='clip')
+        # 遭遇時の敵のHPはランダムで75～100％の状態。
+        np.copyto(self.values, encount_values, casting='unsafe')
+        self.blend(self.enemy.hp, self.values, mask, self.values)
+        np.right_shift(encount_values, self.status_bits, out=encount_values)
+        np.copyto(self.values, encount_values, casting='unsafe')
+        self.blend(self.enemy.mp, self.values, mask, self.values)
+        self.enemy.seal_spell &= keep
+        self.enemy.sleep &= keep
+
+        # 各種戦闘ステータスリセット
+        self.total_damage *= keep
+        self.escape &= keep
+        self.active |= mask
+
+        # 先攻後攻を決める(敵の種類が変わらない戦闘の上限は変わらない)
+        np.right_shift(encount_values, self.status_bits, out=encount_values)
+        np.copyto(self.speed_limit, encount_values, casting='unsafe')
+        first = np.less_equal(first_sample, self.speed_limit, out=self.acting)
+        self.is_firat_attack &= keep
+        self.is_firat_attack |= np.logical_and(first, mask, out=first)
+
+    def blend(self, array:np.ndarray, value, mask:np.ndarray, work:np.ndarray):
+        """対象の戦闘の値を書き換える(添字で書き込むより、差にマスクを掛けて足す方が速い)
+
+        Args:
+            array (np.ndarray): 書き換える配列
+            value: 新しい値(配列かスカラー)
+            mask (np.ndarray): 対象の戦闘
+            work (np.ndarray): 作業用の配列(arrayと同じ型。valueと同じ配列でもよい)
+        """
+        diff = np.subtract(value, array, out=work)
+        np.multiply(diff, mask.view(np.int8), out=diff)
+        np.add(array, diff, out=array)
+
+    def act_one_turn(self, actions:np.ndarray)->np.ndarray:
+        """戦闘中の全戦闘を1ターン進める
+
+        決着した戦闘(activeがFalse)は行動せず、行動も無視する。
+        このターンで決着した戦闘はactiveがFalseになる。
+
+        Args:
+            actions (np.ndarray): 各プレイヤーの行動(範囲外の値は様子を見る)
+
+        Returns:
+            np.ndarray: 逃走成功
+        """
+        actions = np.asarray(actions)
+        # このターンの乱数 [プレイヤーの行動, 敵の行動, 敵のコマンド選択]
+        player_sample, enemy_sample, choice_sample = self.random(N_RANDOM_BLOCKS)
+
+        # 行動ごとの選択マスク(範囲外の行動はどの行動にも一致しないので、何もしない)
+        for i, selected in enumerate(self.player_selected):
+            np.equal(actions, i, out=selected)
+        self.prepare_actions(self.player_actions, zip(self.player_commands, self.player_selected), player_sample, True)
+        # 敵のコマンドと通常攻撃のダメージを選ぶ
+        index = np.left_shift(self.scaled_random(choice_sample, self.enemy_choice_size, self.index), ATTACK_BITS, out=self.index)
+        index += self.enemy_action_base
+        np.right_shift(enemy_sample, RANDOM_BITS - ATTACK_BITS, out=self.shifted)
+        index |= self.shifted_index
+        self.enemy_action_table.take(index, out=self.enemy_action, mode='clip')
+        np.copyto(self.enemy_command, self.enemy_action, casting='unsafe')
+        for i, selected in enumerate(self.enemy_selected):
+            np.equal(self.enemy_command, i, out=selected)
+        self.prepare_actions(self.enemy_actions, zip(self.enemy_commands, self.enemy_selected), enemy_sample, False)
+
+        # 味方の行動は先攻・後攻の戦闘をまとめて1回で反映し、敵の行動をその前後に分ける
+        active = self.active
+        first = self.is_firat_attack
+        acting = self.acting
+        # 後攻：敵の行動(active & ~first)
+        np.greater(active, first, out=acting)
+        self.apply_actions(self.enemy_actions, acting, self.enemy, self.player, False)
+        # 味方の行動(後攻の戦闘では生きていれば行動する)
+        np.greater(self.player.hp, 0, out=acting)
+        self.apply_actions(self.player_actions, np.logical_and(acting, active, out=acting), self.player, self.enemy, True)
+        # 先攻：敵の行動(敵が生きていれば行動する)
+        np.greater(self.enemy.hp, 0, out=acting)
+        np.logical_and(acting, active, out=acting)
+        self.apply_actions(self.enemy_actions, np.logical_and(acting, first, out=acting), self.enemy, self.player, False)
+
+        # 死亡・敵の撃破・逃走(逃げたユニットの相手のHPは0になる)で決着
+        active &= np.greater(self.player.hp, 0, out=acting)
+        active &= np.greater(self.enemy.hp, 0, out=acting)
+        return self.escape
+
+    def prepare_actions(self, actions:ActionArrays, choices, sample:np.ndarray, is_player:bool):
+        """選択されたコマンドの結果のうち、行動時の状態によらない部分をコマンドの種類ごとにまとめて計算する
+
+        Args:
+            actions (ActionArrays): 各戦闘の行動結果の書き込み先
+            choices: コマンドと、そのコマンドを選択した戦闘のマスク
+            sample (np.ndarray): 行動の16bit乱数
+            is_player (bool): 行動するユニットがプレイヤーか
+        """
+        actions.clear()
+        values = self.values
+        for command, selected in choices:
+            if not selected.any():
+                continue
+            if isinstance(command, Attack):
+                if is_player:
+                    self.player_attack_table.take(self.table_index(sample, ATTACK_BITS), out=values, mode='clip')
+                else:
+                    # 敵の通常攻撃のダメージはコマンドと一緒に表から取り出している
+                    np.right_shift(self.enemy_action, self.status_bits, out=self.enemy_action)
+                    np.copyto(values, self.enemy_action, casting='unsafe')
+                actions.add('damage', np.multiply(values, selected.view(np.int8), out=actions.out('damage', values)))
+            elif isinstance(command, Escape):
+                if is_player:
+                    # プレイヤーはモンスターとのSpeed差により確率で成功
+                    np.less_equal(sample, self.speed_limit, out=self.mask)
+                    selected = np.logical_and(self.mask, selected, out=self.mask)
+                # モンスターは必ず逃走成功
+                actions.add('escape', selected)
+            else:
+                actions.add('spell', selected)
+                actions.add('used_mp', np.multiply(selected.view(np.int8), self.status_dtype(command.used_mp), out=actions.out('used_mp', values)))
+                if isinstance(command, AttackSpell):
+                    self.scaled_random(sample, command.max_damage - command.min_damage + 1, values)
+                    np.add(values, command.min_damage, out=values)
+                    actions.add('damage', np.multiply(values, selected.view(np.int8), out=actions.out('damage', values)))
+                elif isinstance(command, RecoverSpell):
+                    self.scaled_random(sample, command.max_recover - command.min_recover + 1, values)
+                    np.add(values, command.min_recover, out=values)
+                    actions.add('recover', np.multiply(values, selected.view(np.int8), out=actions.out('recover', values)))
+                elif isinstance(command, SealSpell):
+                    actions.add('seal_spell', selected)
+                elif isinstance(command, SleepSpell):
+                    actions.add('sleep', selected)
+
+    def apply_actions(self, actions:ActionArrays, acting:np.ndarray, action_unit:UnitArrays, target_unit:UnitArrays, is_player:bool):
+        """行動する戦闘に行動結果を反映する
+
+        与えたダメージと敵の回復量は total_damage に、プレイヤーの逃走成否は escape に反映する。
+
+        Args:
+            actions (ActionArrays): 各戦闘の行動結果
+            acting (np.ndarray): 行動する戦闘(作業用の配列として上書きする)
+            action_unit (UnitArrays): 行動するユニット
+            target_unit (UnitArrays): 行動対象のユニット
+            is_player (bool): 行動するユニットがプレイヤーか
+        """
+        self.judge_awake(action_unit, acting)
+        mask = self.mask
+        values = self.values
+        if actions.spell is not None:
+            # 呪文は封印されておらず、MPが足りている場合だけ成功し、MPを消費する
+            np.less(action_unit.mp, actions.used_mp, out=mask)
+            mask |= action_unit.seal_spell
+            mask &= actions.spell
+            np.greater(acting, mask, out=acting)
+            action_unit.mp -= np.multiply(actions.used_mp, acting.view(np.int8), out=values)
+        if actions.damage is not None:
+            damage = np.multiply(actions.damage, acting.view(np.int8), out=values)
+            target_unit.hp -= damage
+            np.maximum(target_unit.hp, self.zeros, out=target_unit.hp)
+            if is_player:
+                self.total_damage += damage
+        if actions.recover is not None:
+            if is_player:
+                np.subtract(self.player_max_hp, action_unit.hp, out=values)
+            else:
+                np.subtract(self.enemy_max_hp.take(self.enemy_index, out=values, mode='clip'), action_unit.hp, out=values)
+            recover = np.minimum(actions.recover, values, out=values)
+            recover *= acting.view(np.int8)
+            action_unit.hp += recover
+            if not is_player:
+                self.total_damage -= recover
+        if actions.escape is not None:
+            # 逃げたユニットの相手(モンスターの場合は自分)のHPは0になる
+            escape = np.logical_and(actions.escape, acting, out=mask)
+            if is_player:
+                self.escape |= escape
+            self.enemy.hp *= np.logical_not(escape, out=mask).view(np.int8)
+        if actions.seal_spell is not None:
+            target_unit.seal_spell |= np.logical_and(actions.seal_spell, acting, out=mask)
+        if actions.sleep is not None:
+            sleep = np.logical_and(actions.sleep, acting, out=mask)
+            target_unit.sleep |= sleep
+            target_unit.n_sleep_tern *= np.logical_not(sleep, out=mask).view(np.int8)
+
+    def judge_awake(self, unit:UnitArrays, acting:np.ndarray):
+        """起床判定を行い、眠っている戦闘を行動しない戦闘にする
+
+        Args:
+            unit (UnitArrays): 判定対象のユニット
+            acting (np.ndarray): 判定対象の戦闘(眠っている戦闘をFalseにする)
+        """
+        if not unit.sleep.any():
+            return
+        sleeping = np.logical_and(unit.sleep, acting, out=self.mask)
+
+        # 眠った最初のターンは起きない
+        first_tern = unit.n_sleep_tern == 0
+        unit.n_sleep_tern += sleeping & first_tern
+        awake = sleeping & ~first_tern & (self.random(1)[0] < AWAKE_THRESHOLD)
+        unit.sleep &= ~awake
+        unit.n_sleep_tern *= ~awake
+        acting &= ~unit.sleep
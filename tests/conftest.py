@@ -0,0 +1,35 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+# スクリプトとして置いているモジュール(RPGTurnBattle等)を読み込めるように、リポジトリのルートを追加する
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_PATH not in sys.path:
+    sys.path.insert(0, ROOT_PATH)
+
+@pytest.fixture
+def data_folder_path()->str:
+    """Unitデータの格納先フォルダパス(実行時のカレントディレクトリによらない)"""
+    return os.path.join(ROOT_PATH, 'battle', 'data')
+
+@pytest.fixture
+def new_player(data_folder_path:str):
+    """乱数を固定して学習前のエージェント(DQNPlayer)を作成する関数"""
+    def create(prioritized:bool=False):
+        # torchは学習のテストだけで読み込む
+        import torch
+        from RPGTurnBattle import Simulation
+        from AIPlayer.DQNPlayer import DQNPlayer
+
+        random.seed(0)
+        np.random.seed(0)
+        torch.manual_seed(0)
+        env = Simulation(data_folder_path, 'default', headless=True)
+        env.seed(0)
+        player = DQNPlayer(env, n_hidden_channels=16, prioritized=prioritized)
+        player.set_learning_parameters(batch_size=16, num_episodes=8, eps_decay=4, target_update=2)
+        return player
+    return create
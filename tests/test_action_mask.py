@@ -0,0 +1,39 @@
+import random
+
+from RPGTurnBattle import Simulation
+
+def test_action_mask_matches_player_state(data_folder_path):
+    env = Simulation(data_folder_path, 'sample', headless=True)
+    env.seed(5)
+    env.reset()
+    policy = random.Random(6)
+    for _ in range(2000):
+        player = env.battle.player
+        expected = [used_mp is None or (not player.seal_spell and player.mp >= used_mp) for used_mp in env.action_mp]
+        assert env.action_mask.tolist() == expected
+        assert env.get_action_mask().tolist() == expected
+        _, _, done, _ = env.step(policy.randrange(env.get_n_actions()))
+        if done:
+            env.reset()
+
+def test_mcts_selects_only_masked_actions(data_folder_path):
+    from AIPlayer.MCTSPlayer import MCTSPlayer
+    env = Simulation(data_folder_path, 'sample', headless=True)
+    env.seed(7)
+    player = MCTSPlayer(env, n_simulations=20, seed=8)
+    search_env = player.search_env
+    step = search_env.step
+
+    def checked_step(action):
+        # 木の展開・ロールアウトとも選択可能な行動だけを選ぶ
+        assert search_env.action_mask[action]
+        return step(action)
+
+    search_env.step = checked_step
+    for _ in range(3):
+        env.reset()
+        done = False
+        while not done:
+            action = player.select_action(env)
+            assert env.action_mask[action]
+            _, _, done, _ = env.step(action)
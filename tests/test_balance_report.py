@@ -0,0 +1,44 @@
+import json
+import math
+import os
+import shutil
+
+from BalanceReport import BalanceStats, balance_report, run_episodes
+
+def test_empty_stats_do_not_divide_by_zero():
+    stats = BalanceStats()
+    assert stats.death_rate()[1:] == (0.0, 1.0)
+    assert all(math.isnan(value) for value in stats.win_rate() + stats.mean_survived() + stats.turns_per_encounter())
+
+def test_run_episodes_counts_wins_from_outcome(data_folder_path):
+    _, stats = run_episodes((data_folder_path, 'default', None, 'attack', 50, 0))
+    # 「たたかう」だけなら逃げないので、死亡した戦闘以外はすべて勝利
+    assert stats.n_episode == 50
+    assert stats.wins == stats.survived
+    assert stats.encounters == stats.survived + stats.deaths
+
+def test_balance_report_resimulates_only_changed_inputs(tmp_path, data_folder_path):
+    data_path = os.path.join(tmp_path, 'data')
+    shutil.copytree(data_folder_path, data_path)
+    store_path = os.path.join(tmp_path, 'store.json')
+
+    def simulated()->set:
+        report = balance_report(data_path, 20, ['attack'], n_workers=2, chunk_size=10, store_path=store_path)
+        return {(row['scenario'], row['lv']) for row in report if row['simulated']}
+
+    assert len(simulated()) == 20
+    assert simulated() == set()
+
+    # 敵3はdefaultのnormal_enemiesだけに含まれる
+    enemies_path = os.path.join(data_path, 'enemies.json')
+    with open(enemies_path, 'r', encoding='utf-8') as f:
+        enemies = json.load(f)
+    enemy = next(enemy for enemy in enemies if enemy['id'] == 3)
+    enemy['power'] += 3
+    with open(enemies_path, 'w', encoding='utf-8') as f:
+        json.dump(enemies, f, ensure_ascii=False)
+    with open(os.path.join(data_path, 'scenarios.json'), 'r', encoding='utf-8') as f:
+        scenarios = {scenario['scenario_code'] for scenario in json.load(f) if 3 in scenario['enemies']['normal_enemies']}
+    assert scenarios == {'default'}
+    assert simulated() == {('default', lv) for lv in range(1, 11)}
+    assert simulated() == set()
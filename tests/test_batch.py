@@ -0,0 +1,50 @@
+import io
+import json
+
+import pytest
+
+from RPGTurnBattle import Simulation
+from ExecuteSimulation import play_batch
+
+def test_unknown_action_waits(data_folder_path):
+    env = Simulation(data_folder_path, 'default')
+    env.seed(0)
+    env.reset()
+    hp = env.battle.enemy.hp
+    env.step(env.get_n_actions())
+    assert env.battle.enemy.hp == hp
+
+def test_play_batch_reports_errors_per_line(data_folder_path):
+    lines = [
+        '{"id": 1, "seed": 3, "policy": "cure"}',
+        '{"id": 2, "actions": [null]}',
+        '[1, 2]',
+        '{"id": 3, "actions": [-1]}',
+        '{"id": 4, "policy": ["cure"]}',
+        '{broken',
+        '',
+        '{"id": 5, "seed": 1, "actions": ["attack", 0, 99]}',
+    ]
+    out = io.StringIO()
+    n_error = play_batch(lines, data_folder_path, out=out)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert n_error == 5
+    assert [record['line'] for record in records] == [1, 2, 3, 4, 5, 6, 8]
+    assert [('error' in record) for record in records] == [False, True, True, True, True, True, False]
+    assert records[0]['dead'] or records[0]['battles'] == 10
+    assert records[-1]['turns'] == 3
+
+def test_play_batch_reports_unknown_scenario(data_folder_path):
+    lines = [
+        '{"id": 1, "scenario": "missing", "policy": "cure"}',
+        '{"id": 2, "scenario": "sample", "policy": "cure"}',
+    ]
+    out = io.StringIO()
+    assert play_batch(lines, data_folder_path, out=out) == 1
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert records[0]['error'].startswith('存在しないシナリオです: missing')
+    assert 'error' not in records[1]
+
+def test_play_batch_rejects_unknown_default_scenario(data_folder_path):
+    with pytest.raises(ValueError, match='存在しないシナリオです'):
+        play_batch(['{"policy": "cure"}'], data_folder_path, 'missing', out=io.StringIO())
@@ -0,0 +1,32 @@
+from Benchmark import DEFAULT_THRESHOLD, NOISE_FACTOR, allowed_ratio, compare, format_results
+
+BASELINE = {'a': 1.0e-6, 'b': 2.0e-6}
+
+def test_compare_without_baseline_noises():
+    # ばらつきを保存していない基準値は、閾値だけで比べる
+    results = {'a': 1.0e-6 * (1 + DEFAULT_THRESHOLD) * 1.01, 'b': 2.0e-6 * (1 + DEFAULT_THRESHOLD) * 0.99}
+    assert compare(results, BASELINE, DEFAULT_THRESHOLD) == ['a']
+    assert compare(results, BASELINE, DEFAULT_THRESHOLD, {}, {}) == ['a']
+
+def test_compare_widens_threshold_with_noise():
+    results = {'a': 1.5e-6, 'b': 3.0e-6}
+    assert compare(results, BASELINE, 0.3) == ['a', 'b']
+    # 今回と基準値のばらつきの合計のNOISE_FACTOR倍まで許容する
+    noises = {'a': 0.1, 'b': 0.01}
+    baseline_noises = {'a': 0.1, 'b': 0.01}
+    assert allowed_ratio('a', 0.3, noises, baseline_noises) == 1 + NOISE_FACTOR * 0.2
+    assert allowed_ratio('b', 0.3, noises, baseline_noises) == 1.3
+    assert compare(results, BASELINE, 0.3, noises, baseline_noises) == ['b']
+    # ばらつきが小さければ閾値は広げない
+    assert allowed_ratio('a', 0.3, {'a': 0.01}, {}) == 1.3
+
+def test_format_results_marks_regressions_and_new_rows():
+    results = {'a': 1.0e-6, 'b': 4.0e-6, 'c': 5.0e-6}
+    lines = format_results(results, BASELINE, 0.3, {'a': 0.01, 'b': 0.02, 'c': 0.03}, {}).splitlines()
+    assert lines[0].split('\t') == ['benchmark', 'time_us', 'ops_per_sec', 'noise', 'baseline_us', 'ratio', 'status']
+    rows = {line.split('\t')[0]: line.split('\t') for line in lines[1:]}
+    assert rows['a'][-1] == 'ok'
+    assert rows['b'][-1] == 'REGRESSION' and rows['b'][-2] == '2.000'
+    assert rows['c'][-3:] == ['-', '-', 'new']
+    # 基準値がない場合は比較の列を出さない
+    assert format_results(results).splitlines()[0].split('\t') == ['benchmark', 'time_us', 'ops_per_sec', 'noise']
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+import torch
+
+@pytest.mark.parametrize('prioritized', [False, True])
+def test_checkpoint_resume_matches_uninterrupted_training(tmp_path, new_player, prioritized):
+    player = new_player(prioritized)
+    player.training()
+    expected_rewards = player.episode_rewards
+    expected_state = player.policy_net.state_dict()
+
+    player = new_player(prioritized)
+    player.training(checkpoint_folder_path=str(tmp_path), checkpoint_interval=2, n_episodes=3)
+    assert player.i_episode == 3
+    # 新しいプロセスで再開した場合と同じように、別のエージェントでチェックポイントから続ける
+    player = new_player(prioritized)
+    player.training(checkpoint_folder_path=str(tmp_path), checkpoint_interval=2)
+
+    assert player.i_episode == 8
+    # 再開時に読み込んだ経験再生メモリのファイルは、保存し直したファイルにマップし直してから削除する
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.bin')) == ['replay-8.bin']
+    assert player.memory.file_path == os.path.join(str(tmp_path), 'replay-8.bin')
+    assert player.episode_rewards == expected_rewards
+    for key, value in player.policy_net.state_dict().items():
+        assert torch.equal(value, expected_state[key]), key
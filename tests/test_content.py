@@ -0,0 +1,46 @@
+import os
+import shutil
+
+import pytest
+
+from battle.content import CONTENT_FILES, CompiledContent, compile_content, load_content, load_json_content, release_compiled
+
+def test_recompile_closes_loaded_content(tmp_path, data_folder_path):
+    for name in CONTENT_FILES:
+        shutil.copy(os.path.join(data_folder_path, name), tmp_path)
+    compile_content(str(tmp_path))
+    content = load_content(str(tmp_path))
+    assert isinstance(content, CompiledContent)
+    assert content.scenarios is content.scenarios
+    scenarios = content.scenarios
+
+    # 読み込み済みのメモリマップを閉じてから置き換える
+    compile_content(str(tmp_path))
+    assert content.buffer.closed
+    assert content.scenarios == scenarios
+    reloaded = load_content(str(tmp_path))
+    assert reloaded is not content and not reloaded.buffer.closed
+    expected = load_json_content(str(tmp_path))
+    assert reloaded.scenarios == expected.scenarios
+    assert reloaded.players == expected.players
+    assert reloaded.enemies == expected.enemies
+    release_compiled(reloaded.file_path)
+    assert reloaded.buffer.closed
+
+def test_closed_content_raises_clear_error(tmp_path, data_folder_path):
+    for name in CONTENT_FILES:
+        shutil.copy(os.path.join(data_folder_path, name), tmp_path)
+    content = CompiledContent(compile_content(str(tmp_path)))
+    scenario = content.scenario('default')
+    prototype = content.prototype(0)
+    content.close()
+
+    # 作成済みのシナリオとプロトタイプは閉じた後も使える
+    assert content.scenarios[0] == scenario
+    assert content.prototype(0) == prototype
+    with pytest.raises(ValueError, match='content is closed'):
+        content.scenario_enemies(scenario)
+    with pytest.raises(ValueError, match='content is closed'):
+        content.player(1)
+    with pytest.raises(ValueError, match='content is closed'):
+        content.enemies
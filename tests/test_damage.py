@@ -0,0 +1,26 @@
+import pytest
+
+from battle.damage import N_ATTACK_SAMPLES, attack_distribution, attack_table, uniform_distribution
+
+# (攻撃力, 守備力): 通常のダメージ、0以下のダメージを含む組み合わせ、守備力が奇数の組み合わせ
+PAIRS = [(20, 10), (13, 35), (5, 3), (60, 7)]
+
+@pytest.mark.parametrize('attack, difense', PAIRS)
+def test_attack_table_matches_formula(attack, difense):
+    table = attack_table(attack, difense)
+    assert len(table) == N_ATTACK_SAMPLES
+    for r in range(N_ATTACK_SAMPLES):
+        assert table[r] == int((attack - difense // 2) // (2 + r / 128))
+
+@pytest.mark.parametrize('attack, difense', PAIRS)
+def test_attack_distribution_sums_to_one(attack, difense):
+    distribution = attack_distribution(attack, difense)
+    assert sum(p for _, p in distribution) == pytest.approx(1.0)
+    assert all(damage >= 0 for damage, _ in distribution)
+    assert [damage for damage, _ in distribution] == sorted({damage for damage, _ in distribution})
+
+@pytest.mark.parametrize('min_value, max_value', [(1, 1), (5, 12), (25, 30)])
+def test_uniform_distribution_sums_to_one(min_value, max_value):
+    distribution = uniform_distribution(min_value, max_value)
+    assert [value for value, _ in distribution] == list(range(min_value, max_value + 1))
+    assert sum(p for _, p in distribution) == pytest.approx(1.0)
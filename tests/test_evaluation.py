@@ -0,0 +1,69 @@
+import dataclasses
+import math
+import os
+import random
+from statistics import NormalDist
+
+import numpy as np
+
+from RPGTurnBattle import Simulation
+from AIPlayer.Evaluation import EvaluationResult, evaluate
+from AIPlayer.NumpyPolicy import LAYERS, NumpyPolicy
+from battle.event import Outcome
+
+def test_outcome_matches_reward(data_folder_path):
+    env = Simulation(data_folder_path, 'sample', headless=True)
+    env.seed(3)
+    policy = random.Random(4)
+    for _ in range(200):
+        env.reset()
+        assert env.outcome == Outcome.NONE
+        total_reward = 0
+        counts = {Outcome.NONE: 0, Outcome.DEFEAT: 0, Outcome.ESCAPE: 0, Outcome.DEAD: 0}
+        done = False
+        while not done:
+            _, reward, done, _ = env.step(policy.randrange(env.get_n_actions()))
+            total_reward += reward
+            counts[env.outcome] += 1
+        dead = env.battle.player.hp == 0
+        assert counts[Outcome.DEAD] == int(dead)
+        assert counts[Outcome.DEFEAT] + counts[Outcome.ESCAPE] == env.n_battle
+        assert total_reward == counts[Outcome.DEFEAT] + (-20 if dead else 10)
+
+def test_empty_evaluation_result_does_not_divide_by_zero():
+    result = EvaluationResult()
+    assert math.isnan(result.death_rate()[0])
+    assert all(math.isnan(value) for value in result.win_rate() + result.escape_rate() + result.mean_reward())
+
+def attack_policy(tmp_path, obs_size:int=22, n_actions:int=4)->NumpyPolicy:
+    """常に「たたかう」(行動0)を選ぶ決定的な方策"""
+    sizes = (obs_size, 8, 8, n_actions)
+    arrays = {}
+    for layer, n_in, n_out in zip(LAYERS, sizes[:-1], sizes[1:]):
+        arrays[f'{layer}_weight'] = np.zeros((n_in, n_out), dtype=np.float32)
+        arrays[f'{layer}_bias'] = np.zeros(n_out, dtype=np.float32)
+    arrays['l2_bias'][0] = 1.0
+    path = os.path.join(tmp_path, 'attack.npz')
+    np.savez(path, **arrays)
+    return NumpyPolicy(path)
+
+def test_evaluate_stops_at_requested_precision(tmp_path, data_folder_path):
+    policy = attack_policy(tmp_path)
+    result = evaluate(policy, data_folder_path, max_episodes=5000, precision=0.05, min_episodes=100, check_interval=50, n_envs=16)
+    # 確かめる最大回数(5000 / 50回)でボンフェローニ補正する
+    assert result.z == NormalDist().inv_cdf(1 - 0.05 / (2 * 100))
+    assert 100 <= result.n_episode < 5000
+    assert result.n_episode % 50 == 0
+    assert result.half_width() <= 0.05
+
+    # 1つ前に確かめた時点ではまだ精度が足りていなかった
+    previous = evaluate(policy, data_folder_path, max_episodes=result.n_episode - 50, n_envs=16)
+    assert dataclasses.replace(previous, z=result.z).half_width() > 0.05
+    # 同じ方策・シードなら同じ結果になる(環境の数によらない)
+    assert evaluate(policy, data_folder_path, max_episodes=5000, precision=0.05, min_episodes=100, check_interval=50, n_envs=7) == result
+
+def test_evaluate_respects_max_episodes(tmp_path, data_folder_path):
+    policy = attack_policy(tmp_path)
+    result = evaluate(policy, data_folder_path, max_episodes=120, precision=0.001, min_episodes=50, check_interval=50, n_envs=16)
+    assert result.n_episode == 120
+    assert evaluate(policy, data_folder_path, max_episodes=70, n_envs=16).n_episode == 70
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from HyperparameterSweep import DEFAULT_PARAMS, grid_trials, random_trials, rank_results, should_prune
+
+def test_unknown_space_key_is_rejected():
+    space = {'gamma': [0.9, 0.99], 'batch_szie': [32, 64]}
+    with pytest.raises(ValueError, match='batch_szie'):
+        grid_trials(space)
+    with pytest.raises(ValueError, match='batch_szie'):
+        random_trials(space, 3, 0)
+
+def test_trials_fill_defaults():
+    trials = grid_trials({'gamma': [0.9, 0.99], 'target_update': [5, 10]})
+    assert len(trials) == 4
+    assert all(set(trial) == set(DEFAULT_PARAMS) and trial['batch_size'] == DEFAULT_PARAMS['batch_size'] for trial in trials)
+
+def test_should_prune_waits_for_min_reports():
+    reports = {}
+    lock = threading.Lock()
+    # 先に評価された試行がmin_reportsに満たない間は、評価値が低くても打ち切らない
+    assert not should_prune(reports, lock, 50, 5.0, 3)
+    assert not should_prune(reports, lock, 50, 7.0, 3)
+    assert not should_prune(reports, lock, 50, -10.0, 3)
+    assert reports[50] == [5.0, 7.0, -10.0]
+    # 別のエピソード数の評価値とは比べない
+    assert not should_prune(reports, lock, 100, -10.0, 3)
+
+def test_should_prune_below_median():
+    reports = {50: [5.0, 7.0, -10.0]}
+    lock = threading.Lock()
+    assert should_prune(reports, lock, 50, 4.0, 3)
+    # 中央値([-10, 4, 5, 7]で4.5)以上なら続ける
+    assert not should_prune(reports, lock, 50, 4.5, 3)
+    assert reports[50] == [5.0, 7.0, -10.0, 4.0, 4.5]
+
+def test_rank_results_puts_finished_trials_first():
+    results = [
+        dict(trial=0, episodes=100, score=9.0, pruned=True),
+        dict(trial=1, episodes=300, score=3.0, pruned=False),
+        dict(trial=2, episodes=300, score=8.0, pruned=False),
+        dict(trial=3, episodes=200, score=1.0, pruned=True),
+    ]
+    assert [result['trial'] for result in rank_results(results)] == [2, 1, 3, 0]
@@ -0,0 +1,38 @@
+import hashlib
+import random
+
+from RPGTurnBattle import Simulation
+
+# 変更前(メッセージを文字列で組み立てていた版)で同じ手順を実行したときのハッシュ値
+GOLDEN_HASH = '6e0c236b03d890582afeaed01c322cfa54c649096c007cca98ffceea7b7f749e'
+
+def test_messages_are_byte_identical_to_baseline(data_folder_path):
+    digest = hashlib.sha256()
+    for scenario_code in ('default', 'sample'):
+        env = Simulation(data_folder_path, scenario_code)
+        env.seed(0)
+        policy = random.Random(1)
+        for _ in range(150):
+            env.reset()
+            done = False
+            while not done:
+                _, reward, done, message = env.step(policy.randrange(env.get_n_actions()))
+                digest.update(f'{reward}\n{message}\n'.encode('utf-8'))
+    assert digest.hexdigest() == GOLDEN_HASH
+
+def test_headless_renders_the_same_messages(data_folder_path):
+    env = Simulation(data_folder_path, 'sample')
+    headless_env = Simulation(data_folder_path, 'sample', headless=True)
+    env.seed(0)
+    headless_env.seed(0)
+    policy = random.Random(1)
+    for _ in range(20):
+        env.reset()
+        headless_env.reset()
+        done = False
+        while not done:
+            action = policy.randrange(env.get_n_actions())
+            _, _, done, message = env.step(action)
+            _, _, _, headless_message = headless_env.step(action)
+            assert headless_message == ''
+            assert headless_env.render_message() == message
@@ -0,0 +1,48 @@
+import os
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from AIPlayer.DQN import DQN
+from AIPlayer.Evaluation import evaluate
+from AIPlayer.NumpyPolicy import NumpyPolicy, export_npz
+from BalanceReport import input_hash, run_episodes
+from battle.content import load_content
+
+def export(tmp_path, seed:int=0)->Tuple[DQN, str]:
+    """乱数で初期化したモデルをnpzファイルに書き出し、モデルとファイルパスを返す"""
+    torch.manual_seed(seed)
+    net = DQN(22, 4, 16)
+    path = os.path.join(tmp_path, f'policy-{seed}.npz')
+    export_npz(net, path)
+    return net, path
+
+def test_q_values_match_dqn_forward(tmp_path):
+    net, path = export(tmp_path)
+    policy = NumpyPolicy(path)
+    assert (policy.obs_size, policy.n_actions) == (22, 4)
+    states = np.random.default_rng(0).uniform(0, 60, size=(100, 22)).astype(np.float32)
+    with torch.no_grad():
+        expected = net(torch.from_numpy(states)).numpy()
+    np.testing.assert_allclose(policy.q_values(states), expected, rtol=1e-5, atol=1e-4)
+
+def test_evaluate_numpy_policy_matches_torch(tmp_path, data_folder_path):
+    net, path = export(tmp_path)
+    expected = evaluate(net, data_folder_path, n_envs=8, max_episodes=40)
+    result = evaluate(NumpyPolicy(path), data_folder_path, n_envs=8, max_episodes=40)
+    assert result == expected
+
+def test_balance_report_runs_and_hashes_npz_policy(tmp_path, data_folder_path):
+    _, path = export(tmp_path)
+    key, stats = run_episodes((data_folder_path, 'default', None, path, 20, 0))
+    assert key == ('default', None, path)
+    assert stats.n_episode == 20
+
+    # ハッシュ値はファイルの内容で決まる
+    content = load_content(data_folder_path)
+    before = input_hash(content, 'default', 1, path, 20, 10, 0)
+    assert input_hash(content, 'default', 1, path, 20, 10, 0) == before
+    _, other = export(tmp_path, seed=1)
+    os.replace(other, path)
+    assert input_hash(content, 'default', 1, path, 20, 10, 0) != before
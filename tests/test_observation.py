@@ -0,0 +1,73 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from RPGTurnBattle import Simulation
+
+def test_observation_buffer_matches_get_status(data_folder_path):
+    env = Simulation(data_folder_path, 'sample', headless=True)
+    buffered = copy.deepcopy(env)
+    buffer = np.zeros(len(env.reset()), dtype=np.float32)
+    buffered.set_observation_buffer(buffer)
+    env.seed(7)
+    buffered.seed(7)
+    policy = random.Random(8)
+    for _ in range(5):
+        np.testing.assert_array_equal(buffered.reset(), env.reset())
+        done = False
+        while not done:
+            action = policy.randrange(env.get_n_actions())
+            state, _, done, _ = env.step(action)
+            assert buffered.step(action)[0] is buffer
+            np.testing.assert_array_equal(buffer, state)
+
+def test_training_restores_env_on_error(new_player):
+    player = new_player()
+    env = player.env
+    env.headless = False
+    step = env.step
+
+    def failing_step(action):
+        if env.n_battle >= 1:
+            raise RuntimeError('step failed')
+        return step(action)
+
+    env.step = failing_step
+    with pytest.raises(RuntimeError):
+        player.training()
+    assert env.headless is False
+    assert env.observation is None
+    assert player.telemetry is None
+
+def failing_env(env:Simulation)->Simulation:
+    """2回目の戦闘でstepが例外を送出するようにする"""
+    step = env.step
+
+    def failing_step(action):
+        if env.n_battle >= 1:
+            raise RuntimeError('step failed')
+        return step(action)
+
+    env.step = failing_step
+    return env
+
+@pytest.mark.parametrize('player_type', ['dqn', 'mcts', 'solver'])
+def test_test_restores_env_on_error(data_folder_path, new_player, player_type):
+    env = Simulation(data_folder_path, 'default', headless=False)
+    if player_type == 'dqn':
+        player = new_player()
+    elif player_type == 'mcts':
+        from AIPlayer.MCTSPlayer import MCTSPlayer
+        player = MCTSPlayer(env, n_simulations=2, seed=0)
+    else:
+        from battle.solver import Solver
+        player = Solver(data_folder_path, 'default')
+        # 方策を求めずに、常に「たたかう」を選ぶ
+        player.select_action = lambda env: 0
+    failing_env(env)
+    with pytest.raises(RuntimeError):
+        player.test(env, 3, is_render=False)
+    assert env.headless is False
+    assert env.observation is None
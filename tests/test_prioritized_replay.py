@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import torch
+
+from AIPlayer.DQN import PrioritizedReplayMemory, SumTree
+
+def test_prioritized_weights_are_finite_with_zero_priority():
+    memory = PrioritizedReplayMemory(5, 3, 2)
+    for _ in range(5):
+        memory.push(np.zeros(3), 0, np.zeros(3), 1.0, None)
+    memory.tree.update([4], 0.0)
+    torch.manual_seed(0)
+    _, indices, weights = memory.sample(64, beta=1.0)
+    assert indices.max() < memory.size
+    assert torch.isfinite(weights).all()
+    assert weights.max() <= 1.0
+
+def test_sum_tree_samples_proportionally_to_priority():
+    priorities = np.array([1.0, 2.0, 3.0, 4.0, 0.0])
+    tree = SumTree(len(priorities))
+    tree.update(np.arange(len(priorities)), priorities)
+    assert tree.total() == priorities.sum()
+    rng = np.random.default_rng(0)
+    indices = tree.find(rng.random(100000) * tree.total())
+    frequencies = np.bincount(indices, minlength=len(priorities)) / len(indices)
+    np.testing.assert_allclose(frequencies, priorities / priorities.sum(), atol=0.01)
+
+def test_update_priorities_changes_sampling_and_weights():
+    # alpha=1なので、優先度はTD誤差の絶対値+epsilonになる
+    memory = PrioritizedReplayMemory(4, 3, 2, alpha=1.0, epsilon=0.0)
+    for i in range(4):
+        memory.push(np.full(3, i), 0, np.zeros(3), float(i), None)
+    memory.update_priorities(np.arange(4), np.array([1.0, 1.0, -6.0, 2.0]))
+    assert memory.max_priority == 6.0
+    priorities = np.array([1.0, 1.0, 6.0, 2.0])
+
+    torch.manual_seed(0)
+    counts = np.zeros(4)
+    for _ in range(200):
+        batch, indices, weights = memory.sample(50, beta=0.5)
+        counts += np.bincount(indices, minlength=4)
+        # 取り出した経験と重要度サンプリングの重みはindexと対応する
+        np.testing.assert_array_equal(batch[3].numpy(), indices.astype(np.float32))
+        expected = (4 * priorities[indices] / priorities.sum()) ** -0.5
+        np.testing.assert_allclose(weights.numpy(), expected / expected.max(), rtol=1e-5)
+    np.testing.assert_allclose(counts / counts.sum(), priorities / priorities.sum(), atol=0.01)
+
+    # 優先度を下げると取り出されにくくなり、重みは大きくなる
+    memory.update_priorities(np.array([2]), np.array([0.5]))
+    _, indices, weights = memory.sample(100, beta=1.0)
+    assert np.mean(indices == 2) == pytest.approx(0.5 / 4.5, abs=0.02)
+    assert weights[indices == 2].min() == 1.0
+    # 新しい経験は最大の優先度で記録する
+    memory.push(np.zeros(3), 0, np.zeros(3), 0.0, None)
+    assert memory.tree.tree[memory.tree.n_leaves] == 6.0
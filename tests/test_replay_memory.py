@@ -0,0 +1,58 @@
+import torch
+
+from AIPlayer.DQN import ReplayMemory
+
+CAPACITY = 8
+OBS_SIZE = 3
+N_ACTIONS = 4
+
+def rows(start:int, n:int):
+    """報酬(と状態の先頭)がstartからの通し番号になる経験"""
+    ids = torch.arange(start, start + n, dtype=torch.float32)
+    states = ids.reshape(-1, 1).repeat(1, OBS_SIZE)
+    actions = torch.arange(start, start + n) % N_ACTIONS
+    masks = torch.ones((n, N_ACTIONS), dtype=torch.bool)
+    masks[:, 0] = False
+    dones = ids % 2 == 0
+    return states, actions, states + 1, ids, masks, dones
+
+def stored_ids(memory:ReplayMemory)->list:
+    return sorted(int(reward) for reward in memory.rewards[:memory.size].tolist())
+
+def test_push_overwrites_oldest():
+    memory = ReplayMemory(CAPACITY, OBS_SIZE, N_ACTIONS)
+    for i in range(CAPACITY + 3):
+        states, actions, next_states, rewards, masks, _ = rows(i, 1)
+        memory.push(states[0], actions[0], None if i == CAPACITY else next_states[0], rewards[0], masks[0])
+    assert (memory.size, memory.position) == (CAPACITY, 3)
+    assert stored_ids(memory) == list(range(3, CAPACITY + 3))
+    # 位置0には通し番号8の経験が上書きされ、終端として記録されている
+    assert memory.rewards[0].item() == CAPACITY
+    assert memory.dones[0].item() and memory.next_masks[0].all()
+    assert memory.states[1].tolist() == [CAPACITY + 1] * OBS_SIZE
+
+def test_push_batch_wraps_around_the_end():
+    memory = ReplayMemory(CAPACITY, OBS_SIZE, N_ACTIONS)
+    memory.push_batch(*rows(0, 5))
+    indices = memory.push_batch(*rows(5, 6))
+    assert indices.tolist() == [5, 6, 7, 0, 1, 2]
+    assert (memory.size, memory.position) == (CAPACITY, 3)
+    assert stored_ids(memory) == list(range(3, 11))
+    assert memory.rewards.tolist() == [8, 9, 10, 3, 4, 5, 6, 7]
+    assert memory.states[:, 0].tolist() == memory.rewards.tolist()
+    assert memory.actions[:, 0].tolist() == [i % N_ACTIONS for i in memory.rewards.long().tolist()]
+    # 終端の次の状態ではすべての行動が選択可能
+    assert memory.next_masks[:, 0].tolist() == memory.dones.tolist()
+
+def test_sample_shapes_and_dtypes():
+    memory = ReplayMemory(CAPACITY, OBS_SIZE, N_ACTIONS)
+    memory.push_batch(*rows(0, 5))
+    states, actions, next_states, rewards, masks, dones = memory.sample(16)
+    assert states.shape == next_states.shape == (16, OBS_SIZE)
+    assert actions.shape == (16, 1) and actions.dtype == torch.long
+    assert rewards.shape == dones.shape == (16,)
+    assert masks.shape == (16, N_ACTIONS)
+    assert states.dtype == next_states.dtype == rewards.dtype == torch.float32
+    assert masks.dtype == dones.dtype == torch.bool
+    # 記録していない行は取り出さない
+    assert set(int(reward) for reward in rewards.tolist()) <= set(range(5))
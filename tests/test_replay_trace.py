@@ -0,0 +1,114 @@
+import copy
+import io
+import os
+import random
+
+import pytest
+
+from RPGTurnBattle import Simulation
+from battle.rng import BlockRandom
+from battle.trace import TraceWriter, TraceReader, new_env, replay
+from ReplayTrace import WAIT_COMMAND_NAME, replay_episode
+
+def record(env:Simulation, path:str, n_episode:int, checksum:bool=True)->list:
+    """n_episode回のエピソードと途中までのエピソードを1つ記録し、エピソードごとの行動と報酬を返す"""
+    writer = TraceWriter(path, env, checksum=checksum)
+    env.set_trace(writer)
+    policy = random.Random(1)
+    episodes = []
+    for _ in range(n_episode):
+        env.reset()
+        actions = []
+        rewards = []
+        done = False
+        while not done:
+            action = policy.randrange(env.get_n_actions())
+            _, reward, done, _ = env.step(action)
+            actions.append(action)
+            rewards.append(reward)
+        episodes.append((actions, rewards))
+    # 途中までのエピソードは記録を外した時に未完了として書き出す
+    env.reset()
+    env.step(0)
+    env.set_trace(None)
+    writer.close()
+    return episodes
+
+@pytest.mark.parametrize('rng', [random.Random, BlockRandom])
+def test_trace_round_trip(tmp_path, data_folder_path, rng):
+    path = os.path.join(tmp_path, 'trace.bin')
+    env = Simulation(data_folder_path, 'sample', headless=True, rng=rng())
+    env.seed(0)
+    episodes = record(env, path, 20)
+
+    reader = TraceReader(path)
+    assert (reader.scenario_code, reader.player_lv) == ('sample', None)
+    assert len(reader) == 21
+    assert not reader[-1].complete
+    replay_env = new_env(reader, data_folder_path)
+    for episode, (actions, rewards) in zip(reader, episodes):
+        assert episode.complete
+        assert list(episode.actions) == actions
+        results = list(replay(replay_env, episode))
+        assert [result[2] for result in results] == [True] * len(actions)
+        assert [result[1][1] for result in results] == rewards
+        assert results[-1][1][2]
+    reader.close()
+
+def test_truncated_trace_keeps_finished_episodes(tmp_path, data_folder_path):
+    path = os.path.join(tmp_path, 'trace.bin')
+    env = Simulation(data_folder_path, 'default', headless=True)
+    env.seed(0)
+    record(env, path, 5, checksum=False)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-1])
+    reader = TraceReader(path)
+    assert len(reader) == 5
+    reader.close()
+
+def test_trace_rejects_other_scenario(tmp_path, data_folder_path):
+    path = os.path.join(tmp_path, 'trace.bin')
+    TraceWriter(path, Simulation(data_folder_path, 'default')).close()
+    with pytest.raises(ValueError):
+        TraceWriter(path, Simulation(data_folder_path, 'sample'))
+
+def test_traced_env_validates_action_and_copies(tmp_path, data_folder_path):
+    path = os.path.join(tmp_path, 'trace.bin')
+    env = Simulation(data_folder_path, 'default', headless=True)
+    writer = TraceWriter(path, env)
+    env.set_trace(writer)
+    env.reset()
+    snap = env.snapshot()
+    with pytest.raises(ValueError):
+        env.step(256)
+    assert env.snapshot() == snap
+
+    copied = copy.deepcopy(env)
+    assert copied.trace is None and copied.trace_actions is None
+    assert env.trace is writer
+    copied.step(0)
+    env.set_trace(None)
+    writer.close()
+
+def test_replay_episode_shows_unknown_action_as_wait(tmp_path, data_folder_path):
+    path = os.path.join(tmp_path, 'trace.bin')
+    env = Simulation(data_folder_path, 'default', headless=True)
+    env.seed(0)
+    writer = TraceWriter(path, env)
+    env.set_trace(writer)
+    env.reset()
+    done = False
+    action = 200
+    while not done:
+        _, _, done, _ = env.step(action)
+        action = 0
+    env.set_trace(None)
+    writer.close()
+
+    reader = TraceReader(path)
+    out = io.StringIO()
+    assert replay_episode(reader[0], reader, data_folder_path, out=out) == -1
+    assert f'[1] {WAIT_COMMAND_NAME}\n' in out.getvalue()
+    reader.close()
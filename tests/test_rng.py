@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from RPGTurnBattle import Simulation
+from battle.rng import BlockRandom
+
+def play(env:Simulation, policy:random.Random, between=None)->list:
+    """5エピソード分の状態・報酬を返す(betweenを指定した場合は各stepの後に呼ぶ)"""
+    trajectory = []
+    for _ in range(5):
+        state = env.reset()
+        trajectory.append(state.tolist())
+        done = False
+        while not done:
+            state, reward, done, _ = env.step(policy.randrange(env.get_n_actions()))
+            trajectory.append((state.tolist(), reward))
+            if between is not None:
+                between()
+    return trajectory
+
+@pytest.mark.parametrize('rng', [random.Random, BlockRandom])
+def test_envs_do_not_perturb_each_other(data_folder_path, rng):
+    env = Simulation(data_folder_path, 'sample', headless=True, rng=rng())
+    env.seed(7)
+    expected = play(env, random.Random(1))
+
+    # 別の環境のstepやrandomモジュールの乱数を挟んでも、同じシードなら同じ結果になる
+    env_a = Simulation(data_folder_path, 'sample', headless=True, rng=rng())
+    env_b = Simulation(data_folder_path, 'sample', headless=True, rng=rng())
+    env_b.seed(8)
+    env_b.reset()
+    policy_b = random.Random(2)
+
+    def step_b():
+        _, _, done, _ = env_b.step(policy_b.randrange(env_b.get_n_actions()))
+        if done:
+            env_b.reset()
+        random.random()
+
+    env_a.seed(7)
+    random.seed(123)
+    assert play(env_a, random.Random(1), step_b) == expected
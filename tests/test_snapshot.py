@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from RPGTurnBattle import Simulation
+
+@pytest.mark.parametrize('scenario_code', ['default', 'sample'])
+def test_snapshot_restore_replays_same_steps(data_folder_path, scenario_code):
+    env = Simulation(data_folder_path, scenario_code)
+    env.seed(1)
+    env.reset()
+    policy = random.Random(2)
+    n_actions = env.get_n_actions()
+    for _ in range(3):
+        _, _, done, _ = env.step(policy.randrange(n_actions))
+        if done:
+            env.reset()
+
+    snap = env.snapshot()
+    outcome = env.outcome
+    action_mask = env.action_mask.tolist()
+    actions = [policy.randrange(n_actions) for _ in range(30)]
+
+    def play():
+        results = []
+        for action in actions:
+            state, reward, done, message = env.step(action)
+            results.append((state.tolist(), reward, done, message, env.outcome))
+            if done:
+                break
+        return results
+
+    first = play()
+    env.restore(snap)
+    assert env.outcome == outcome
+    assert env.action_mask.tolist() == action_mask
+    assert play() == first
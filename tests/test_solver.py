@@ -0,0 +1,34 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from RPGTurnBattle import Simulation
+from battle.solver import Solver
+
+@pytest.fixture
+def tiny_data_folder_path(tmp_path, data_folder_path)->str:
+    """弱い敵だけのシナリオ(1秒以内で解ける)を持つデータフォルダ"""
+    for name in ('player.json', 'enemies.json'):
+        shutil.copy(os.path.join(data_folder_path, name), tmp_path)
+    scenarios = [{'scenario_code': 'tiny', 'player': {'lv': 3}, 'enemies': {'normal_enemies': [1, 2, 5]}}]
+    with open(os.path.join(tmp_path, 'scenarios.json'), 'w', encoding='utf-8') as f:
+        json.dump(scenarios, f)
+    return str(tmp_path)
+
+def test_solver_value_matches_monte_carlo(tiny_data_folder_path):
+    solver = Solver(tiny_data_folder_path, 'tiny').solve()
+    results = solver.results()
+    assert results['value'] == pytest.approx(16.617951, abs=1e-5)
+    assert results['death'] == pytest.approx(0.005810, abs=1e-5)
+    assert results['wins'] == pytest.approx(6.792256, abs=1e-5)
+
+    # 最適方策でプレイした報酬の平均は、厳密解と標準誤差の範囲で一致する
+    env = Simulation(tiny_data_folder_path, 'tiny', headless=True)
+    env.seed(0)
+    rewards, dead_count = solver.test(env, 2000)
+    assert abs(np.mean(rewards) - results['value']) < 4 * np.std(rewards) / np.sqrt(len(rewards))
+    assert dead_count < 40
+    assert env.headless
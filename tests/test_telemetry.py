@@ -0,0 +1,54 @@
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+
+from AIPlayer.Telemetry import PHASES, RollingStats, Telemetry
+
+RECORD_KEYS = {
+    'time', 'episode', 'steps', 'updates', 'steps_per_sec', 'updates_per_sec', 'phase_seconds', 'other_seconds',
+    'reward_mean', 'reward_std', 'loss_mean', 'loss_std', 'epsilon',
+}
+
+def test_rolling_stats_match_numpy_over_window():
+    window = 7
+    stats = RollingStats(window)
+    assert stats.mean() is None and stats.std() is None
+    rng = random.Random(0)
+    values = []
+    for _ in range(50):
+        value = rng.uniform(-20, 20)
+        values.append(value)
+        stats.add(value)
+        # 直近window個だけを集計する(O(1)で更新した値と一致する)
+        assert stats.mean() == pytest.approx(np.mean(values[-window:]))
+        assert stats.std() ** 2 == pytest.approx(np.var(values[-window:]), abs=1e-9)
+
+def test_telemetry_writes_record_every_interval(tmp_path):
+    path = os.path.join(tmp_path, 'telemetry.jsonl')
+    telemetry = Telemetry(path, interval=5, window=3)
+    for step in range(1, 24):
+        telemetry.add_time('env_step', 0.001)
+        telemetry.add_update(float(step))
+        telemetry.add_step()
+        if step % 4 == 0:
+            telemetry.add_episode(float(step), 0.5)
+        with open(path, 'r', encoding='utf-8') as f:
+            assert len(f.readlines()) == step // 5
+    # 閉じる時に残りのステップの集計を書き出す
+    telemetry.close()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [record['steps'] for record in records] == [5, 10, 15, 20, 23]
+    for record in records:
+        assert set(record) == RECORD_KEYS
+        assert set(record['phase_seconds']) == set(PHASES)
+    assert records[1]['phase_seconds']['env_step'] == pytest.approx(0.005)
+    assert records[-1]['updates'] == 23
+    assert records[-1]['episode'] == 5
+    assert records[-1]['loss_mean'] == pytest.approx(22.0)
+    assert records[-1]['reward_mean'] == pytest.approx(16.0)
+    assert records[-1]['epsilon'] == 0.5
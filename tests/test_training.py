@@ -0,0 +1,88 @@
+import AIPlayer.DQNPlayer as DQNPlayerModule
+
+def test_training_distributed_smoke(new_player, data_folder_path, monkeypatch):
+    # アクタープロセスと重みの更新回数を後から確かめられるように記録する
+    processes = []
+    values = []
+    mp_value = DQNPlayerModule.mp.Value
+
+    class RecordedProcess(DQNPlayerModule.mp.Process):
+        def start(self):
+            processes.append(self)
+            super().start()
+
+    def recorded_value(*args):
+        value = mp_value(*args)
+        values.append(value)
+        return value
+
+    monkeypatch.setattr(DQNPlayerModule.mp, 'Process', RecordedProcess)
+    monkeypatch.setattr(DQNPlayerModule.mp, 'Value', recorded_value)
+
+    player = new_player()
+    player.training_distributed(data_folder_path, 'default', n_actors=2, n_envs_per_actor=2,
+                                weight_update_interval=2, send_size=8, transitions_per_update=2, seed=0)
+
+    # アクターは終了を通知された後、正常に終了している
+    assert len(processes) == 2
+    assert all(not process.is_alive() and process.exitcode == 0 for process in processes)
+
+    # 経験は学習側の経験再生メモリに届き、終了したエピソードの数は終端の経験の数と一致する
+    memory = player.memory
+    assert len(memory) > 0
+    assert len(player.episode_rewards) >= player.num_episodes
+    assert int(memory.dones[:len(memory)].sum()) == len(player.episode_rewards)
+
+    # weight_update_interval回の更新ごとに重みを配っている
+    weights_version, n_episodes = values
+    n_updates = int(player.optimizer.state[next(player.policy_net.parameters())]['step'])
+    assert n_updates > 0
+    assert weights_version.value == n_updates // 2
+    assert n_episodes.value >= len(player.episode_rewards)
+
+def test_training_batched_pushes_every_env(new_player, data_folder_path):
+    from RPGVectorEnv import VectorSimulation
+
+    n_envs = 3
+    player = new_player()
+    steps = []
+    pushed = []
+    with VectorSimulation(n_envs, data_folder_path, 'default', seed=0) as vector_env:
+        step = vector_env.step
+
+        def recorded_step(actions):
+            observations, rewards, dones, final_observations = step(actions)
+            steps.append((observations.copy(), rewards.copy(), dones.copy(), final_observations.copy()))
+            return observations, rewards, dones, final_observations
+
+        push_batch = player.memory.push_batch
+
+        def recorded_push_batch(states, actions, next_states, rewards, next_masks, dones):
+            pushed.append((next_states.clone(), dones.clone()))
+            push_batch(states, actions, next_states, rewards, next_masks, dones)
+
+        vector_env.step = recorded_step
+        player.memory.push_batch = recorded_push_batch
+        player.training_batched(vector_env)
+
+    # 1ステップごとに環境数分の経験を記録する
+    assert len(pushed) == len(steps)
+    assert len(player.memory) == len(steps) * n_envs
+    expected_rewards = []
+    total_rewards = [0] * n_envs
+    for (observations, rewards, dones, final_observations), (next_states, pushed_dones) in zip(steps, pushed):
+        assert len(next_states) == n_envs
+        # 終了した環境は自動でresetされる前の状態を終端として記録する
+        assert pushed_dones.tolist() == dones.tolist()
+        expected_next_states = observations.copy()
+        expected_next_states[dones] = final_observations[dones]
+        assert (next_states.numpy() == expected_next_states).all()
+        for i in range(n_envs):
+            total_rewards[i] += rewards[i]
+            if dones[i]:
+                expected_rewards.append(float(total_rewards[i]))
+                total_rewards[i] = 0
+    # 終了したエピソードだけを数える
+    assert player.episode_rewards == expected_rewards
+    assert len(expected_rewards) >= player.num_episodes
+    assert int(player.memory.dones[:len(player.memory)].sum()) == len(expected_rewards)
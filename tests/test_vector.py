@@ -0,0 +1,156 @@
+import json
+import math
+import os
+import random
+import shutil
+
+import numpy as np
+import pytest
+
+from battle.battle import Battle
+from battle.vector import VectorBattle
+
+def vector_outcomes(data_folder_path:str, scenario_code:str, n:int)->dict:
+    """VectorBattleでn回戦闘し、結果の割合と平均ターン数を求める"""
+    battle = VectorBattle(data_folder_path, scenario_code, n, np.random.default_rng(0))
+    battle.reset()
+    battle.encount()
+    rng = np.random.default_rng(1)
+    turns = np.zeros(n, dtype=np.int64)
+    while battle.active.any():
+        turns += battle.active
+        battle.act_one_turn(rng.integers(0, len(battle.player_command_ids), n))
+    dead = battle.player.hp == 0
+    escape = ~dead & battle.escape
+    return {'dead': dead, 'escape': escape, 'win': ~dead & ~escape, 'turns': turns}
+
+def scalar_outcomes(data_folder_path:str, scenario_code:str, n:int)->dict:
+    """Battleでn回戦闘し、結果の割合と平均ターン数を求める"""
+    battle = Battle(data_folder_path, scenario_code, headless=True, rng=random.Random(0))
+    policy = random.Random(1)
+    n_actions = len(battle.player.commands)
+    results = {'dead': np.zeros(n, dtype=bool), 'escape': np.zeros(n, dtype=bool), 'win': np.zeros(n, dtype=bool), 'turns': np.zeros(n, dtype=np.int64)}
+    for i in range(n):
+        battle.reset()
+        battle.encount()
+        while True:
+            battle.act_one_turn(policy.randrange(n_actions))
+            results['turns'][i] += 1
+            if battle.player.hp == 0:
+                results['dead'][i] = True
+                break
+            if battle.escape:
+                results['escape'][i] = True
+                break
+            if battle.enemy.hp == 0:
+                results['win'][i] = True
+                break
+    return results
+
+@pytest.mark.parametrize('scenario_code', ['default', 'sample'])
+def test_vector_matches_scalar_battle(data_folder_path, scenario_code):
+    vector = vector_outcomes(data_folder_path, scenario_code, 40000)
+    scalar = scalar_outcomes(data_folder_path, scenario_code, 8000)
+    for key in ('dead', 'escape', 'win', 'turns'):
+        a = vector[key].astype(np.float64)
+        b = scalar[key].astype(np.float64)
+        # 平均の差が標準誤差の5倍以内(乱数の系列が異なるので分布として比べる)
+        standard_error = math.sqrt(a.var() / len(a) + b.var() / len(b))
+        assert abs(a.mean() - b.mean()) <= 5 * standard_error + 1e-9, key
+
+def one_turn_vector(data_folder_path:str, scenario_code:str, action:int, n:int)->dict:
+    """VectorBattleで遭遇直後に1ターンだけ行動し、ステータスを返す"""
+    battle = VectorBattle(data_folder_path, scenario_code, n, np.random.default_rng(action))
+    battle.reset()
+    battle.encount()
+    battle.act_one_turn(np.full(n, action))
+    return {
+        'player_hp': battle.player.hp, 'player_mp': battle.player.mp, 'player_seal': battle.player.seal_spell, 'player_sleep': battle.player.sleep,
+        'enemy_hp': battle.enemy.hp, 'enemy_mp': battle.enemy.mp, 'enemy_seal': battle.enemy.seal_spell, 'enemy_sleep': battle.enemy.sleep,
+        'escape': battle.escape, 'first_attack': battle.is_firat_attack,
+    }
+
+def one_turn_scalar(data_folder_path:str, scenario_code:str, action:int, n:int)->dict:
+    """Battleで遭遇直後に1ターンだけ行動し、ステータスを返す"""
+    battle = Battle(data_folder_path, scenario_code, headless=True, rng=random.Random(action))
+    rows = []
+    for _ in range(n):
+        battle.reset()
+        battle.encount()
+        battle.act_one_turn(action)
+        player, enemy = battle.player, battle.enemy
+        rows.append((player.hp, player.mp, player.seal_spell, player.sleep,
+                     enemy.hp, enemy.mp, enemy.seal_spell, enemy.sleep, battle.escape, battle.is_firat_attack))
+    keys = ('player_hp', 'player_mp', 'player_seal', 'player_sleep', 'enemy_hp', 'enemy_mp', 'enemy_seal', 'enemy_sleep', 'escape', 'first_attack')
+    return dict(zip(keys, np.array(rows, dtype=np.float64).T))
+
+@pytest.mark.parametrize('scenario_code', ['default', 'sample'])
+def test_vector_matches_scalar_turn(data_folder_path, scenario_code):
+    n_actions = len(Battle(data_folder_path, scenario_code).player.commands)
+    for action in range(n_actions):
+        vector = one_turn_vector(data_folder_path, scenario_code, action, 100000)
+        scalar = one_turn_scalar(data_folder_path, scenario_code, action, 20000)
+        for key, b in scalar.items():
+            a = vector[key].astype(np.float64)
+            standard_error = math.sqrt(a.var() / len(a) + b.var() / len(b))
+            assert abs(a.mean() - b.mean()) <= 5 * standard_error + 1e-9, (action, key)
+
+def test_finished_battles_do_not_act(data_folder_path):
+    battle = VectorBattle(data_folder_path, 'default', 1000, np.random.default_rng(2))
+    battle.reset()
+    battle.encount()
+    rng = np.random.default_rng(3)
+    for _ in range(50):
+        finished = ~battle.active
+        hp = (battle.player.hp[finished].copy(), battle.enemy.hp[finished].copy())
+        battle.act_one_turn(rng.integers(0, len(battle.player_command_ids), battle.n))
+        np.testing.assert_array_equal(battle.player.hp[finished], hp[0])
+        np.testing.assert_array_equal(battle.enemy.hp[finished], hp[1])
+    assert not battle.active.any()
+
+@pytest.fixture
+def wide_data_folder_path(tmp_path, data_folder_path)->str:
+    """int8のステータス・int16の表のindexに収まらないシナリオ(HP150のボス、コマンド数3～5の敵を含む10種類)を持つデータフォルダ"""
+    for name in ('player.json', 'enemies.json'):
+        shutil.copy(os.path.join(data_folder_path, name), tmp_path)
+    with open(os.path.join(tmp_path, 'enemies.json'), 'r', encoding='utf-8') as f:
+        enemies = json.load(f)
+    base = {'unit_type': 1, 'power': 20, 'guard': 20, 'speed': 12, 'max_hp': 30, 'max_mp': 20}
+    enemies += [
+        dict(base, id=16, name='ボス', max_hp=150, power=30, commands=['attack']),
+        dict(base, id=17, name='3', commands=['attack', 'fire', 'cure']),
+        dict(base, id=18, name='4', commands=['attack', 'fire', 'cure', 'magic_seal']),
+        dict(base, id=19, name='5', commands=['attack', 'fire', 'cure', 'magic_seal', 'sleep']),
+    ]
+    with open(os.path.join(tmp_path, 'enemies.json'), 'w', encoding='utf-8') as f:
+        json.dump(enemies, f, ensure_ascii=False)
+    scenarios = [{'scenario_code': 'wide', 'player': {'lv': 7}, 'enemies': {'normal_enemies': [3, 4, 5, 6, 8, 9, 16, 17, 18, 19]}}]
+    with open(os.path.join(tmp_path, 'scenarios.json'), 'w', encoding='utf-8') as f:
+        json.dump(scenarios, f)
+    return str(tmp_path)
+
+def test_narrow_types_for_shipped_data(data_folder_path):
+    for scenario_code in ('default', 'sample'):
+        battle = VectorBattle(data_folder_path, scenario_code, 10)
+        assert (battle.status_dtype, battle.index_dtype) == (np.int8, np.int16)
+
+def test_wide_types_match_scalar_battle(wide_data_folder_path):
+    battle = VectorBattle(wide_data_folder_path, 'wide', 10)
+    assert (battle.status_dtype, battle.index_dtype) == (np.int16, np.int32)
+    vector = vector_outcomes(wide_data_folder_path, 'wide', 40000)
+    scalar = scalar_outcomes(wide_data_folder_path, 'wide', 8000)
+    for key in ('dead', 'escape', 'win', 'turns'):
+        a = vector[key].astype(np.float64)
+        b = scalar[key].astype(np.float64)
+        standard_error = math.sqrt(a.var() / len(a) + b.var() / len(b))
+        assert abs(a.mean() - b.mean()) <= 5 * standard_error + 1e-9, key
+
+def test_wide_types_match_scalar_turn(wide_data_folder_path):
+    n_actions = len(Battle(wide_data_folder_path, 'wide').player.commands)
+    for action in range(n_actions):
+        vector = one_turn_vector(wide_data_folder_path, 'wide', action, 100000)
+        scalar = one_turn_scalar(wide_data_folder_path, 'wide', action, 20000)
+        for key, b in scalar.items():
+            a = vector[key].astype(np.float64)
+            standard_error = math.sqrt(a.var() / len(a) + b.var() / len(b))
+            assert abs(a.mean() - b.mean()) <= 5 * standard_error + 1e-9, (action, key)
@@ -0,0 +1,54 @@
+import multiprocessing as mp
+import random
+
+import numpy as np
+import pytest
+
+from RPGTurnBattle import Simulation
+from RPGVectorEnv import VectorSimulation
+
+N_ENVS = 4
+
+@pytest.mark.parametrize('n_workers', [0, 2])
+def test_auto_reset_keeps_final_observations(data_folder_path, n_workers):
+    # VectorSimulation.resetと同じ手順で環境ごとのシードを求め、1つずつ進めた環境と比べる
+    seeds = np.random.SeedSequence(3).spawn(1)[0].generate_state(N_ENVS).tolist()
+    envs = [Simulation(data_folder_path, 'default', headless=True) for _ in range(N_ENVS)]
+    for env, seed in zip(envs, seeds):
+        env.seed(seed)
+        env.reset()
+
+    policy = random.Random(4)
+    n_dones = 0
+    with VectorSimulation(N_ENVS, data_folder_path, 'default', n_workers=n_workers) as vector_env:
+        vector_env.reset(seed=3)
+        for _ in range(200):
+            actions = [policy.randrange(vector_env.get_n_actions()) for _ in range(N_ENVS)]
+            observations, rewards, dones, final_observations = vector_env.step(actions)
+            for i, (env, action) in enumerate(zip(envs, actions)):
+                state, reward, done, _ = env.step(action)
+                assert rewards[i] == reward
+                assert dones[i] == done
+                if done:
+                    # 終了時の状態はfinal_observationsに残り、observationsは次のエピソードの最初の状態になる
+                    np.testing.assert_array_equal(final_observations[i], state)
+                    state = env.reset()
+                    n_dones += 1
+                np.testing.assert_array_equal(observations[i], state)
+                np.testing.assert_array_equal(vector_env.action_masks[i], env.action_mask)
+    assert n_dones > 0
+
+@pytest.mark.skipif(mp.get_start_method() != 'fork', reason='ワーカーに差し替えたstepを引き継ぐためforkが必要')
+def test_worker_error_is_raised_in_parent(data_folder_path, monkeypatch):
+    step = Simulation.step
+
+    def failing_step(self, action):
+        if action == 99:
+            raise KeyError('step failed')
+        return step(self, action)
+
+    monkeypatch.setattr(Simulation, 'step', failing_step)
+    with VectorSimulation(N_ENVS, data_folder_path, 'default', n_workers=2) as vector_env:
+        vector_env.reset(seed=0)
+        with pytest.raises(RuntimeError, match="KeyError: 'step failed'"):
+            vector_env.step([0, 0, 0, 99])